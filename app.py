@@ -1,40 +1,190 @@
-from flask import Flask, request, jsonify
+import base64
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from flask import Flask, Response, request, jsonify, stream_with_context
+from sqlalchemy import func, select, tuple_
+
+# Shared vector/embedding helpers live next to the Mongo backend
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
 from models import db, Generation
-from sentence_transformers import SentenceTransformer
-import numpy as np
-from scipy.spatial.distance import cosine
+from storage import GroupCommitWriter, apply_sqlite_pragmas, engine_options
+from vector_index import VectorIndex
+from ivf_index import ivf_from_env
+from quantization import quantizer_from_env
+from embedding_snapshot import SnapshotVectorIndex, current_version, open_snapshot
+from embedding_provider import provider, warm_up_from_env
+from metrics import REGISTRY, cache_collector, instrument, stage
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# The embedding model loads on first use (or in the background, see EMBEDDING_WARMUP)
+warm_up_from_env()
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///context_intelligence.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///context_intelligence.db')
+app.config['SCORE_NORMALIZATION'] = os.getenv('SCORE_NORMALIZATION', 'minmax')  # or 'zscore'
+# SQLITE_PROFILE=concurrent: WAL journal, tuned pragmas and a sized connection pool
+app.config['SQLITE_PROFILE'] = os.getenv('SQLITE_PROFILE', 'default')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'], app.config['SQLITE_PROFILE'],
+    pool_size=int(os.getenv('DB_POOL_SIZE', '8')), max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '8')),
+    pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')))
+# GROUP_COMMIT_WINDOW_MS > 0 commits inserts and score updates from concurrent
+# requests together in one transaction (0 keeps one commit per request)
+app.config['GROUP_COMMIT_WINDOW_MS'] = float(os.getenv('GROUP_COMMIT_WINDOW_MS', '0'))
+app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.getenv('GROUP_COMMIT_MAX_BATCH', '256'))
 db.init_app(app)
 
+# Per-route latency plus GET /metrics (Prometheus text format)
+instrument(app)
+REGISTRY.register_collector(cache_collector("embedding", provider.cache))
+
+# In-memory ranking state: every stored embedding, pre-normalized, plus its score.
+# With EMBEDDING_SNAPSHOT_DIR the bulk is memory-mapped from a snapshot shared by
+# all worker processes and only rows added since live in process memory.
+app.config['EMBEDDING_SNAPSHOT_DIR'] = os.getenv('EMBEDDING_SNAPSHOT_DIR')
+app.config['EMBEDDING_SNAPSHOT_CHECK'] = float(os.getenv('EMBEDDING_SNAPSHOT_CHECK', '30'))
+
+def make_context_index():
+    if app.config['EMBEDDING_SNAPSHOT_DIR']:
+        return SnapshotVectorIndex(lambda: VectorIndex(ann=ivf_from_env(), quantizer=quantizer_from_env()))
+    return VectorIndex(ann=ivf_from_env(), quantizer=quantizer_from_env())
+
+context_index = make_context_index()
+snapshot_checked = {"at": 0.0}
+snapshot_reload = {"thread": None}
+snapshot_reload_lock = threading.Lock()
+# Rebuilds fill a fresh index while requests keep using the current one; index
+# writes made meanwhile are recorded and replayed onto it before the swap
+context_index_lock = threading.Lock()
+rebuild_lock = threading.Lock()
+index_rebuild = {"writes": None}
+
+SNAPSHOT_DELTA_CHUNK = 500
+
+def write_index(method, *args):
+    """
+    Apply an index write (add, increment_score) to the live index, and record it
+    for the index being rebuilt, if any.
+    """
+    with context_index_lock:
+        getattr(context_index, method)(*args)
+        if index_rebuild["writes"] is not None:
+            index_rebuild["writes"].append((method, args))
+
+def load_context_index(index):
+    """
+    Fill a fresh index with all stored embeddings: from the current
+    snapshot plus the embedded rows it does not hold when snapshots are
+    enabled. That is decided by id membership rather than id order, since a
+    backfill can embed old rows after the snapshot was taken.
+    """
+    query = db.session.query(Generation.id, Generation.embedding, Generation.score) \
+        .filter(Generation.embedding.isnot(None))
+    snapshot = open_snapshot(app.config['EMBEDDING_SNAPSHOT_DIR'])
+    base = snapshot.partition(None) if snapshot is not None else None
+    if base is None:
+        rows = query.all()
+    else:
+        index.load_base(*base, version=snapshot.version)
+        in_snapshot = set(base[0])
+        scored = db.session.query(Generation.id, Generation.score).filter(Generation.embedding.isnot(None)).all()
+        # Feedback may have changed scores since the snapshot was written
+        index.refresh_scores(scored)
+        missing = [row.id for row in scored if row.id not in in_snapshot]
+        rows = [row for start in range(0, len(missing), SNAPSHOT_DELTA_CHUNK)
+                for row in query.filter(Generation.id.in_(missing[start:start + SNAPSHOT_DELTA_CHUNK]))]
+    if rows:
+        index.add_many([r.id for r in rows], [r.embedding for r in rows], [r.score or 0.0 for r in rows])
+
+def build_context_index():
+    """
+    (Re)load all stored embeddings into a new in-memory index and swap it
+    in atomically; requests never see a partially loaded index.
+    """
+    global context_index
+    with rebuild_lock:
+        with context_index_lock:
+            index_rebuild["writes"] = []
+        try:
+            index = make_context_index()
+            load_context_index(index)
+            with context_index_lock:
+                for method, args in index_rebuild["writes"]:
+                    getattr(index, method)(*args)
+                context_index = index
+        finally:
+            with context_index_lock:
+                index_rebuild["writes"] = None
+
+def build_context_index_in_background():
+    with app.app_context():
+        build_context_index()
+
+def reload_snapshot_if_changed():
+    """
+    Switch to a newly published snapshot (checked every EMBEDDING_SNAPSHOT_CHECK seconds).
+    The new index is built on a background thread; requests keep ranking
+    against the current one until it is swapped in.
+    """
+    directory = app.config['EMBEDDING_SNAPSHOT_DIR']
+    now = time.monotonic()
+    if not directory or now - snapshot_checked["at"] < app.config['EMBEDDING_SNAPSHOT_CHECK'] \
+            or rebuild_lock.locked() or not snapshot_reload_lock.acquire(blocking=False):
+        return
+    try:
+        reloading = snapshot_reload["thread"]
+        if reloading is not None and reloading.is_alive():
+            return
+        snapshot_checked["at"] = now
+        if current_version(directory) != context_index.version:
+            snapshot_reload["thread"] = threading.Thread(target=build_context_index_in_background,
+                                                         name="snapshot-reload", daemon=True)
+            snapshot_reload["thread"].start()
+    finally:
+        snapshot_reload_lock.release()
+
+group_writer = None
+
+def insert_generation_row(connection, text, embedding):
+    return connection.execute(Generation.__table__.insert().values(text=text, embedding=embedding)) \
+        .inserted_primary_key[0]
+
+def add_to_score(connection, gen_id, adjust):
+    table = Generation.__table__
+    # Incremented in SQL so concurrent feedback on one row is never lost
+    connection.execute(table.update().where(table.c.id == gen_id)
+                       .values(score=func.coalesce(table.c.score, 0.0) + adjust))
+    return connection.execute(select(table.c.score).where(table.c.id == gen_id)).scalar()
+
 with app.app_context():
+    if app.config['SQLITE_PROFILE'] == 'concurrent' and db.engine.dialect.name == 'sqlite':
+        apply_sqlite_pragmas(db.engine)
+    if app.config['GROUP_COMMIT_WINDOW_MS'] > 0:
+        group_writer = GroupCommitWriter(db.engine, app.config['GROUP_COMMIT_WINDOW_MS'],
+                                         app.config['GROUP_COMMIT_MAX_BATCH'])
     db.create_all()
+    # create_all() skips indexes on tables that already exist
+    for index in Generation.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    build_context_index()
 
-def get_related_context(text, top_k=3):
-    emb = model.encode(text)
-    gens = Generation.query.filter(Generation.embedding.isnot(None)).all()
-    if not gens:
+def get_related_context(text, top_k=3, exclude_id=None, embedding=None):
+    reload_snapshot_if_changed()
+    emb = provider.encode(text) if embedding is None else embedding
+    exclude = [exclude_id] if exclude_id is not None else []
+    # Ranking = 0.7 * similarity + 0.3 * normalized score (stats kept incrementally by the index)
+    with stage("rank"):
+        ranked = context_index.rank(emb, top_k, sim_weight=0.7, score_weight=0.3,
+                                    normalization=app.config['SCORE_NORMALIZATION'], exclude=exclude)
+    if not ranked:
         return []
-    
-    # Normalize scores
-    scores = [g.score for g in gens]
-    min_score = min(scores) if scores else 0
-    max_score = max(scores) if scores else 1
-    if max_score == min_score:
-        norm_scores = [0.5] * len(scores)
-    else:
-        norm_scores = [(s - min_score) / (max_score - min_score) for s in scores]
-    
-    rankings = []
-    for i, g in enumerate(gens):
-        sim = 1 - cosine(emb, np.array(g.embedding))
-        ranking = 0.7 * sim + 0.3 * norm_scores[i]
-        rankings.append((g, ranking))
-    rankings.sort(key=lambda x: x[1], reverse=True)
-    return [{"text": g.text, "score": round(ranking, 3)} for g, ranking in rankings[:top_k]]
+    with stage("fetch_text"):
+        texts = dict(db.session.query(Generation.id, Generation.text)
+                     .filter(Generation.id.in_([gen_id for gen_id, *_ in ranked])).all())
+    return [{"text": texts[gen_id], "score": round(ranking, 3)} for gen_id, ranking, _, _ in ranked if gen_id in texts]
 
 @app.route('/generate', methods=['POST'])
 def generate():
@@ -44,15 +194,23 @@ def generate():
     generated_text = prompt + " generated content."
     
     # Generate embedding
-    emb = model.encode(generated_text).tolist()
+    with stage("encode"):
+        emb = provider.encode(generated_text)
     
     # Save to DB
-    gen = Generation(text=generated_text, embedding=emb)
-    db.session.add(gen)
-    db.session.commit()
+    with stage("insert"):
+        if group_writer is not None:
+            gen_id = group_writer.execute(insert_generation_row, generated_text, emb)
+        else:
+            gen = Generation(text=generated_text, embedding=emb)
+            db.session.add(gen)
+            db.session.commit()
+            gen_id = gen.id
+    with stage("index_add"):
+        write_index("add", gen_id, emb, 0.0)
     
-    # Get related context
-    related_context = get_related_context(generated_text, 3)
+    # Get related context (excluding the generation just stored)
+    related_context = get_related_context(generated_text, 3, exclude_id=gen_id, embedding=emb)
     
     return jsonify({"generated_text": generated_text, "related_context": related_context})
 
@@ -65,6 +223,7 @@ def feedback():
     gen = Generation.query.get(gen_id)
     if not gen:
         return jsonify({"error": "Generation not found"}), 404
+    gen_id = gen.id
     
     # Parse command
     if command.startswith('+'):
@@ -74,16 +233,80 @@ def feedback():
     else:
         return jsonify({"error": "Invalid command"}), 400
     
-    gen.score += adjust
-    db.session.commit()
+    with stage("update_score"):
+        if group_writer is not None:
+            # Hand the pooled connection back before blocking on the writer
+            db.session.close()
+            new_score = group_writer.execute(add_to_score, gen_id, adjust)
+        else:
+            gen.score += adjust
+            db.session.commit()
+            new_score = gen.score
+    # Relative, like add_to_score: batched commits may finish in any order
+    write_index("increment_score", gen_id, adjust)
     
-    return jsonify({"message": "Feedback applied", "new_score": gen.score})
+    return jsonify({"message": "Feedback applied", "new_score": new_score})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = provider.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+# History rows never include the embedding column
+HISTORY_COLUMNS = (Generation.id, Generation.text, Generation.score, Generation.created_at)
+MAX_HISTORY_LIMIT = 1000
+
+def encode_cursor(created_at, gen_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), gen_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    created_at, gen_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), int(gen_id)
+
+def history_row(row):
+    return {"id": row.id, "text": row.text, "score": row.score, "created_at": row.created_at.isoformat()}
+
+def history_query(after=None, limit=None):
+    query = db.session.query(*HISTORY_COLUMNS) \
+        .order_by(Generation.created_at.desc(), Generation.id.desc())
+    if after:
+        query = query.filter(tuple_(Generation.created_at, Generation.id) < after)
+    if limit:
+        query = query.limit(limit)
+    return query
 
 @app.route('/history', methods=['GET'])
 def history():
-    gens = Generation.query.order_by(Generation.created_at.desc()).all()
-    result = [{"id": g.id, "text": g.text, "score": g.score, "created_at": g.created_at.isoformat()} for g in gens]
-    return jsonify(result)
+    """
+    GET /history                      -> every generation (newest first)
+    GET /history?limit=N&after=CURSOR -> {"items": [...], "next_cursor": ...}
+    GET /history?format=ndjson        -> one JSON row per line, streamed
+    """
+    try:
+        limit = request.args.get('limit', type=int)
+        after = decode_cursor(request.args['after']) if request.args.get('after') else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    if limit is not None:
+        limit = min(limit, MAX_HISTORY_LIMIT)
+
+    if request.args.get('format') == 'ndjson':
+        query = history_query(after, limit).execution_options(yield_per=500)
+
+        def rows():
+            for row in query:
+                yield json.dumps(history_row(row)) + "\n"
+        return Response(stream_with_context(rows()), mimetype='application/x-ndjson')
+
+    rows = history_query(after, limit).all()
+    items = [history_row(row) for row in rows]
+    if limit is None and after is None:
+        return jsonify(items)
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if limit and len(rows) == limit else None
+    return jsonify({"items": items, "next_cursor": next_cursor})
 
 if __name__ == '__main__':
+    provider.warm_up()
     app.run(debug=True)
\ No newline at end of file
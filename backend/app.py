@@ -1,17 +1,59 @@
 from flask import Flask, request, jsonify
 import json
+import math
 from datetime import datetime
-from db_utils import insert_generation, get_latest, update_feedback
+from db_utils import insert_generation, insert_generations, get_latest, get_history, update_feedback, update_feedback_batch, compact_feedback_log, ensure_indexes
 from prompts import story_prompt, ad_script_prompt, podcast_script_prompt
-from embeddings_utils import generate_embedding, store_embedding, find_similar_generations
+from embeddings_utils import generate_embedding, store_embedding, find_similar_generations, find_similar_generations_batch, get_embedding, context_index
+from embedding_codec import to_bson
+from embedding_provider import provider, warm_up_from_env
+from jobs import JobQueue, PeriodicTask, DONE, FAILED
+from metrics import COALESCED_REQUESTS, REGISTRY, cache_collector, instrument, stage
+from mongo_client import mongo
+from request_cache import SingleFlight, request_key, result_cache_from_env
 import os
 
 app = Flask(__name__)   # <-- Flask app created here
 
+# Per-route latency plus GET /metrics (Prometheus text format)
+instrument(app)
+REGISTRY.register_collector(cache_collector("embedding", provider.cache))
+
+# Opt-in, as both return one generation to several requests: GENERATE_SINGLE_FLIGHT=1
+# makes identical concurrent /generate requests share one computation, and
+# GENERATE_CACHE_TTL > 0 reuses the result for that many seconds
+generate_flights = SingleFlight() if os.getenv("GENERATE_SINGLE_FLIGHT", "0").lower() in ("1", "true", "on") else None
+generate_cache = result_cache_from_env()
+REGISTRY.register_collector(cache_collector("generate", generate_cache))
+
+# The embedding model loads on first use (or in the background, see EMBEDDING_WARMUP)
+warm_up_from_env()
+
+# Indexes used by the history/similarity queries, created once Mongo is first reached
+mongo.on_connect(ensure_indexes)
+
+# Background workers for embedding + similarity when /generate runs asynchronously
+context_jobs = JobQueue(workers=int(os.getenv("CONTEXT_WORKERS", "2")))
+
+# Fold old feedback events into per-generation aggregates (0 disables)
+FEEDBACK_COMPACT_INTERVAL = float(os.getenv("FEEDBACK_COMPACT_INTERVAL", "3600"))
+if FEEDBACK_COMPACT_INTERVAL > 0:
+    feedback_compactor = PeriodicTask(FEEDBACK_COMPACT_INTERVAL, compact_feedback_log,
+                                      older_than_seconds=int(os.getenv("FEEDBACK_RETENTION_SECONDS", "86400"))).start()
+
 @app.route('/')
 def home():
     return "✅ CreatorCore Context Intelligence Backend is running successfully!"
 
+@app.route('/ready')
+def ready():
+    """
+    GET /ready
+    Readiness probe: 200 once the embedding model is loaded, 503 before.
+    """
+    status = provider.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
 
 # Load schema
 with open('backend/utils/schema.json', 'r') as f:
@@ -38,12 +80,99 @@ def mock_generate_with_gemini(prompt_template, topic, goal):
         "tokens_used": len(output.split()) * 2  # Mock token count
     }
 
+PROMPTS = {'story': story_prompt, 'ad': ad_script_prompt, 'podcast': podcast_script_prompt}
+INVALID_TYPE_ERROR = "Invalid type. Use 'story', 'ad', or 'podcast'"
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "100"))
+
+def embed_generation(generation_id, output_text, topic, gen_type=None):
+    """
+    Embed a stored generation and save the embedding.
+    """
+    with stage("generate_embedding"):
+        embedding = generate_embedding(output_text)
+    with stage("store_embedding"):
+        store_embedding(generation_id, embedding, topic, gen_type)
+    return embedding
+
+def related_context_for(embedding, topic):
+    # Find related context (top-3 similar generations)
+    with stage("find_similar_generations"):
+        return find_similar_generations(embedding, topic=topic, top_k=3, score_weight=0.1)
+
+def build_related_context(generation_id, output_text, topic, gen_type=None):
+    """
+    Embed a stored generation, save the embedding and find related context.
+    """
+    return related_context_for(embed_generation(generation_id, output_text, topic, gen_type), topic)
+
+def create_generation(prompt, topic, goal, gen_type):
+    """
+    Generate content (mocked) and log it; returns (generation_id, result).
+    """
+    with stage("mock_generate_with_gemini"):
+        result = mock_generate_with_gemini(prompt, topic, goal)
+
+    # Prepare data for logging
+    log_data = {
+        "topic": topic,
+        "goal": goal,
+        "type": gen_type,
+        "output_text": result["output_text"],
+        "tokens_used": result["tokens_used"]
+    }
+
+    # Insert into database
+    with stage("insert_generation"):
+        generation_id = insert_generation(log_data)
+    return generation_id, result
+
+def generate_with_context(prompt, topic, goal, gen_type):
+    """
+    Synchronous /generate: returns (response, embedding).
+    """
+    generation_id, result = create_generation(prompt, topic, goal, gen_type)
+    embedding = embed_generation(generation_id, result["output_text"], topic, gen_type)
+    response = {
+        "id": generation_id,
+        "topic": topic,
+        "output_text": result["output_text"],
+        "tokens_used": result["tokens_used"],
+        "related_context": related_context_for(embedding, topic)
+    }
+    return response, embedding
+
+def generate_cached(key, prompt, topic, goal, gen_type):
+    """
+    generate_with_context through the result cache. A cached response
+    invalidated by feedback since is re-ranked from its stored embedding
+    instead of being generated again.
+    """
+    if generate_cache is None:
+        return generate_with_context(prompt, topic, goal, gen_type)[0]
+    epoch = generate_cache.epoch
+    cached = generate_cache.get(key)
+    if cached is None:
+        response, embedding = generate_with_context(prompt, topic, goal, gen_type)
+        generate_cache.put(key, (response, embedding), epoch)
+        return response
+    (response, embedding), stale = cached
+    if stale:
+        response = dict(response, related_context=related_context_for(embedding, topic))
+        generate_cache.refresh(key, (response, embedding), epoch)
+    return response
+
 @app.route('/generate', methods=['POST'])
 def generate():
     """
     POST /generate
     Triggers Gemini prompt (mocked) and logs the generation.
-    Expected JSON: {"topic": "string", "goal": "string", "type": "story|ad|podcast"}
+    Expected JSON: {"topic": "string", "goal": "string", "type": "story|ad|podcast", "async": false}
+    With "async": true (or ?async=1) the generation is persisted and returned
+    immediately (202); embedding and related context are computed in the
+    background and served by GET /generate/<id>/context.
+    Concurrent identical synchronous requests (same normalized topic, goal
+    and type) share one generation, and with GENERATE_CACHE_TTL so do
+    repeats within the TTL.
     """
     data = request.get_json()
     if not data or 'topic' not in data or 'goal' not in data:
@@ -54,43 +183,126 @@ def generate():
     gen_type = data.get('type', 'story')  # Default to story
 
     # Select prompt template
-    if gen_type == 'story':
-        prompt = story_prompt
-    elif gen_type == 'ad':
-        prompt = ad_script_prompt
-    elif gen_type == 'podcast':
-        prompt = podcast_script_prompt
-    else:
-        return jsonify({"error": "Invalid type. Use 'story', 'ad', or 'podcast'"}), 400
+    prompt = PROMPTS.get(gen_type)
+    if prompt is None:
+        return jsonify({"error": INVALID_TYPE_ERROR}), 400
 
-    # Generate content (mocked)
-    result = mock_generate_with_gemini(prompt, topic, goal)
+    run_async = data.get('async', request.args.get('async', '').lower() in ('1', 'true'))
+    if run_async:
+        generation_id, result = create_generation(prompt, topic, goal, gen_type)
+        context_jobs.submit(generation_id, build_related_context, generation_id, result["output_text"], topic,
+                            gen_type)
+        return jsonify({
+            "id": generation_id,
+            "topic": topic,
+            "output_text": result["output_text"],
+            "tokens_used": result["tokens_used"],
+            "status": "pending",
+            "context_url": f"/generate/{generation_id}/context"
+        }), 202
 
-    # Prepare data for logging
-    log_data = {
-        "topic": topic,
-        "goal": goal,
-        "output_text": result["output_text"],
-        "tokens_used": result["tokens_used"]
-    }
+    # Generate, store the embedding and find related context; identical requests in
+    # flight (or cached) share one result
+    key = request_key(topic, goal, gen_type)
+    if generate_flights is None:
+        return jsonify(generate_cached(key, prompt, topic, goal, gen_type))
+    response, shared = generate_flights.do(key, generate_cached, key, prompt, topic, goal, gen_type)
+    if shared:
+        COALESCED_REQUESTS.inc(endpoint="/generate")
+    return jsonify(response)
 
-    # Insert into database
-    generation_id = insert_generation(log_data)
+@app.route('/generate/batch', methods=['POST'])
+def generate_batch():
+    """
+    POST /generate/batch
+    Generates many items in one call: one batched embedding pass, one
+    insert_many (embeddings included) and one similarity scan for all items.
+    Expected JSON: {"items": [{"topic": "string", "goal": "string", "type": "story|ad|podcast"}, ...]}
+    Returns {"results": [...]} in input order; invalid items carry an "error".
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a non-empty list of items"}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"At most {MAX_BATCH_ITEMS} items per batch"}), 400
 
-    # Generate and store embedding for the output
-    embedding = generate_embedding(result["output_text"])
-    store_embedding(generation_id, embedding)
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or 'topic' not in item or 'goal' not in item:
+            results[index] = {"index": index, "error": "Missing topic or goal"}
+            continue
+        prompt = PROMPTS.get(item.get('type', 'story'))
+        if prompt is None:
+            results[index] = {"index": index, "error": INVALID_TYPE_ERROR}
+            continue
+        generated = mock_generate_with_gemini(prompt, item['topic'], item['goal'])
+        valid.append((index, item, generated))
 
-    # Find related context (top-3 similar generations)
-    related_context = find_similar_generations(embedding, topic=topic, top_k=3, score_weight=0.1)
+    if valid:
+        with stage("batch_generate_embedding"):
+            embeddings = provider.encode_many([generated["output_text"] for _, _, generated in valid])
+        embedded_at = datetime.utcnow().isoformat() + "Z"
+        docs = [{
+            "topic": item['topic'],
+            "goal": item['goal'],
+            "type": item.get('type', 'story'),
+            "output_text": generated["output_text"],
+            "tokens_used": generated["tokens_used"],
+            "embedding": to_bson(embedding),
+            "embedding_updated": embedded_at
+        } for (_, item, generated), embedding in zip(valid, embeddings)]
+        with stage("batch_insert_generations"):
+            generation_ids = insert_generations(docs)
+        for doc, generation_id, embedding in zip(docs, generation_ids, embeddings):
+            context_index.add((doc["topic"], doc["type"]), generation_id, embedding)
+        with stage("batch_find_similar_generations"):
+            related = find_similar_generations_batch(embeddings, topics=[item['topic'] for _, item, _ in valid],
+                                                     top_k=3, score_weight=0.1)
+        for (index, item, generated), generation_id, related_context in zip(valid, generation_ids, related):
+            results[index] = {
+                "index": index,
+                "id": generation_id,
+                "topic": item['topic'],
+                "output_text": generated["output_text"],
+                "tokens_used": generated["tokens_used"],
+                "related_context": related_context
+            }
 
-    return jsonify({
-        "id": generation_id,
-        "topic": topic,
-        "output_text": result["output_text"],
-        "tokens_used": result["tokens_used"],
-        "related_context": related_context
-    })
+    return jsonify({"results": results})
+
+MAX_CONTEXT_WAIT = 30.0
+
+@app.route('/generate/<generation_id>/context', methods=['GET'])
+def generation_context(generation_id):
+    """
+    GET /generate/<id>/context?wait=<seconds>
+    Related context for an asynchronous generation. Long-polls up to
+    `wait` seconds (clamped to 0-30) while the background job is pending.
+    """
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    if not math.isfinite(wait):
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    wait = min(max(wait, 0.0), MAX_CONTEXT_WAIT)
+    job = context_jobs.wait(generation_id, timeout=wait)
+
+    if job is None:
+        # Not tracked by this process (restart, other worker): use the stored embedding
+        doc = get_embedding(generation_id)
+        if doc is None:
+            return jsonify({"error": "No context available for this generation"}), 404
+        embedding, topic = doc
+        related_context = find_similar_generations(embedding, topic=topic, top_k=3, score_weight=0.1)
+        return jsonify({"id": generation_id, "status": DONE, "related_context": related_context})
+    if job["status"] == DONE:
+        return jsonify({"id": generation_id, "status": DONE, "related_context": job["result"]})
+    if job["status"] == FAILED:
+        return jsonify({"id": generation_id, "status": FAILED, "error": job["error"]}), 500
+    return jsonify({"id": generation_id, "status": job["status"]}), 202
 
 @app.route('/feedback', methods=['POST'])
 def feedback():
@@ -106,25 +318,76 @@ def feedback():
     generation_id = data['id']
     feedback_text = data['feedback']
 
-    success = update_feedback(generation_id, feedback_text)
+    with stage("update_feedback"):
+        result = update_feedback(generation_id, feedback_text)
 
-    if success:
+    if result:
+        context_index.increment_score(generation_id, result["score_change"])
+        if generate_cache is not None and result["score_change"]:
+            # Scores are ranking inputs: cached related context must be re-ranked
+            generate_cache.invalidate()
         return jsonify({"message": "Feedback updated successfully"})
     else:
         return jsonify({"error": "Failed to update feedback"}), 500
 
+@app.route('/feedback/batch', methods=['POST'])
+def feedback_batch():
+    """
+    POST /feedback/batch
+    Applies many feedback events in one bulk write.
+    Expected JSON: {"items": [{"id": "string", "feedback": "string"}, ...]}
+    Returns {"results": [...]} in input order; unknown ids carry an "error".
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return jsonify({"error": "Expected a non-empty list of {id, feedback} items"}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"At most {MAX_BATCH_ITEMS} items per batch"}), 400
+
+    results = update_feedback_batch(items)
+    for result in results:
+        if "score_change" in result:
+            context_index.increment_score(result["id"], result["score_change"])
+    if generate_cache is not None and any(result.get("score_change") for result in results):
+        generate_cache.invalidate()
+    return jsonify({"results": results})
+
+HISTORY_PARAMS = ('limit', 'since', 'until', 'min_iteration', 'max_iteration', 'fields')
+MAX_HISTORY_LIMIT = 500
+
 @app.route('/history/<topic>', methods=['GET'])
 def history(topic):
     """
     GET /history/<topic>
     Fetches past generations for a topic.
+    Without query parameters returns the latest generation. With any of
+    limit, since, until (ISO-8601), min_iteration, max_iteration or fields
+    (comma-separated projection) returns {"topic", "count", "items"},
+    newest first. Embeddings are omitted unless listed in fields.
     """
-    latest = get_latest(topic)
-    if latest:
-        return jsonify(latest)
-    else:
-        return jsonify({"error": "No generations found for this topic"}), 404
-    
+    if not any(param in request.args for param in HISTORY_PARAMS):
+        latest = get_latest(topic)
+        if latest:
+            return jsonify(latest)
+        else:
+            return jsonify({"error": "No generations found for this topic"}), 404
+
+    try:
+        limit = min(int(request.args.get('limit', 20)), MAX_HISTORY_LIMIT)
+        min_iteration = request.args.get('min_iteration', type=int)
+        max_iteration = request.args.get('max_iteration', type=int)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+
+    items = get_history(topic, limit=limit, since=request.args.get('since'), until=request.args.get('until'),
+                        min_iteration=min_iteration, max_iteration=max_iteration, fields=fields)
+    return jsonify({"topic": topic, "count": len(items), "items": items})
+
 if __name__ == '__main__':
+    provider.warm_up()
     app.run(host='0.0.0.0', port=5001, debug=True)
 
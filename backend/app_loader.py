@@ -0,0 +1,21 @@
+import importlib.util
+import os
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_backend_app():
+    """
+    Import backend/app.py as the module "backend_app" so it does not clash
+    with the root app module. It runs from the repository root, its
+    working directory when served, so relative paths resolve the same.
+    """
+    spec = importlib.util.spec_from_file_location("backend_app", os.path.join(BACKEND_DIR, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(BACKEND_DIR))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
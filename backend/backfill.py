@@ -0,0 +1,155 @@
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from embedding_backends import BACKEND, load_backend
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+
+def batched(iterable, size: int):
+    """
+    Yield lists of up to `size` items from any iterable (e.g. a DB cursor).
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Checkpoint:
+    """
+    JSON file recording the last processed id so an interrupted backfill
+    can resume after it. A path of None disables checkpointing. The file
+    also records its source (e.g. "mongo" or "sqlite") and refuses to
+    resume a different source's backfill, whose ids mean something else.
+    """
+
+    def __init__(self, path: str = None, source: str = None):
+        self.path = path
+        self.source = source
+        self.last_id = None
+        self.processed = 0
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                state = json.load(f)
+            recorded = state.get("source")
+            if source and recorded and recorded != source:
+                raise ValueError(f"Checkpoint {path} belongs to a {recorded} backfill, not {source}")
+            self.last_id = state.get("last_id")
+            self.processed = state.get("processed", 0)
+
+    def save(self, last_id, processed: int):
+        self.last_id = last_id
+        self.processed = processed
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"source": self.source, "last_id": last_id, "processed": processed}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ProgressReporter:
+    """
+    Prints processed count and docs/sec at most every `interval` seconds.
+    """
+
+    def __init__(self, label: str = "backfill", interval: float = 5.0, stream=None):
+        self.label = label
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self.count = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def update(self, n: int):
+        self.count += n
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            print(f"[{self.label}] {self.count} docs, {self.rate:.1f} docs/sec", file=self.stream, flush=True)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"[{self.label}] done: {self.count} docs in {elapsed:.1f}s ({self.rate:.1f} docs/sec)",
+              file=self.stream, flush=True)
+
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str):
+    global _worker_model
+    # Same backend as the serving process, so backfilled vectors match live ones
+    _worker_model = load_backend(model_name, backend)
+
+
+def _encode_in_worker(texts, encode_batch_size: int):
+    return _worker_model.encode(texts, batch_size=encode_batch_size)
+
+
+def encode_batches(batches, encode, encode_batch_size: int = 64, workers: int = 0, model_name: str = DEFAULT_MODEL,
+                   backend: str = None):
+    """
+    Yield (batch, embeddings) for each batch of (id, text) pairs, in order.
+    With workers > 0 batches are encoded in a spawned process pool (one
+    model per process, loaded through the EMBEDDING_BACKEND factory) with a
+    bounded number of batches in flight; otherwise
+    `encode(texts, batch_size=...)` runs in-process.
+    """
+    if workers <= 0:
+        for batch in batches:
+            yield batch, encode([text for _, text in batch], batch_size=encode_batch_size)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(model_name, backend or BACKEND)) as pool:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append((batch, pool.submit(_encode_in_worker, [text for _, text in batch], encode_batch_size)))
+            if len(in_flight) >= workers * 2:
+                done, future = in_flight.popleft()
+                yield done, future.result()
+        while in_flight:
+            done, future = in_flight.popleft()
+            yield done, future.result()
+
+
+def run_backfill(docs, encode, write, batch_size: int = 256, encode_batch_size: int = 64, workers: int = 0,
+                 checkpoint: Checkpoint = None, label: str = "backfill", model_name: str = DEFAULT_MODEL,
+                 backend: str = None):
+    """
+    Stream (id, text) pairs from `docs`, encode them batch by batch and hand
+    each batch to `write(ids, embeddings)` (one bulk write / transaction).
+    The checkpoint is advanced after every successful write.
+    Returns the number of documents embedded in this run.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    progress = ProgressReporter(label)
+    processed = checkpoint.processed
+    for batch, embeddings in encode_batches(batched(docs, batch_size), encode, encode_batch_size, workers,
+                                            model_name, backend):
+        write([doc_id for doc_id, _ in batch], embeddings)
+        processed += len(batch)
+        checkpoint.save(batch[-1][0], processed)
+        progress.update(len(batch))
+    progress.finish()
+    return progress.count
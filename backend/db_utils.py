@@ -1,33 +1,82 @@
-import os
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
 from datetime import datetime
-import json
-
-# MongoDB Atlas connection (placeholder - replace with actual URI after setup)
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")  # Local fallback for testing
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)  # Shorter timeout
-    db = client["creatorcore"]
-    # Test connection
-    client.admin.command('ping')
-except Exception as e:
-    print(f"Failed to connect to MongoDB: {e}")
-    print("Using mock mode for testing.")
-    client = None
-    db = None
-
-# Collections
-if db is not None:
-    generations_collection = db["generations"]
-    feedback_loops_collection = db["feedback_loops"]
-else:
-    generations_collection = None
-    feedback_loops_collection = None
+from embedding_codec import decode_embedding
+from feedback_scoring import scorer_from_env
+from mongo_client import mongo
+
+# Every helper goes through the shared, lazily-connected client in
+# mongo_client; mongo.database() is None in mock mode.
+
+# Compiled once; FEEDBACK_LEXICON_PATH swaps in a custom weighted lexicon
+feedback_scorer = scorer_from_env()
+
+# Fields left out of history responses unless explicitly requested
+HISTORY_EXCLUDED_FIELDS = ("embedding",)
+
+def ensure_indexes():
+    """
+    Create the indexes the query helpers rely on (idempotent).
+    """
+    db = mongo.database()
+    if db is None:
+        return
+    db["generations"].create_index([("topic", ASCENDING), ("timestamp", DESCENDING)], name="topic_timestamp")
+    db["feedback_loops"].create_index([("timestamp", ASCENDING)], name="timestamp")
+    db["feedback_loops"].create_index([("generation_id", ASCENDING)], name="generation_id")
+    db["feedback_loops"].create_index([("compaction_id", ASCENDING)], name="compaction_id", sparse=True)
+
+def _serialize(doc: dict) -> dict:
+    # Convert ObjectId / binary embedding for JSON serialization
+    doc["_id"] = str(doc["_id"])
+    if doc.get("embedding") is not None:
+        doc["embedding"] = decode_embedding(doc["embedding"]).tolist()
+    return doc
+
+def next_iteration(topic: str, count: int = 1) -> int:
+    """
+    Atomically reserve `count` iterations for a topic and return the last
+    one (the first is result - count + 1). One round trip, no races.
+    """
+    counter = mongo.database()["counters"].find_one_and_update(
+        {"_id": topic}, {"$inc": {"seq": count}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+def seed_iteration_counters(batch_size: int = 500):
+    """
+    Migration: convert string iterations to integers and seed the per-topic
+    counters from the highest existing iteration. Safe to re-run; counters
+    never move backwards.
+    """
+    db = mongo.database()
+    if db is None:
+        print("Mock seed iteration counters")
+        return 0
+
+    ops = []
+    for doc in db["generations"].find({"iteration": {"$type": "string"}}, {"iteration": 1}):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"iteration": int(doc["iteration"])}}))
+        if len(ops) >= batch_size:
+            db["generations"].bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        db["generations"].bulk_write(ops, ordered=False)
+
+    maxima = db["generations"].aggregate([
+        {"$match": {"iteration": {"$type": "number"}}},
+        {"$group": {"_id": "$topic", "seq": {"$max": "$iteration"}}}
+    ])
+    seeds = [UpdateOne({"_id": row["_id"]}, {"$max": {"seq": row["seq"]}}, upsert=True) for row in maxima]
+    if seeds:
+        db["counters"].bulk_write(seeds, ordered=False)
+    print(f"Seeded iteration counters for {len(seeds)} topics")
+    return len(seeds)
 
 def insert_generation(data: dict):
     """
     Insert a new generation record into the generations collection.
     """
+    db = mongo.database()
     if db is None:
         print("Mock insert:", data)
         return "mock_id_123"
@@ -36,59 +85,222 @@ def insert_generation(data: dict):
         data["timestamp"] = datetime.utcnow().isoformat() + "Z"
     # Add iteration if not provided
     if "iteration" not in data:
-        # Get the latest iteration for this topic
-        latest = generations_collection.find_one({"topic": data["topic"]}, sort=[("iteration", -1)])
-        data["iteration"] = str(int(latest["iteration"]) + 1) if latest else "1"
-    result = generations_collection.insert_one(data)
+        data["iteration"] = next_iteration(data["topic"])
+    result = db["generations"].insert_one(data)
     return str(result.inserted_id)
 
+def insert_generations(docs: list):
+    """
+    Insert many generation records with one insert_many. Iterations are
+    reserved per topic in blocks (one counter update per distinct topic).
+    Returns the inserted ids as strings, in input order.
+    """
+    db = mongo.database()
+    if db is None:
+        print(f"Mock insert of {len(docs)} generations")
+        return [f"mock_id_{i}" for i in range(len(docs))]
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    needs_iteration = {}
+    for doc in docs:
+        doc.setdefault("timestamp", timestamp)
+        if "iteration" not in doc:
+            needs_iteration.setdefault(doc["topic"], []).append(doc)
+    for topic, topic_docs in needs_iteration.items():
+        last = next_iteration(topic, count=len(topic_docs))
+        for offset, doc in enumerate(topic_docs):
+            doc["iteration"] = last - len(topic_docs) + 1 + offset
+    result = db["generations"].insert_many(docs)
+    return [str(inserted_id) for inserted_id in result.inserted_ids]
+
 def get_latest(topic: str):
     """
     Get the latest generation for a given topic.
     """
+    db = mongo.database()
     if db is None:
         return {"topic": topic, "output_text": "Mock latest output", "timestamp": "2023-10-01T12:00:00Z"}
-    doc = generations_collection.find_one({"topic": topic}, sort=[("timestamp", -1)])
+    doc = db["generations"].find_one({"topic": topic}, {field: 0 for field in HISTORY_EXCLUDED_FIELDS},
+                                          sort=[("timestamp", -1)])
     if doc:
-        # Convert ObjectId to string for JSON serialization
-        doc["_id"] = str(doc["_id"])
+        doc = _serialize(doc)
     return doc
 
+def get_history(topic: str, limit: int = 20, since: str = None, until: str = None,
+                min_iteration: int = None, max_iteration: int = None, fields: list = None,
+                batch_size: int = 100):
+    """
+    Get recent generations for a topic, newest first.
+    since/until are inclusive ISO-8601 timestamp bounds, min/max_iteration an
+    inclusive iteration range. `fields` selects the returned fields; by
+    default everything except the embedding is returned.
+    Served by the (topic, timestamp) index through a batched cursor.
+    """
+    db = mongo.database()
+    if db is None:
+        return [{"topic": topic, "output_text": "Mock latest output", "timestamp": "2023-10-01T12:00:00Z"}]
+
+    query = {"topic": topic}
+    if since or until:
+        query["timestamp"] = {}
+        if since:
+            query["timestamp"]["$gte"] = since
+        if until:
+            query["timestamp"]["$lte"] = until
+    if min_iteration is not None or max_iteration is not None:
+        query["iteration"] = {}
+        if min_iteration is not None:
+            query["iteration"]["$gte"] = int(min_iteration)
+        if max_iteration is not None:
+            query["iteration"]["$lte"] = int(max_iteration)
+
+    if fields:
+        projection = {field: 1 for field in fields}
+    else:
+        projection = {field: 0 for field in HISTORY_EXCLUDED_FIELDS}
+
+    cursor = db["generations"].find(query, projection) \
+        .sort([("timestamp", DESCENDING)]).limit(limit).batch_size(min(batch_size, limit) if limit else batch_size)
+    return [_serialize(doc) for doc in cursor]
+
+def score_feedback(feedback: str) -> float:
+    """
+    Lexicon scoring: positive terms increase score, negative decrease
+    (see feedback_scoring.FeedbackScorer).
+    """
+    return feedback_scorer.score(feedback)
+
+def _object_id(id: str):
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    try:
+        return ObjectId(id)
+    except (InvalidId, TypeError):
+        return None
+
+def _feedback_event(generation_id, feedback: str, score_change: float, timestamp: str) -> dict:
+    return {"generation_id": generation_id, "feedback": feedback, "score_change": score_change, "timestamp": timestamp}
+
 def update_feedback(id: str, feedback: str):
     """
     Update the feedback for a generation by its ID and calculate feedback score.
+    The score is applied with an atomic $inc (no read-modify-write) and the
+    event is appended to the feedback_loops log.
+    Returns {"id", "score_change"}, or None if the generation does not exist.
     """
+    db = mongo.database()
     if db is None:
         print(f"Mock update feedback for {id}: {feedback}")
-        return True
+        return {"id": id, "score_change": 0.0}
 
-    # Scoring logic: positive keywords increase score, negative decrease
-    positive_keywords = ["good", "great", "excellent", "amazing", "love", "like", "perfect", "awesome"]
-    negative_keywords = ["bad", "terrible", "awful", "hate", "dislike", "poor", "worst", "horrible"]
+    generation_id = _object_id(id)
+    if generation_id is None:
+        return None
+    score_change = score_feedback(feedback)
 
-    feedback_lower = feedback.lower()
-    score_change = 0
+    result = db["generations"].update_one(
+        {"_id": generation_id},
+        {"$set": {"feedback": feedback}, "$inc": {"feedback_score": score_change}}
+    )
+    if not result.matched_count:
+        return None
+    db["feedback_loops"].insert_one(
+        _feedback_event(generation_id, feedback, score_change, datetime.utcnow().isoformat() + "Z"))
+    return {"id": id, "score_change": score_change}
 
-    for word in positive_keywords:
-        if word in feedback_lower:
-            score_change += 0.5
+def update_feedback_batch(events: list):
+    """
+    Apply many {"id", "feedback"} events: one lookup for existence, one
+    bulk_write of $inc updates and one insert_many into the feedback log.
+    Returns a per-event list of {"id", "score_change"} or {"id", "error"}.
+    """
+    db = mongo.database()
+    if db is None:
+        print(f"Mock update feedback for {len(events)} events")
+        return [{"id": event.get("id"), "score_change": 0.0} for event in events]
 
-    for word in negative_keywords:
-        if word in feedback_lower:
-            score_change -= 0.5
+    parsed = [(event.get("id"), _object_id(event.get("id")), event.get("feedback")) for event in events]
+    known = {doc["_id"] for doc in db["generations"].find(
+        {"_id": {"$in": [oid for _, oid, _ in parsed if oid is not None]}}, {"_id": 1})}
 
-    from bson import ObjectId
-    # Get current score
-    doc = generations_collection.find_one({"_id": ObjectId(id)})
-    current_score = doc.get("feedback_score", 0.0) if doc else 0.0
+    valid = [feedback for _, oid, feedback in parsed if isinstance(feedback, str) and oid in known]
+    score_changes = iter(feedback_scorer.score_many(valid))
 
-    new_score = current_score + score_change
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    results, updates, log = [], [], []
+    for id, oid, feedback in parsed:
+        if not isinstance(feedback, str):
+            results.append({"id": id, "error": "Missing feedback"})
+        elif oid not in known:
+            results.append({"id": id, "error": "Generation not found"})
+        else:
+            score_change = next(score_changes)
+            updates.append(UpdateOne({"_id": oid}, {"$set": {"feedback": feedback},
+                                                    "$inc": {"feedback_score": score_change}}))
+            log.append(_feedback_event(oid, feedback, score_change, timestamp))
+            results.append({"id": id, "score_change": score_change})
+    if updates:
+        # Ordered so the last event for a generation leaves its feedback text
+        db["generations"].bulk_write(updates, ordered=True)
+        db["feedback_loops"].insert_many(log, ordered=False)
+    return results
 
-    result = generations_collection.update_one(
-        {"_id": ObjectId(id)},
-        {"$set": {"feedback": feedback, "feedback_score": new_score}}
-    )
-    return result.modified_count > 0
+def compact_feedback_log(older_than_seconds: int = 86400, batch_size: int = 1000):
+    """
+    Fold feedback events older than the cutoff into per-generation totals in
+    feedback_aggregates (count, summed score_change, latest feedback) and
+    remove them from the log, one batch at a time, so the log stays bounded.
+    Returns the number of events compacted.
+
+    Each batch is first claimed by tagging its events with a compaction_id.
+    An aggregate only takes a batch's totals if it has not recorded that id
+    yet, so a batch interrupted between folding and deleting (crash,
+    restart) is finished on the next run without being counted twice.
+    """
+    db = mongo.database()
+    if db is None:
+        return 0
+    from datetime import timedelta
+    from bson import ObjectId
+    cutoff = (datetime.utcnow() - timedelta(seconds=older_than_seconds)).isoformat() + "Z"
+
+    compacted = 0
+    while True:
+        # Finish a batch left claimed by an interrupted run before starting a new one
+        claimed = db["feedback_loops"].find_one({"compaction_id": {"$exists": True}}, {"compaction_id": 1})
+        if claimed is not None:
+            batch_id = claimed["compaction_id"]
+        else:
+            ids = [event["_id"] for event in db["feedback_loops"].find(
+                {"timestamp": {"$lt": cutoff}, "compaction_id": {"$exists": False}}, {"_id": 1})
+                .sort("timestamp", ASCENDING).limit(batch_size)]
+            if not ids:
+                return compacted
+            batch_id = ObjectId()
+            db["feedback_loops"].update_many({"_id": {"$in": ids}, "compaction_id": {"$exists": False}},
+                                             {"$set": {"compaction_id": batch_id}})
+        events = list(db["feedback_loops"].find({"compaction_id": batch_id}).sort("timestamp", ASCENDING))
+        totals = {}
+        for event in events:
+            total = totals.setdefault(event["generation_id"], {"count": 0, "score_change": 0.0})
+            total["count"] += 1
+            total["score_change"] += event.get("score_change", 0.0)
+            total["last_feedback"] = event.get("feedback")
+            total["last_timestamp"] = event["timestamp"]
+        if totals:
+            updates = []
+            for generation_id, total in totals.items():
+                updates.append(UpdateOne({"_id": generation_id},
+                                         {"$setOnInsert": {"count": 0, "score_change": 0.0}}, upsert=True))
+                updates.append(UpdateOne(
+                    {"_id": generation_id, "compactions": {"$ne": batch_id}},
+                    {"$inc": {"count": total["count"], "score_change": total["score_change"]},
+                     "$set": {"last_feedback": total["last_feedback"], "last_timestamp": total["last_timestamp"]},
+                     "$addToSet": {"compactions": batch_id}}))
+            db["feedback_aggregates"].bulk_write(updates, ordered=True)
+        db["feedback_loops"].delete_many({"compaction_id": batch_id})
+        # The marker is only needed until the events are gone
+        db["feedback_aggregates"].update_many({"compactions": batch_id}, {"$pull": {"compactions": batch_id}})
+        compacted += len(events)
 
 # Test functions with mock data
 if __name__ == "__main__":
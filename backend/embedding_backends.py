@@ -0,0 +1,157 @@
+import inspect
+import json
+import os
+
+import numpy as np
+
+BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "creatorcore", "onnx"))
+
+
+class SentenceTransformerBackend:
+    """
+    Default backend: the PyTorch SentenceTransformer model.
+    """
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        return self.model.encode(texts, batch_size=batch_size)
+
+
+def export_onnx(model_name: str, model_dir: str, quantize: bool = True):
+    """
+    Export a SentenceTransformer's transformer to ONNX (optionally with
+    dynamic int8 weight quantization) next to its tokenizer and a
+    pooling.json describing how token embeddings are pooled.
+    Needs torch + sentence-transformers once; inference then only needs
+    onnxruntime and the tokenizer.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st_model[0], st_model[1]
+    tokenizer = st_model.tokenizer
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer.save_pretrained(model_dir)
+
+    if getattr(pooling, "pooling_mode_cls_token", False):
+        mode = "cls"
+    elif getattr(pooling, "pooling_mode_mean_tokens", True):
+        mode = "mean"
+    else:
+        raise ValueError(f"Unsupported pooling for ONNX export: {pooling}")
+    with open(os.path.join(model_dir, "pooling.json"), "w") as f:
+        json.dump({
+            "mode": mode,
+            "normalize": any(type(module).__name__ == "Normalize" for module in st_model),
+            "max_seq_length": st_model.max_seq_length,
+        }, f)
+
+    sample = tokenizer(["export sample text"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(transformer.auto_model.eval()),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]},
+            opset_version=14,
+            **export_kwargs,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, os.path.join(model_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+
+
+class OnnxBackend:
+    """
+    CPU inference through onnxruntime on an exported (by default int8
+    quantized) graph. The graph is exported on first use and reused from
+    EMBEDDING_ONNX_DIR afterwards. Output matches SentenceTransformer.encode.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = True, model_dir: str = None, threads: int = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.name = "onnx-int8" if quantize else "onnx"
+        model_dir = model_dir or os.path.join(ONNX_DIR, model_name.replace("/", "__"))
+        model_path = os.path.join(model_dir, "model_int8.onnx" if quantize else "model.onnx")
+        if not os.path.exists(model_path):
+            export_onnx(model_name, model_dir, quantize=quantize)
+
+        with open(os.path.join(model_dir, "pooling.json"), "r") as f:
+            pooling = json.load(f)
+        self.pooling_mode = pooling["mode"]
+        self.normalize = pooling["normalize"]
+        self.max_seq_length = pooling["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _encode_batch(self, texts):
+        features = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                                  return_tensors="np")
+        feed = {name: features[name].astype(np.int64) for name in self.input_names}
+        token_embeddings = self.session.run(None, feed)[0]
+        if self.pooling_mode == "cls":
+            pooled = token_embeddings[:, 0]
+        else:
+            mask = features["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # Group similar lengths to minimise padding, then restore input order
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        batches = [self._encode_batch([texts[i] for i in order[start:start + batch_size]])
+                   for start in range(0, len(texts), batch_size)]
+        embeddings = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(batches)
+        return embeddings[0] if single else embeddings
+
+
+BACKENDS = {
+    "torch": SentenceTransformerBackend,
+    "onnx": lambda model_name: OnnxBackend(model_name, quantize=False),
+    "onnx-int8": lambda model_name: OnnxBackend(model_name, quantize=True),
+}
+
+
+def load_backend(model_name: str, backend: str = None):
+    """
+    Instantiate the configured embedding backend (EMBEDDING_BACKEND).
+    """
+    backend = backend or BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Use one of: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](model_name)
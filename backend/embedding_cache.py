@@ -0,0 +1,132 @@
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form used for cache keys: NFC, trimmed, single-spaced.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, model_name: str) -> str:
+    return hashlib.sha1(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of embeddings keyed by model (name and backend, see
+    EmbeddingProvider.cache_namespace) + normalized text.
+    Evicts least recently used entries past max_entries or max_bytes and can
+    be persisted to an .npz file across restarts.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, path: str = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, text: str, model_name: str):
+        key = cache_key(text, model_name)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, text: str, model_name: str, vector):
+        self._put(cache_key(text, model_name), vector)
+
+    def _put(self, key: str, vector):
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = vector
+            self.nbytes += vector.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self.nbytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def get_or_compute(self, text: str, model_name: str, compute):
+        """
+        Return the cached embedding, or compute(text), cache and return it.
+        """
+        vector = self.get(text, model_name)
+        if vector is None:
+            vector = np.asarray(compute(text), dtype=np.float32)
+            self.put(text, model_name, vector)
+        return vector
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def save(self, path: str = None):
+        """
+        Write the cache (in LRU order) to an .npz file.
+        """
+        path = path or self.path
+        with self._lock:
+            keys = list(self._entries)
+            vectors = list(self._entries.values())
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, keys=np.array(keys, dtype="U40"),
+                 vectors=np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str = None):
+        path = path or self.path
+        with np.load(path) as data:
+            for key, vector in zip(data["keys"], data["vectors"]):
+                self._put(str(key), vector)
+
+
+def cache_from_env() -> EmbeddingCache:
+    """
+    Build a cache from EMBEDDING_CACHE_ENTRIES / EMBEDDING_CACHE_BYTES /
+    EMBEDDING_CACHE_PATH; with a path the cache is saved again at exit.
+    """
+    cache = EmbeddingCache(
+        max_entries=int(os.getenv("EMBEDDING_CACHE_ENTRIES", "10000")),
+        max_bytes=int(os.getenv("EMBEDDING_CACHE_BYTES", str(64 * 1024 * 1024))),
+        path=os.getenv("EMBEDDING_CACHE_PATH"),
+    )
+    if cache.path:
+        import atexit
+        atexit.register(cache.save)
+    return cache
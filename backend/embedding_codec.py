@@ -0,0 +1,50 @@
+import json
+import struct
+
+import numpy as np
+
+# Binary layout: b"EV" magic, format version, dtype code, uint32 dimension,
+# then the raw little-endian vector. The 8-byte header keeps float32
+# payloads aligned so readers can view them with np.frombuffer.
+HEADER = struct.Struct("<2sBBI")
+MAGIC = b"EV"
+VERSION = 1
+DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+DTYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+
+def encode_embedding(vector, dtype="float32") -> bytes:
+    """
+    Serialize a vector into the compact binary embedding format.
+    """
+    dtype = np.dtype(dtype).newbyteorder("<")
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    array = np.ascontiguousarray(vector, dtype=dtype).reshape(-1)
+    return HEADER.pack(MAGIC, VERSION, DTYPE_CODES[dtype], array.size) + array.tobytes()
+
+
+def decode_embedding(value):
+    """
+    Decode a stored embedding into a NumPy vector.
+    Binary values are viewed in place with np.frombuffer (read-only, no copy);
+    legacy JSON lists or JSON text are converted to float32.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        magic, version, code, dim = HEADER.unpack_from(value)
+        if magic != MAGIC or version != VERSION or code not in DTYPES:
+            raise ValueError("Not a binary embedding")
+        return np.frombuffer(value, dtype=DTYPES[code], count=dim, offset=HEADER.size)
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def to_bson(vector):
+    """
+    Wrap an encoded embedding as BSON Binary for MongoDB.
+    """
+    from bson.binary import Binary
+    return Binary(encode_embedding(vector))
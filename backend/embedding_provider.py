@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import cache_from_env
+from embedding_backends import BACKEND, load_backend
+from embedding_scheduler import EmbeddingScheduler
+
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+
+class EmbeddingProvider:
+    """
+    Shared, lazily-loaded embedding model. The model is loaded on first use
+    (or by warm_up) exactly once, and single-text lookups go through the
+    embedding cache, keyed by model name and backend so vectors from one
+    backend (e.g. torch) are never served to another (e.g. onnx-int8).
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, cache=None, loader=None, backend: str = None):
+        self.model_name = model_name
+        self.backend = backend or BACKEND
+        self.cache_namespace = f"{model_name}@{self.backend}"
+        self.cache = cache
+        self._loader = loader or (lambda name: load_backend(name, self.backend))
+        self._model = None
+        self._error = None
+        self._load_seconds = None
+        self._warmup_thread = None
+        self._lock = threading.Lock()
+        self.scheduler = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    try:
+                        self._model = self._loader(self.model_name)
+                    except Exception as e:
+                        self._error = e
+                        raise
+                    self._error = None
+                    self._load_seconds = time.perf_counter() - started
+        return self._model
+
+    def is_ready(self) -> bool:
+        return self._model is not None
+
+    def warm_up(self, background: bool = True):
+        """
+        Load the model now, or in a daemon thread when background is True.
+        """
+        if self._model is not None:
+            return None
+        if not background:
+            self.model
+            return None
+        if self._warmup_thread is None or not self._warmup_thread.is_alive():
+            self._warmup_thread = threading.Thread(target=self._warm_up_quietly, name="embedding-warmup", daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    def _warm_up_quietly(self):
+        try:
+            self.model
+        except Exception as e:
+            print(f"Embedding model warm-up failed: {e}")
+
+    def status(self) -> dict:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "ready": self.is_ready(),
+            "loading": self._warmup_thread is not None and self._warmup_thread.is_alive(),
+            "load_seconds": self._load_seconds,
+            "error": str(self._error) if self._error else None,
+        }
+
+    def enable_batching(self, window_ms: float = 2.0, max_batch: int = 32):
+        """
+        Route single-text encodes through a micro-batching scheduler so
+        concurrent requests share one batched model call.
+        """
+        if self.scheduler is not None:
+            self.scheduler.close()
+        self.scheduler = EmbeddingScheduler(self.encode_batch, window_ms=window_ms, max_batch=max_batch)
+        return self.scheduler
+
+    def disable_batching(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
+            self.scheduler = None
+
+    def _encode_uncached(self, text: str):
+        if self.scheduler is not None:
+            return self.scheduler.encode(text)
+        return np.asarray(self.model.encode(text), dtype=np.float32)
+
+    def encode(self, text: str):
+        """
+        Embed a single text as a float32 vector, served from the cache when possible.
+        """
+        if self.cache is None:
+            return self._encode_uncached(text)
+        return self.cache.get_or_compute(text, self.cache_namespace, self._encode_uncached)
+
+    def encode_many(self, texts, batch_size: int = 64):
+        """
+        Embed many texts: cache hits are reused, all misses are encoded in
+        one batched model call and cached. Returns a (len(texts), dim) array.
+        """
+        texts = list(texts)
+        if self.cache is None:
+            return self.encode_batch(texts, batch_size)
+        vectors = [self.cache.get(text, self.cache_namespace) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = self.encode_batch([texts[i] for i in missing], batch_size)
+            for i, vector in zip(missing, encoded):
+                self.cache.put(texts[i], self.cache_namespace, vector)
+                vectors[i] = vector
+        return np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def encode_batch(self, texts, batch_size: int = 64):
+        """
+        Embed many texts with one batched model call (bypasses the cache).
+        """
+        return np.asarray(self.model.encode(list(texts), batch_size=batch_size), dtype=np.float32)
+
+
+provider = EmbeddingProvider(MODEL_NAME, cache=cache_from_env())
+if os.getenv("EMBEDDING_MICROBATCH", "0").lower() in ("1", "true"):
+    provider.enable_batching(window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "2")),
+                             max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", "32")))
+
+
+def warm_up_from_env(default: str = "off"):
+    """
+    Apply EMBEDDING_WARMUP: "background" starts loading in a thread,
+    "eager" loads before returning, anything else stays lazy.
+    """
+    mode = os.getenv("EMBEDDING_WARMUP", default).lower()
+    if mode == "eager":
+        provider.warm_up(background=False)
+    elif mode in ("1", "true", "background"):
+        provider.warm_up(background=True)
@@ -0,0 +1,29 @@
+from concurrent.futures import Future
+
+import numpy as np
+
+from micro_batch import MicroBatcher
+
+
+class EmbeddingScheduler(MicroBatcher):
+    """
+    Micro-batching front for a batch encoder. Concurrent callers submit
+    single texts; a worker thread gathers them for up to window_ms (or
+    max_batch texts), runs one batched encode and resolves each future.
+    """
+    name = "embedding-scheduler"
+
+    def __init__(self, encode_batch, window_ms: float = 2.0, max_batch: int = 32):
+        super().__init__(window_ms, max_batch)
+        self.encode_batch = encode_batch
+
+    def submit(self, text: str) -> Future:
+        return self._submit(text)
+
+    def encode(self, text: str, timeout: float = None):
+        return self.submit(text).result(timeout)
+
+    def _process_batch(self, batch):
+        embeddings = np.asarray(self.encode_batch([text for text, _ in batch]), dtype=np.float32)
+        for (_, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
@@ -0,0 +1,296 @@
+import heapq
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from vector_index import ScoreStats, VectorIndex, normalize_rows
+
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+
+
+def _key_to_json(key):
+    return list(key) if isinstance(key, tuple) else key
+
+
+def _key_from_json(key):
+    return tuple(key) if isinstance(key, list) else key
+
+
+class SnapshotWriter:
+    """
+    Writes a new snapshot version under directory: per partition, a raw
+    float32 file of pre-normalized rows plus .ids.npy / .scores.npy
+    sidecars and a manifest. Rows are buffered per partition and appended
+    in chunks, so any number of rows can be streamed through.
+    commit() publishes the version by atomically rewriting CURRENT.
+    """
+
+    def __init__(self, directory: str, flush_rows: int = 4096):
+        self.directory = directory
+        self.version = str(time.time_ns())
+        self.path = os.path.join(directory, self.version)
+        self.flush_rows = flush_rows
+        self.dim = None
+        self._partitions = {}
+        os.makedirs(self.path)
+
+    def add(self, key, id, vector, score: float = 0.0):
+        self.add_many(key, [id], [vector], [score])
+
+    def add_many(self, key, ids, vectors, scores=None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or not len(vectors):
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match snapshot dimension {self.dim}")
+        part = self._partitions.get(key)
+        if part is None:
+            part = self._partitions[key] = {"file": f"part-{len(self._partitions):05d}", "rows": 0,
+                                            "ids": [], "scores": [], "pending": []}
+        part["ids"].extend(ids)
+        part["scores"].extend(np.zeros(len(ids)) if scores is None else scores)
+        part["pending"].append(normalize_rows(vectors.copy()))
+        if sum(len(chunk) for chunk in part["pending"]) >= self.flush_rows:
+            self._flush(part)
+
+    def _flush(self, part):
+        if not part["pending"]:
+            return
+        with open(os.path.join(self.path, part["file"] + ".f32"), "ab") as f:
+            for chunk in part["pending"]:
+                f.write(chunk.tobytes())
+                part["rows"] += len(chunk)
+        part["pending"] = []
+
+    def commit(self, keep: int = 2, **meta):
+        """
+        Finish every partition, publish this version and delete all but the
+        newest `keep` versions (processes still mapping them keep working).
+        Extra keyword arguments are stored in the manifest.
+        """
+        partitions = []
+        for key, part in self._partitions.items():
+            self._flush(part)
+            np.save(os.path.join(self.path, part["file"] + ".ids.npy"), np.asarray(part["ids"]))
+            np.save(os.path.join(self.path, part["file"] + ".scores.npy"), np.asarray(part["scores"], dtype=np.float32))
+            partitions.append({"key": _key_to_json(key), "file": part["file"], "rows": part["rows"]})
+        with open(os.path.join(self.path, MANIFEST), "w") as f:
+            json.dump({"version": self.version, "dim": self.dim, "partitions": partitions, **meta}, f)
+
+        tmp_path = os.path.join(self.directory, CURRENT + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(self.version)
+        os.replace(tmp_path, os.path.join(self.directory, CURRENT))
+
+        versions = sorted(name for name in os.listdir(self.directory)
+                          if name.isdigit() and os.path.isdir(os.path.join(self.directory, name)))
+        for name in versions[:-keep]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        return self.version
+
+
+def current_version(directory: str):
+    try:
+        with open(os.path.join(directory, CURRENT), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class Snapshot:
+    """
+    A published snapshot version. Partition matrices are opened with
+    np.memmap, so every process reading the same version shares one
+    page-cache copy and opening costs no load time.
+    """
+
+    def __init__(self, directory: str, version: str):
+        self.path = os.path.join(directory, version)
+        with open(os.path.join(self.path, MANIFEST), "r") as f:
+            self.manifest = json.load(f)
+        self.version = version
+        self.dim = self.manifest["dim"]
+        self._partitions = {_key_from_json(part["key"]): part for part in self.manifest["partitions"]}
+
+    def keys(self, topic=None):
+        """
+        Partition keys, optionally only those of (topic, type) keys for topic.
+        """
+        return [key for key in self._partitions if topic is None or (isinstance(key, tuple) and key[0] == topic)]
+
+    def partition(self, key):
+        """
+        (ids, matrix, scores) for a partition; matrix is a read-only memmap.
+        """
+        part = self._partitions.get(key)
+        if part is None or not part["rows"]:
+            return None
+        base = os.path.join(self.path, part["file"])
+        matrix = np.memmap(base + ".f32", dtype=np.float32, mode="r", shape=(part["rows"], self.dim))
+        ids = np.load(base + ".ids.npy", allow_pickle=False).tolist()
+        scores = np.load(base + ".scores.npy", allow_pickle=False)
+        return ids, matrix, scores
+
+
+def open_snapshot(directory: str):
+    """
+    The current snapshot in directory, or None if none was published.
+    """
+    version = current_version(directory) if directory else None
+    return Snapshot(directory, version) if version else None
+
+
+class SnapshotVectorIndex:
+    """
+    VectorIndex over a memory-mapped snapshot (the shared, read-only base)
+    plus a small per-process delta index for rows added since the
+    snapshot. Rows re-added after the snapshot shadow their base copy;
+    load_base() swaps in a newer snapshot and drops delta rows it covers.
+    Ranks are merged across both parts with shared score statistics.
+    """
+
+    def __init__(self, make_index=VectorIndex):
+        self.make_index = make_index
+        self.base = VectorIndex()
+        self.delta = make_index()
+        self.version = None
+        self._shadowed = set()
+        # Statistics of the visible rows (unshadowed base plus delta), kept
+        # up to date by every write rather than combined per query
+        self._score_stats = ScoreStats()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.base) - len(self._shadowed) + len(self.delta)
+
+    def __contains__(self, id):
+        return id in self.delta or id in self.base
+
+    @property
+    def dim(self):
+        return self.base.dim or self.delta.dim
+
+    @property
+    def ids(self):
+        return [id for id in self.base.ids if id not in self._shadowed] + list(self.delta.ids)
+
+    @property
+    def nbytes(self) -> int:
+        # The mapped base lives in the shared page cache; only its scores and codes are private
+        codes = self.base.quantizer.nbytes if self.base.quantizer is not None else 0
+        return self.base.scores.nbytes + codes + self.delta.nbytes
+
+    @property
+    def score_stats(self) -> ScoreStats:
+        return self._score_stats
+
+    def _score(self, id):
+        # Score of the visible copy of id, or None
+        if id in self.delta:
+            return self.delta.scores[self.delta._rows[id]]
+        if id in self.base and id not in self._shadowed:
+            return self.base.scores[self.base._rows[id]]
+        return None
+
+    def load_base(self, ids, matrix, scores, version=None):
+        """
+        Use (ids, matrix, scores) from a snapshot as the base; the base gets
+        the same kind of ANN index and quantizer make_index() attaches, if any.
+        """
+        with self._lock:
+            template = self.make_index()
+            base = VectorIndex.from_matrix(ids, matrix, scores, ann=getattr(template, "ann", None),
+                                           quantizer=getattr(template, "quantizer", None))
+            delta = self.make_index()
+            kept = [id for id in self.delta.ids if id not in base]
+            if kept:
+                rows = [self.delta._rows[id] for id in kept]
+                delta.add_many(kept, self.delta.matrix[rows], self.delta.scores[rows])
+            self.base, self.delta, self.version = base, delta, version
+            self._shadowed = set()
+            self._score_stats = ScoreStats.combine(base.score_stats, delta.score_stats)
+
+    def add(self, id, vector, score: float = 0.0):
+        self.add_many([id], [vector], [score])
+
+    def add_many(self, ids, vectors, scores=None):
+        if not len(ids):
+            return
+        scores = np.zeros(len(ids), dtype=np.float32) if scores is None else np.asarray(scores, dtype=np.float32)
+        with self._lock:
+            added = {}
+            for id, score in zip(ids, scores):
+                old = added[id] if id in added else self._score(id)
+                if id in self.base and id not in self._shadowed:
+                    self._shadowed.add(id)
+                    self.base.score_stats.remove(old)
+                    self._score_stats.remove(old)
+                    old = None
+                if old is None:
+                    self._score_stats.add(score)
+                else:
+                    self._score_stats.update(old, score)
+                added[id] = score
+            self.delta.add_many(ids, vectors, scores)
+
+    def set_score(self, id, score: float):
+        with self._lock:
+            old = self._score(id)
+            if old is None:
+                return False
+            if id in self.delta:
+                self.delta.set_score(id, score)
+            else:
+                self.base.set_score(id, score)
+            self._score_stats.update(old, self._score(id))
+            return True
+
+    def refresh_scores(self, rows):
+        """
+        Bring base scores up to date from (id, score) pairs, touching only
+        the rows whose score changed since the snapshot.
+        """
+        with self._lock:
+            base_rows, base_scores = self.base._rows, self.base.scores
+            for id, score in rows:
+                row = base_rows.get(id)
+                if row is not None and base_scores[row] != np.float32(score or 0.0) and id not in self._shadowed:
+                    self.set_score(id, score or 0.0)
+
+    def increment_score(self, id, delta: float):
+        with self._lock:
+            old = self._score(id)
+            return old is not None and self.set_score(id, old + delta)
+
+    def clear(self):
+        with self._lock:
+            self.base = VectorIndex()
+            self.delta = self.make_index()
+            self.version = None
+            self._shadowed = set()
+            self._score_stats = ScoreStats()
+
+    def search(self, query, top_k: int = 3):
+        return [(id, sim) for id, _, sim, _ in self.rank(query, top_k)]
+
+    def rank(self, query, top_k: int = 3, sim_weight: float = 1.0, score_weight: float = 0.0,
+             normalization: str = None, exclude=()):
+        return self.rank_many([query], top_k, sim_weight, score_weight, normalization, exclude)[0]
+
+    def rank_many(self, queries, top_k: int = 3, sim_weight: float = 1.0, score_weight: float = 0.0,
+                  normalization: str = None, exclude=()):
+        with self._lock:
+            base, delta = self.base, self.delta
+            base_exclude = self._shadowed.union(exclude) if self._shadowed else exclude
+            stats = self.score_stats if normalization else None
+        results = [base.rank_many(queries, top_k, sim_weight, score_weight, normalization, base_exclude, stats),
+                   delta.rank_many(queries, top_k, sim_weight, score_weight, normalization, exclude, stats)]
+        return [heapq.nlargest(top_k, found_base + found_delta, key=lambda result: result[1])
+                for found_base, found_delta in zip(*results)]
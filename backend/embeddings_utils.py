@@ -1,25 +1,64 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from pymongo import MongoClient
 import os
 from datetime import datetime
+from vector_index import PartitionedVectorIndex, VectorIndex
+from ivf_index import ivf_from_env
+from quantization import quantizer_from_env
+from embedding_codec import to_bson, decode_embedding
+from backfill import Checkpoint, run_backfill
+from embedding_snapshot import SnapshotWriter
+from embedding_provider import provider
+from mongo_client import mongo
 
-# Initialize the embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
-# MongoDB connection
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    db = client["creatorcore"]
-    client.admin.command('ping')
-    generations_collection = db["generations"]
-except Exception as e:
-    print(f"Failed to connect to MongoDB: {e}")
-    print("Using mock mode for embeddings.")
-    client = None
-    db = None
-    generations_collection = None
+def _load_partitions(topic: str = None, since: str = None):
+    """
+    Stream (key, id, embedding, feedback_score) rows for one topic (or all)
+    from Mongo, keyed by (topic, type) for the partitioned index; with
+    since, only rows embedded at or after that time.
+    """
+    query = {"embedding": {"$exists": True}}
+    if topic:
+        query["topic"] = topic
+    if since:
+        query["embedding_updated"] = {"$gte": since}
+    for doc in mongo.collection("generations").find(query, {"embedding": 1, "feedback_score": 1, "topic": 1, "type": 1}):
+        embedding = decode_embedding(doc.get("embedding"))
+        if embedding is None or not len(embedding):
+            continue
+        yield (doc.get("topic"), doc.get("type")), str(doc["_id"]), embedding, doc.get("feedback_score", 0.0)
+
+def _load_scores(topic: str = None):
+    """
+    Stream (id, feedback_score) for one topic (or all), without embeddings.
+    """
+    query = {"embedding": {"$exists": True}}
+    if topic:
+        query["topic"] = topic
+    for doc in mongo.collection("generations").find(query, {"feedback_score": 1}):
+        yield str(doc["_id"]), doc.get("feedback_score", 0.0)
+
+def build_context_index() -> PartitionedVectorIndex:
+    """
+    In-process index of stored embeddings partitioned by (topic, type),
+    sized by VECTOR_INDEX_MAX_BYTES. Loaded topics pick up rows embedded
+    and scores changed by other processes every VECTOR_INDEX_REFRESH
+    seconds (default 30, 0 disables) and are reloaded in full every
+    VECTOR_INDEX_TTL seconds (0 keeps them until evicted). With ANN_MODE=ivf large
+    partitions get their own IVF index, and VECTOR_QUANTIZATION scans
+    compact codes before re-ranking. With EMBEDDING_SNAPSHOT_DIR,
+    partitions are memory-mapped from the latest snapshot.
+    """
+    return PartitionedVectorIndex(_load_partitions,
+                                  max_bytes=int(os.getenv("VECTOR_INDEX_MAX_BYTES", str(256 * 1024 * 1024))),
+                                  ttl=float(os.getenv("VECTOR_INDEX_TTL", "0")),
+                                  refresh=float(os.getenv("VECTOR_INDEX_REFRESH", "30")),
+                                  make_index=lambda capacity=1024: VectorIndex(
+                                      capacity=capacity, ann=ivf_from_env(), quantizer=quantizer_from_env()),
+                                  snapshot_dir=os.getenv("EMBEDDING_SNAPSHOT_DIR"),
+                                  load_scores=_load_scores,
+                                  snapshot_check=float(os.getenv("EMBEDDING_SNAPSHOT_CHECK", "30")))
+
+context_index = build_context_index()
 
 def generate_embedding(text: str) -> list:
     """
@@ -27,21 +66,42 @@ def generate_embedding(text: str) -> list:
     """
     if not text:
         return []
-    embedding = model.encode(text)
-    return embedding.tolist()
+    return provider.encode(text).tolist()
 
-def store_embedding(generation_id: str, embedding: list):
+def store_embedding(generation_id: str, embedding: list, topic: str = None, gen_type: str = None):
     """
-    Store the embedding for a generation in the database.
+    Store the embedding for a generation in the database and in its
+    (topic, type) partition of the context index.
     """
+    db = mongo.database()
     if db is None:
         print(f"Mock store embedding for {generation_id}")
         return
     from bson import ObjectId
-    generations_collection.update_one(
+    db["generations"].update_one(
         {"_id": ObjectId(generation_id)},
-        {"$set": {"embedding": embedding, "embedding_updated": datetime.utcnow().isoformat() + "Z"}}
+        {"$set": {"embedding": to_bson(embedding), "embedding_updated": datetime.utcnow().isoformat() + "Z"}}
     )
+    if topic is not None and len(embedding):
+        context_index.add((topic, gen_type), generation_id, embedding)
+
+def get_embedding(generation_id: str):
+    """
+    Return (embedding, topic) for a stored generation, or None if it has no embedding yet.
+    """
+    db = mongo.database()
+    if db is None:
+        return None
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    try:
+        doc = db["generations"].find_one({"_id": ObjectId(generation_id), "embedding": {"$exists": True}},
+                                         {"embedding": 1, "topic": 1})
+    except InvalidId:
+        return None
+    if doc is None:
+        return None
+    return decode_embedding(doc["embedding"]), doc.get("topic")
 
 def cosine_similarity(vec1: list, vec2: list) -> float:
     """
@@ -58,59 +118,134 @@ def cosine_similarity(vec1: list, vec2: list) -> float:
         return 0.0
     return dot_product / (norm1 * norm2)
 
+def _with_text(ranked):
+    """
+    Attach topic and output_text to ranked (id, combined, sim, score) rows,
+    fetched for the winners alone with one $in query.
+    """
+    from bson import ObjectId
+    wanted = {ObjectId(id) for rows in ranked for id, _, _, _ in rows}
+    docs = {str(doc["_id"]): doc for doc in mongo.collection("generations").find(
+        {"_id": {"$in": list(wanted)}}, {"topic": 1, "output_text": 1})} if wanted else {}
+    return [[{
+        "id": id,
+        "topic": docs.get(id, {}).get("topic", ""),
+        "output_text": docs.get(id, {}).get("output_text", ""),
+        "similarity": sim,
+        "feedback_score": score,
+        "combined_score": combined
+    } for id, combined, sim, score in rows] for rows in ranked]
+
 def find_similar_generations(query_embedding: list, topic: str = None, top_k: int = 3, score_weight: float = 0.0):
     """
     Find top-k similar generations based on embeddings, optionally filtered by topic.
-    Incorporates feedback score weighting.
+    Incorporates feedback score weighting. Only the topic's partitions of the
+    context index are scored.
     """
+    db = mongo.database()
     if db is None:
         return [{"topic": "Mock Topic", "output_text": "Mock similar content", "similarity": 0.8}]
+    if not len(query_embedding):
+        return []
+    return _with_text([context_index.rank(query_embedding, topic=topic or None, top_k=top_k,
+                                          score_weight=score_weight)])[0]
 
-    # Build query
-    query = {"embedding": {"$exists": True}}
-    if topic:
-        query["topic"] = topic
+def find_similar_generations_batch(query_embeddings, topics: list = None, top_k: int = 3, score_weight: float = 0.0):
+    """
+    Batched find_similar_generations: queries sharing a topic are scored
+    against each of its partitions with one matrix-matrix product.
+    topics[i] (optional) restricts query i to its topic. Returns one
+    result list per query.
+    """
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    db = mongo.database()
+    if db is None:
+        return [find_similar_generations(q) for q in queries]
+    if not len(queries):
+        return []
+    return _with_text(context_index.rank_many(queries, topics, top_k=top_k, score_weight=score_weight))
 
-    # Get all matching documents
-    docs = list(generations_collection.find(query))
-
-    similarities = []
-    for doc in docs:
-        if "embedding" in doc:
-            sim = cosine_similarity(query_embedding, doc["embedding"])
-            score = doc.get("feedback_score", 0.0)
-            # Combine similarity and score (weighted)
-            combined_score = sim + (score * score_weight)
-            similarities.append({
-                "id": str(doc["_id"]),
-                "topic": doc.get("topic", ""),
-                "output_text": doc.get("output_text", ""),
-                "similarity": sim,
-                "feedback_score": score,
-                "combined_score": combined_score
-            })
-
-    # Sort by combined score and return top-k
-    similarities.sort(key=lambda x: x["combined_score"], reverse=True)
-    return similarities[:top_k]
-
-def backfill_embeddings():
+def backfill_embeddings(batch_size: int = 256, encode_batch_size: int = 64, workers: int = 0, checkpoint_path: str = None):
     """
     Backfill embeddings for existing generations that don't have them.
+    Documents are streamed in _id order, encoded in batches (optionally in a
+    process pool) and written with one bulk_write per batch; with a
+    checkpoint_path an interrupted run resumes after the last written _id.
     """
+    db = mongo.database()
     if db is None:
         print("Mock backfill embeddings")
-        return
+        return 0
+    from bson import ObjectId
+    from pymongo import UpdateOne
 
-    docs = generations_collection.find({"embedding": {"$exists": False}})
-    count = 0
-    for doc in docs:
-        text = doc.get("output_text", "")
-        if text:
-            embedding = generate_embedding(text)
-            store_embedding(str(doc["_id"]), embedding)
-            count += 1
+    checkpoint = Checkpoint(checkpoint_path, source="mongo")
+    query = {"embedding": {"$exists": False}}
+    if checkpoint.last_id:
+        query["_id"] = {"$gt": ObjectId(checkpoint.last_id)}
+    cursor = db["generations"].find(query, {"output_text": 1}).sort("_id", 1).batch_size(batch_size)
+    docs = ((str(doc["_id"]), doc["output_text"]) for doc in cursor if doc.get("output_text"))
+
+    def write(ids, embeddings):
+        updated = datetime.utcnow().isoformat() + "Z"
+        db["generations"].bulk_write([
+            UpdateOne({"_id": ObjectId(doc_id)}, {"$set": {"embedding": to_bson(embedding), "embedding_updated": updated}})
+            for doc_id, embedding in zip(ids, embeddings)
+        ], ordered=False)
+
+    count = run_backfill(docs, provider.encode_batch, write, batch_size=batch_size, encode_batch_size=encode_batch_size,
+                         workers=workers, checkpoint=checkpoint, label="mongo backfill", model_name=provider.model_name)
+    checkpoint.clear()
     print(f"Backfilled embeddings for {count} generations")
+    return count
+
+def convert_legacy_embeddings(batch_size: int = 500):
+    """
+    Rewrite embeddings stored as float lists into BSON Binary float32, in place.
+    """
+    db = mongo.database()
+    if db is None:
+        print("Mock convert embeddings")
+        return 0
+    from pymongo import UpdateOne
+
+    converted = 0
+    ops = []
+    for doc in db["generations"].find({"embedding": {"$type": "array"}}, {"embedding": 1}).batch_size(batch_size):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"embedding": to_bson(doc["embedding"])}}))
+        if len(ops) >= batch_size:
+            converted += db["generations"].bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        converted += db["generations"].bulk_write(ops, ordered=False).modified_count
+    print(f"Converted {converted} embeddings to binary float32")
+    return converted
+
+def write_embedding_snapshot(directory: str, batch_size: int = 1000):
+    """
+    Snapshot every stored embedding into directory, one memory-mappable
+    matrix per (topic, type) partition. Rows embedded after the scan
+    starts are picked up from Mongo by the index as its delta.
+    """
+    db = mongo.database()
+    if db is None:
+        print("Mock embedding snapshot")
+        return None
+    os.makedirs(directory, exist_ok=True)
+    started = datetime.utcnow().isoformat() + "Z"
+    writer = SnapshotWriter(directory)
+    count = 0
+    cursor = db["generations"].find({"embedding": {"$exists": True}},
+                                    {"embedding": 1, "feedback_score": 1, "topic": 1, "type": 1}).batch_size(batch_size)
+    for doc in cursor:
+        embedding = decode_embedding(doc.get("embedding"))
+        if embedding is None or not len(embedding) or (writer.dim and len(embedding) != writer.dim):
+            continue
+        writer.add((doc.get("topic"), doc.get("type")), str(doc["_id"]), embedding, doc.get("feedback_score", 0.0))
+        count += 1
+    version = writer.commit(since=started)
+    print(f"Snapshotted {count} embeddings to {directory} (version {version})")
+    return version
 
 if __name__ == "__main__":
     # Test embedding generation
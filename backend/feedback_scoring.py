@@ -0,0 +1,199 @@
+import json
+import os
+import re
+
+# Original keyword lists: each positive term +0.5, each negative term -0.5
+DEFAULT_LEXICON = {
+    **{term: 0.5 for term in ("good", "great", "excellent", "amazing", "love", "like", "perfect", "awesome")},
+    **{term: -0.5 for term in ("bad", "terrible", "awful", "hate", "dislike", "poor", "worst", "horrible")},
+}
+DEFAULT_NEGATORS = ("not", "no", "never", "nothing", "hardly", "cannot", "without")
+
+# Punctuation that ends a clause, and with it the scope of a negation
+CLAUSE_BREAKS = ".!?;,:"
+_CLAUSE_WORDS = ("but",)
+_CONTRACTIONS = ("n't", "n’t")
+# Single-word lexicons up to this size are scored with per-term substring
+# searches; the trie regex only pays off for larger ones (see bench_feedback_scoring.py)
+SUBSTRING_SCAN_MAX_TERMS = 48
+_WORD = re.compile(r"\w+")
+
+
+def _normalize(term: str) -> str:
+    return " ".join(term.lower().split())
+
+
+def _trie_pattern(words) -> str:
+    """
+    Compile words into a prefix-trie shaped regex ("go(?:od|ne)" rather than
+    "good|gone"). Python's re tries alternatives one by one, so a flat
+    alternation costs O(len(lexicon)) per character; the trie keeps it
+    bounded by the branching at each prefix, independent of lexicon size.
+    """
+    root = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node):
+        branches = [(r"\s+" if char == " " else re.escape(char)) + emit(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = f"(?:{'|'.join(branches)})"
+        # Greedy "?" tries the longer words first, like longest-match
+        return group + "?" if "" in node else group
+
+    return emit(root)
+
+
+class FeedbackScorer:
+    """
+    Scores feedback text against a weighted lexicon. Terms only match whole
+    words ("unlike" is not "like"), each term counts once per feedback, and
+    a negator earlier in the same clause ("not good", "didn't like")
+    multiplies the term's weight by negation_factor.
+
+    Small single-word lexicons (up to substring_scan_max_terms) are scored
+    with a substring search per term, and only when a negation cue occurs
+    before a matched term, a look-back from that term. Larger lexicons, or
+    ones with multi-word terms, use a single trie-regex pass.
+    """
+
+    def __init__(self, lexicon: dict = None, negators=DEFAULT_NEGATORS, negation_factor: float = -1.0,
+                 substring_scan_max_terms: int = SUBSTRING_SCAN_MAX_TERMS):
+        self.lexicon = {_normalize(term): float(weight)
+                        for term, weight in (lexicon if lexicon is not None else DEFAULT_LEXICON).items()}
+        self.negators = frozenset(_normalize(word) for word in negators)
+        self.negation_factor = negation_factor
+        # Matched against lowercased text. There is deliberately no leading
+        # \b: a pattern that starts with literals lets re skip ahead by first
+        # character, and the left word boundary is checked per match instead.
+        words = set(self.lexicon) | self.negators | set(_CLAUSE_WORDS)
+        self._pattern = re.compile(
+            f"[{re.escape(CLAUSE_BREAKS)}]|n['’]t\\b|{_trie_pattern(words)}\\b")
+        single_words = all(_WORD.fullmatch(term) for term in self.lexicon)
+        self._terms = None
+        if single_words and len(self.lexicon) <= substring_scan_max_terms:
+            self._terms = frozenset(self.lexicon)
+            self._negation_cues = tuple(self.negators) + _CONTRACTIONS
+            # Matched against reversed text, so the first match is the event
+            # nearest before a term: a word, "n't" ("t'n" glued to a word) or a break
+            self._reversed_event = re.compile(
+                f"(?<!\\w)(?:({_trie_pattern(word[::-1] for word in words)})(?!\\w)|(t['’]n)(?=\\w))"
+                f"|[{re.escape(CLAUSE_BREAKS)}]")
+
+    def score(self, feedback: str) -> float:
+        text = feedback.lower()
+        if self._terms is None:
+            return self._score_regex(text)
+        # str.find runs at C speed; the word-boundary check only runs on substring matches
+        hits = []
+        for term in self._terms:
+            if term in text:
+                start = _find_word(text, term)
+                if start >= 0:
+                    hits.append((start, term))
+        if not hits:
+            return 0.0
+        hits.sort()
+        # Terms before the first negation cue (as a substring) cannot be negated
+        first_cue = hits[-1][0]
+        for cue in self._negation_cues:
+            position = text.find(cue, 0, first_cue)
+            if position >= 0:
+                first_cue = position
+        total = 0.0
+        for start, term in hits:
+            weight = self.lexicon[term]
+            if start > first_cue and self._negated_at(text, start, first_cue):
+                weight *= self.negation_factor
+            total += weight
+        return total
+
+    def _negated_at(self, text: str, position: int, floor: int) -> bool:
+        """
+        Whether a term at position is negated: decided by the nearest clause
+        break, clause word, negator, contraction or lexicon term before it,
+        searched for in reversed, doubling windows walking back from the
+        term. No negation cue starts before floor, so the walk stops there.
+        """
+        end = position
+        width = 32
+        while end > floor:
+            begin = max(floor, end - width)
+            width *= 2
+            # Start the window between words so no word (or "n't") is cut in half
+            while begin > 0 and (_is_word_char(text[begin - 1]) or text[begin - 1] in "'’"):
+                begin -= 1
+            event = self._reversed_event.search(text[begin:end][::-1])
+            if event is not None:
+                if event.group(2):
+                    return True
+                return event.group(1) is not None and _normalize(event.group(1)[::-1]) in self.negators
+            end = begin
+        return False
+
+    def _score_regex(self, text: str) -> float:
+        seen = set()
+        negated = False
+        total = 0.0
+        for match in self._pattern.finditer(text):
+            token = match.group()
+            if token in CLAUSE_BREAKS:
+                negated = False
+                continue
+            if token in _CONTRACTIONS:
+                # Contraction ("didn't"): only counts when attached to a word
+                negated = negated or (match.start() > 0 and _is_word_char(text[match.start() - 1]))
+                continue
+            if match.start() > 0 and _is_word_char(text[match.start() - 1]):
+                continue
+            token = _normalize(token)
+            if token in _CLAUSE_WORDS:
+                negated = False
+            elif token in self.negators:
+                negated = True
+            else:
+                if token not in seen:
+                    seen.add(token)
+                    weight = self.lexicon[token]
+                    total += weight * self.negation_factor if negated else weight
+                negated = False
+        return total
+
+    def score_many(self, feedbacks) -> list:
+        return [self.score(feedback) for feedback in feedbacks]
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _find_word(text: str, word: str) -> int:
+    """
+    Position of the first whole-word occurrence of word in text, or -1.
+    """
+    start = text.find(word)
+    while start >= 0:
+        end = start + len(word)
+        if (start == 0 or not _is_word_char(text[start - 1])) and (end == len(text) or not _is_word_char(text[end])):
+            return start
+        start = text.find(word, start + 1)
+    return -1
+
+
+def scorer_from_env() -> FeedbackScorer:
+    """
+    Build a scorer from FEEDBACK_LEXICON_PATH (a JSON object of
+    term -> weight); without it the default keyword lexicon is used.
+    """
+    path = os.getenv("FEEDBACK_LEXICON_PATH")
+    if not path:
+        return FeedbackScorer()
+    with open(path, "r") as f:
+        return FeedbackScorer(json.load(f))
@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+
+from vector_index import top_k_indices
+
+ASSIGN_CHUNK = 65536
+
+
+def spherical_kmeans(vectors, n_clusters: int, iterations: int = 10, rng=None):
+    """
+    k-means on unit vectors with cosine similarity (centroids are kept
+    normalized). Empty clusters are re-seeded from random points.
+    """
+    rng = rng if rng is not None else np.random.default_rng(0)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign_to_centroids(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = sums / norms
+    return centroids.astype(np.float32)
+
+
+def assign_to_centroids(vectors, centroids):
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        labels[start:start + ASSIGN_CHUNK] = np.argmax(vectors[start:start + ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate search over the rows of a VectorIndex.
+    Rows are bucketed by their nearest k-means centroid; a query only scans
+    the rows of its nprobe closest buckets. n_lists=0 uses sqrt(rows).
+    Recall and speed trade off through nprobe (higher = closer to exact).
+
+    Below min_rows the owning index keeps scanning exactly; it retrains the
+    centroids once the row count has grown by rebuild_factor.
+    """
+
+    def __init__(self, n_lists: int = 0, nprobe: int = 8, min_rows: int = 10000, rebuild_factor: float = 2.0,
+                 iterations: int = 10, sample_per_list: int = 64, seed: int = 0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_rows = min_rows
+        self.rebuild_factor = rebuild_factor
+        self.iterations = iterations
+        self.sample_per_list = sample_per_list
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        self.centroids = None
+        self.trained_rows = 0
+        self._lists = []
+        self._labels = np.empty(0, dtype=np.int32)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_rebuild(self, rows: int) -> bool:
+        if rows < self.min_rows:
+            return False
+        return not self.trained or rows >= self.trained_rows * self.rebuild_factor
+
+    def build(self, matrix):
+        """
+        Train centroids on a sample of the (normalized) rows and assign
+        every row. Pure computation, safe to run off the request path;
+        pass the result to install().
+        """
+        rng = np.random.default_rng(self.seed)
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(len(matrix)))), len(matrix))
+        sample_size = min(len(matrix), n_lists * self.sample_per_list)
+        sample = matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))]
+        centroids = spherical_kmeans(sample, n_lists, self.iterations, rng)
+        return centroids, assign_to_centroids(matrix, centroids)
+
+    def install(self, built, matrix):
+        """
+        Swap in a build() result. Rows of matrix added after the build
+        started are assigned here; call with the owning index locked.
+        """
+        centroids, labels = built
+        if len(matrix) > len(labels):
+            labels = np.concatenate([labels, assign_to_centroids(matrix[len(labels):], centroids)])
+        order = np.argsort(labels, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(labels[order], np.arange(len(centroids) + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(centroids))]
+        self._labels = labels
+        self.centroids = centroids
+        self.trained_rows = len(matrix)
+
+    def add(self, rows, vectors):
+        """
+        Bucket new (or replaced) rows under their nearest centroid.
+        """
+        if not self.trained:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        labels = assign_to_centroids(vectors, self.centroids)
+        if len(self._labels) <= rows.max():
+            grown = np.full(max(int(rows.max()) + 1, 2 * len(self._labels)), -1, dtype=np.int32)
+            grown[:len(self._labels)] = self._labels
+            self._labels = grown
+        for row, label in zip(rows, labels):
+            previous = self._labels[row]
+            if previous == label:
+                continue
+            if previous >= 0:
+                self._lists[previous] = self._lists[previous][self._lists[previous] != row]
+            self._lists[label] = np.append(self._lists[label], row)
+            self._labels[row] = label
+
+    def candidates(self, query):
+        """
+        Rows in the nprobe buckets whose centroids are closest to query.
+        """
+        probes = top_k_indices(self.centroids @ query, self.nprobe)
+        return np.concatenate([self._lists[i] for i in probes])
+
+
+def ivf_from_env():
+    """
+    IVFIndex configured from ANN_MODE=ivf, ANN_NPROBE, ANN_LISTS,
+    ANN_MIN_ROWS and ANN_REBUILD_FACTOR; None (exact search) by default.
+    """
+    if os.getenv("ANN_MODE", "off").lower() != "ivf":
+        return None
+    return IVFIndex(
+        n_lists=int(os.getenv("ANN_LISTS", "0")),
+        nprobe=int(os.getenv("ANN_NPROBE", "8")),
+        min_rows=int(os.getenv("ANN_MIN_ROWS", "10000")),
+        rebuild_factor=float(os.getenv("ANN_REBUILD_FACTOR", "2")),
+    )
@@ -0,0 +1,92 @@
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Background worker pool for work that does not need to block a request.
+    Job state is kept per id (bounded to the most recent max_jobs) and
+    callers can long-poll for completion with wait().
+    """
+
+    def __init__(self, workers: int = 2, max_jobs: int = 10000):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="context-job")
+        self._jobs = OrderedDict()
+        self._changed = threading.Condition()
+
+    def submit(self, job_id: str, fn, *args, **kwargs):
+        with self._changed:
+            self._jobs[job_id] = {"status": PENDING, "result": None, "error": None, "submitted": time.time()}
+            self._jobs.move_to_end(job_id)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+
+    def _run(self, job_id, fn, args, kwargs):
+        try:
+            update = {"status": DONE, "result": fn(*args, **kwargs)}
+        except Exception as e:
+            traceback.print_exc()
+            update = {"status": FAILED, "error": str(e)}
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(update, finished=time.time())
+            self._changed.notify_all()
+
+    def get(self, job_id: str):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait(self, job_id: str, timeout: float = 0.0):
+        """
+        Block up to timeout seconds while the job is pending; returns its
+        state (None for unknown ids).
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] != PENDING or remaining <= 0:
+                    return dict(job) if job is not None else None
+                self._changed.wait(remaining)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+class PeriodicTask:
+    """
+    Runs fn every `interval` seconds in a daemon thread until stopped.
+    """
+
+    def __init__(self, interval: float, fn, *args, **kwargs):
+        self.interval = interval
+        self._call = lambda: fn(*args, **kwargs)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"periodic-{getattr(fn, '__name__', 'task')}",
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self._call()
+            except Exception:
+                traceback.print_exc()
@@ -0,0 +1,316 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, 0.1 ms to 10 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+# Row-count buckets for similarity scans
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+QUANTILES = (0.5, 0.95, 0.99)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_text(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter, one value per combination of label values.
+    """
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (one bisect and a lock per observation).
+    Quantiles are estimated from the buckets by linear interpolation, the
+    same way Prometheus' histogram_quantile() does.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def quantile(self, q: float, **labels):
+        """
+        Estimated q-quantile (0..1) of the observations, None if there are none.
+        """
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            counts = list(series[0]) if series else None
+        return self._quantile(q, counts) if counts else None
+
+    def _quantile(self, q, counts):
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", {**labels, "le": _number(float(bound))}, cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+    def quantile_samples(self):
+        with self._lock:
+            series = {key: list(counts) for key, (counts, _, _) in self._series.items()}
+        for key, counts in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            for q in QUANTILES:
+                yield self.name + "_quantile", {**labels, "quantile": str(q)}, self._quantile(q, counts)
+
+
+class Registry:
+    """
+    Named metrics plus collector callbacks, rendered in the Prometheus text
+    format. A collector returns (name, type, help, [(labels, value), ...])
+    tuples read at scrape time (e.g. cache statistics kept elsewhere).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def clear(self):
+        """
+        Reset every metric's values (collectors are kept).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{_label_text(labels)} {_number(value)}" for name, labels, value in metric.samples())
+            if isinstance(metric, Histogram):
+                # p50/p95/p99 estimates for readers without a Prometheus server
+                lines.append(f"# HELP {metric.name}_quantile Estimated quantiles of {metric.name}")
+                lines.append(f"# TYPE {metric.name}_quantile gauge")
+                lines.extend(f"{name}{_label_text(labels)} {_number(value)}"
+                             for name, labels, value in metric.quantile_samples() if value is not None)
+        families = {}
+        for collector in collectors:
+            for name, type, help, samples in collector():
+                families.setdefault(name, (type, help, []))[2].extend(samples)
+        for name, (type, help, samples) in families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            lines.extend(f"{name}{_label_text(labels)} {_number(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("context_stage_seconds", "Time spent in each request stage", ("stage",))
+REQUEST_SECONDS = REGISTRY.histogram("context_request_seconds", "HTTP request latency by route", ("endpoint",))
+REQUESTS = REGISTRY.counter("context_requests_total", "HTTP requests by route and status", ("endpoint", "status"))
+ROWS_SCANNED = REGISTRY.histogram("context_similarity_rows_scanned",
+                                  "Rows scored per similarity query (exact scan, quantized scan or ANN candidates)",
+                                  ("mode",), buckets=SIZE_BUCKETS)
+COALESCED_REQUESTS = REGISTRY.counter("context_coalesced_requests_total",
+                                      "Requests answered by an identical request already in flight", ("endpoint",))
+MONGO_COMMANDS = REGISTRY.counter("context_mongo_commands_total", "MongoDB round trips by command and outcome",
+                                  ("command", "outcome"))
+MONGO_SECONDS = REGISTRY.histogram("context_mongo_command_seconds", "MongoDB round-trip latency by command",
+                                   ("command",))
+
+
+def stage(name: str):
+    """
+    Time a block as one request stage: `with stage("store_embedding"): ...`
+    """
+    return STAGE_SECONDS.time(stage=name)
+
+
+def cache_collector(cache_name: str, cache):
+    """
+    Collector exporting a cache's stats() (hits, misses, evictions, entries,
+    hit_rate) under the cache="<cache_name>" label.
+    """
+    def collect():
+        if cache is None:
+            return []
+        stats = cache.stats()
+        labels = {"cache": cache_name}
+        return [
+            ("context_cache_hits_total", "counter", "Cache lookups served from the cache", [(labels, stats["hits"])]),
+            ("context_cache_misses_total", "counter", "Cache lookups that missed", [(labels, stats["misses"])]),
+            ("context_cache_evictions_total", "counter", "Entries evicted from the cache",
+             [(labels, stats["evictions"])]),
+            ("context_cache_entries", "gauge", "Entries currently cached", [(labels, stats["entries"])]),
+            ("context_cache_hit_rate", "gauge", "Hits / lookups since start", [(labels, stats["hit_rate"])]),
+        ]
+    return collect
+
+
+def mongo_command_listener():
+    """
+    pymongo CommandListener counting every command round trip and its
+    latency; pass it to MongoClient(event_listeners=[...]).
+    """
+    from pymongo import monitoring
+
+    class MongoCommandMetrics(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            MONGO_COMMANDS.inc(command=event.command_name, outcome="ok")
+            MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+
+        def failed(self, event):
+            MONGO_COMMANDS.inc(command=event.command_name, outcome="failed")
+            MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    return MongoCommandMetrics()
+
+
+def instrument(app):
+    """
+    Time every request of a Flask app by route and serve the registry at
+    GET /metrics in the Prometheus text format.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            # Route templates, not raw paths, keep the label set bounded
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    return app
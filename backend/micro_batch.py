@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Base for micro-batching fronts. Concurrent callers submit single
+    items; a worker thread gathers them for up to window_ms (or max_batch
+    items) and hands the batch to _process_batch(), which resolves each
+    item's future. If it raises, every future it left unresolved fails
+    with that error.
+
+    The window is only waited out while there is concurrency (the previous
+    batch held more than one item); a lone request is dispatched straight
+    away so low-load latency is unaffected.
+    """
+    name = "micro-batch"
+
+    def __init__(self, window_ms: float = 2.0, max_batch: int = 32):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._last_batch_size = 0
+        self._worker = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._worker.start()
+
+    def _submit(self, item) -> Future:
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        future = Future()
+        self._queue.put((item, future))
+        self._ensure_worker()
+        return future
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        # Take whatever is already waiting, then hold the window open if busy
+        deadline = time.perf_counter() + (self.window if self._last_batch_size > 1 else 0.0)
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self._last_batch_size = len(batch)
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                self._process_batch(batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _process_batch(self, batch):
+        """
+        Resolve the future of every (item, future) pair in batch.
+        """
+        raise NotImplementedError
@@ -0,0 +1,271 @@
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from jobs import PeriodicTask
+from metrics import mongo_command_listener
+
+MODES = ("auto", "mongo", "mock")
+
+
+def _optional_int(value):
+    return int(value) if value not in (None, "", "0") else None
+
+
+class MongoConnection:
+    """
+    One pooled MongoClient shared by every db helper in the process.
+    Nothing connects at import time. The client is created and pinged on
+    first use, which decides whether the process starts against MongoDB or
+    in mock mode. Mode "auto" falls back to mock when the server is
+    unreachable, "mongo" raises instead, and "mock" never connects.
+
+    A background task runs every health_interval seconds. Once connected
+    it pings the server, and after max_failures failed pings in a row the
+    client is replaced by a freshly connected one. While "auto" has fallen
+    back to mock it retries the connection instead, backing off from
+    health_interval up to max_retry_interval, and leaves mock mode (running
+    the on_connect hooks) once the server answers.
+    """
+
+    def __init__(self, uri: str = "mongodb://localhost:27017/", db_name: str = "creatorcore", mode: str = "auto",
+                 max_pool_size: int = 100, min_pool_size: int = 0, server_selection_timeout_ms: int = 5000,
+                 connect_timeout_ms: int = 5000, socket_timeout_ms: int = None, max_idle_time_ms: int = None,
+                 health_interval: float = 30.0, max_failures: int = 3, max_retry_interval: float = 300.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown Mongo mode '{mode}'. Use one of: {', '.join(MODES)}")
+        self.uri = uri
+        self.db_name = db_name
+        self.mode = mode
+        self.client_options = {
+            "maxPoolSize": max_pool_size,
+            "minPoolSize": min_pool_size,
+            "serverSelectionTimeoutMS": server_selection_timeout_ms,
+            "connectTimeoutMS": connect_timeout_ms,
+            "socketTimeoutMS": socket_timeout_ms,
+            "maxIdleTimeMS": max_idle_time_ms,
+        }
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.max_retry_interval = max_retry_interval
+        self.failures = 0
+        self.reconnects = 0
+        self._client = None
+        self._db = None
+        self._mock = None  # None until the first use decides
+        self._fallback = False  # auto mode fell back to mock and keeps retrying
+        self._retry_delay = health_interval
+        self._next_retry = 0.0
+        self._health_task = None
+        self._on_connect = []
+        self._lock = threading.RLock()
+
+    @property
+    def mock(self) -> bool:
+        return self.database() is None
+
+    def database(self):
+        """
+        The shared Database, or None in mock mode. Connects on first call.
+        """
+        if self._mock is None:
+            self._decide()
+        return self._db
+
+    def collection(self, name: str):
+        db = self.database()
+        return db[name] if db is not None else None
+
+    def _decide(self):
+        with self._lock:
+            if self._mock is not None:
+                return
+            if self.mode == "mock":
+                self._mock = True
+                return
+            try:
+                self._client, self._db = self._open()
+            except Exception as e:
+                if self.mode == "mongo":
+                    raise
+                print(f"Failed to connect to MongoDB: {e}")
+                print("Using mock mode for testing.")
+                self._mock = True
+                self._fallback = True
+                self._retry_delay = self.health_interval
+                self._next_retry = time.monotonic()
+                self._start_health_task()
+                return
+            self._mock = False
+            self._start_health_task()
+        self._run_on_connect()
+
+    def _start_health_task(self):
+        if self.health_interval > 0 and self._health_task is None:
+            self._health_task = PeriodicTask(self.health_interval, self.check_health).start()
+
+    def _run_on_connect(self):
+        with self._lock:
+            hooks = list(self._on_connect)
+        for fn in hooks:
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc()
+
+    def on_connect(self, fn):
+        """
+        Run fn (e.g. index creation) once the first real connection is
+        made, or right away if it already has been.
+        """
+        with self._lock:
+            self._on_connect.append(fn)
+            connected = self._mock is False
+        if connected:
+            fn()
+        return fn
+
+    def _open(self):
+        from pymongo import MongoClient
+
+        client = MongoClient(self.uri, event_listeners=[mongo_command_listener()],
+                             **{key: value for key, value in self.client_options.items() if value is not None})
+        try:
+            client.admin.command("ping")
+        except Exception:
+            client.close()
+            raise
+        return client, client[self.db_name]
+
+    def check_health(self) -> bool:
+        """
+        Ping the server; after max_failures consecutive failures swap in a
+        newly connected client (the old one keeps serving until then). In
+        auto mode's mock fallback, retry connecting instead.
+        """
+        if self._fallback:
+            return self.retry_connect()
+        client = self._client
+        if client is None:
+            return False
+        try:
+            client.admin.command("ping")
+        except Exception as e:
+            self.failures += 1
+            print(f"MongoDB health check failed ({self.failures}/{self.max_failures}): {e}")
+            if self.failures >= self.max_failures:
+                self.reconnect()
+            return False
+        self.failures = 0
+        return True
+
+    def retry_connect(self) -> bool:
+        """
+        Try to leave auto mode's mock fallback, unless the backoff delay
+        since the last failed attempt has not passed yet.
+        """
+        now = time.monotonic()
+        if not self._fallback or now < self._next_retry:
+            return False
+        try:
+            client, db = self._open()
+        except Exception as e:
+            self._retry_delay = min(max(self._retry_delay * 2, self.health_interval), self.max_retry_interval)
+            self._next_retry = now + self._retry_delay
+            print(f"MongoDB still unreachable, retrying in {self._retry_delay:.0f}s: {e}")
+            return False
+        with self._lock:
+            if not self._fallback:  # use() or close() ran meanwhile
+                client.close()
+                return False
+            self._client, self._db, self._mock, self._fallback = client, db, False, False
+            self.failures = 0
+            self.reconnects += 1
+        print("Connected to MongoDB, leaving mock mode.")
+        self._run_on_connect()
+        return True
+
+    def reconnect(self) -> bool:
+        with self._lock:
+            try:
+                client, db = self._open()
+            except Exception as e:
+                print(f"MongoDB reconnect failed: {e}")
+                return False
+            previous, self._client, self._db = self._client, client, db
+            self.failures = 0
+            self.reconnects += 1
+        if previous is not None:
+            previous.close()
+        return True
+
+    def use(self, db):
+        """
+        Serve db (e.g. a mongomock database) instead of connecting; None
+        switches to mock mode.
+        """
+        with self._lock:
+            self._client = getattr(db, "client", None) if db is not None else None
+            self._db = db
+            self._mock = db is None
+            self._fallback = False
+
+    @contextmanager
+    def using(self, db):
+        """
+        use(db) for the duration of a with block, then restore the previous state.
+        """
+        with self._lock:
+            saved = (self._client, self._db, self._mock, self._fallback)
+            self.use(db)
+        try:
+            yield db
+        finally:
+            with self._lock:
+                self._client, self._db, self._mock, self._fallback = saved
+
+    def status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "decided": None if self._mock is None else ("mock" if self._mock else "mongo"),
+            "retrying": self._fallback,
+            "health_failures": self.failures,
+            "reconnects": self.reconnects,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._health_task is not None:
+                self._health_task.stop()
+                self._health_task = None
+            if self._client is not None and self._mock is False:
+                self._client.close()
+            self._client, self._db, self._mock, self._fallback = None, None, None, False
+
+
+def connection_from_env() -> MongoConnection:
+    """
+    MongoConnection configured from MONGO_URI, MONGO_DB, MONGO_MODE,
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_HEALTH_INTERVAL and MONGO_MAX_RETRY_INTERVAL.
+    """
+    return MongoConnection(
+        uri=os.getenv("MONGO_URI", "mongodb://localhost:27017/"),
+        db_name=os.getenv("MONGO_DB", "creatorcore"),
+        mode=os.getenv("MONGO_MODE", "auto").lower(),
+        max_pool_size=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        min_pool_size=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        server_selection_timeout_ms=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        connect_timeout_ms=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        socket_timeout_ms=_optional_int(os.getenv("MONGO_SOCKET_TIMEOUT_MS")),
+        max_idle_time_ms=_optional_int(os.getenv("MONGO_MAX_IDLE_TIME_MS")),
+        health_interval=float(os.getenv("MONGO_HEALTH_INTERVAL", "30")),
+        max_retry_interval=float(os.getenv("MONGO_MAX_RETRY_INTERVAL", "300")),
+    )
+
+
+# Shared by db_utils, embeddings_utils and migrate_db
+mongo = connection_from_env()
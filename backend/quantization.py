@@ -0,0 +1,143 @@
+import os
+
+import numpy as np
+
+SCAN_CHUNK = 65536
+# Rows widened to float32 per matmul: 2048 x 384 dims is a 3 MB temporary
+# that stays in cache between the conversion and the matmul
+INT8_SCAN_CHUNK = 2048
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(values):
+        return np.bitwise_count(values)
+else:
+    _POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT[values.view(np.uint8)]
+
+
+class Int8Quantizer:
+    """
+    Per-vector scaled int8 codes (dim + 4 bytes per row, ~4x smaller than
+    float32). Similarities are estimated chunk by chunk: a block of codes
+    is widened to float32 and multiplied against the full-precision
+    queries in one BLAS matmul, then scaled per row. The owning index
+    re-scores the best top_k * rerank candidates with the float32 vectors.
+    """
+    name = "int8"
+
+    def __init__(self, rerank: int = 10):
+        self.rerank = rerank
+        self.reset()
+
+    def reset(self):
+        self.codes = None
+        self.scales = np.empty(0, dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.codes.nbytes if self.codes is not None else 0) + self.scales.nbytes
+
+    def reserve(self, capacity: int, dim: int):
+        if self.codes is not None and len(self.codes) >= capacity:
+            return
+        codes = np.zeros((capacity, dim), dtype=np.int8)
+        scales = np.zeros(capacity, dtype=np.float32)
+        if self.codes is not None:
+            codes[:len(self.codes)] = self.codes
+            scales[:len(self.scales)] = self.scales
+        self.codes, self.scales = codes, scales
+
+    @staticmethod
+    def quantize(vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def encode(self, rows, vectors):
+        self.codes[rows], self.scales[rows] = self.quantize(vectors)
+
+    def similarities(self, queries, n: int):
+        """
+        Approximate dot products of (normalized) queries with the first n rows.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        sims = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, INT8_SCAN_CHUNK):
+            end = min(n, start + INT8_SCAN_CHUNK)
+            dots = queries @ self.codes[start:end].astype(np.float32).T
+            sims[:, start:end] = dots * self.scales[start:end]
+        return sims
+
+
+class BinaryQuantizer:
+    """
+    Sign-bit codes (dim / 8 bytes per row, 32x smaller than float32)
+    compared by Hamming distance; cos(pi * hamming / dim) estimates the
+    cosine similarity for candidate selection. The estimate is coarse, so
+    binary codes usually want a larger rerank than int8.
+    """
+    name = "binary"
+
+    def __init__(self, rerank: int = 20):
+        self.rerank = rerank
+        self.reset()
+
+    def reset(self):
+        self.codes = None
+        self.dim = None
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes if self.codes is not None else 0
+
+    def reserve(self, capacity: int, dim: int):
+        self.dim = dim
+        width = (dim + 63) // 64 * 8  # whole uint64 words per row
+        if self.codes is not None and len(self.codes) >= capacity:
+            return
+        codes = np.zeros((capacity, width), dtype=np.uint8)
+        if self.codes is not None:
+            codes[:len(self.codes)] = self.codes
+        self.codes = codes
+
+    def quantize(self, vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        packed = np.packbits(vectors > 0, axis=1)
+        codes = np.zeros((len(vectors), self.codes.shape[1]), dtype=np.uint8)
+        codes[:, :packed.shape[1]] = packed
+        return codes
+
+    def encode(self, rows, vectors):
+        self.codes[rows] = self.quantize(vectors)
+
+    def similarities(self, queries, n: int):
+        query_words = self.quantize(queries).view(np.uint64)
+        words = self.codes.view(np.uint64)
+        sims = np.empty((len(query_words), n), dtype=np.float32)
+        for start in range(0, n, SCAN_CHUNK):
+            end = min(n, start + SCAN_CHUNK)
+            for row, query in enumerate(query_words):
+                hamming = _popcount(words[start:end] ^ query).sum(axis=1, dtype=np.int32)
+                sims[row, start:end] = np.cos(np.pi * hamming / self.dim)
+        return sims
+
+
+QUANTIZERS = {"int8": Int8Quantizer, "binary": BinaryQuantizer}
+
+
+def quantizer_from_env():
+    """
+    Quantizer named by VECTOR_QUANTIZATION (int8 | binary), re-ranking
+    QUANTIZATION_RERANK candidates per result; None keeps the
+    full-precision scan.
+    """
+    name = os.getenv("VECTOR_QUANTIZATION", "off").lower()
+    if name in ("", "off", "none"):
+        return None
+    if name not in QUANTIZERS:
+        raise ValueError(f"Unknown vector quantization '{name}'. Use one of: {', '.join(QUANTIZERS)}")
+    rerank = os.getenv("QUANTIZATION_RERANK")
+    return QUANTIZERS[name](int(rerank)) if rerank else QUANTIZERS[name]()
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from embedding_cache import normalize_text
+
+
+def request_key(*parts) -> tuple:
+    """
+    Cache / coalescing key of a request: each part NFC-normalized, trimmed
+    and single-spaced.
+    """
+    return tuple(normalize_text(str(part)) for part in parts)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs
+    fn, callers arriving while it is in flight wait for and share its
+    result (or exception). Nothing is kept once the call finishes.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Returns (result, shared); shared is True when another caller's
+        in-flight result was reused.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class ResultCache:
+    """
+    Bounded LRU cache whose entries expire ttl seconds after they are
+    stored. invalidate() does not drop anything: it bumps an epoch, and
+    entries stored before it are reported as stale so the caller can
+    refresh only the parts that depend on the changed inputs (e.g.
+    re-rank related context after feedback without regenerating).
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.epoch = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> [expires_at, epoch, value]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        (value, stale) for a live entry, or None on a miss. stale is True
+        when invalidate() ran since the value was stored.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            stale = entry[1] != self.epoch
+            if stale:
+                self.stale_hits += 1
+            return entry[2], stale
+
+    def put(self, key, value, epoch: int = None):
+        """
+        Store value for ttl seconds. Pass the epoch read before computing
+        value so an invalidation that raced the computation still marks it
+        stale.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = [time.monotonic() + self.ttl, self.epoch if epoch is None else epoch, value]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def refresh(self, key, value, epoch: int):
+        """
+        Replace a stale entry's value, keeping its original expiry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1], entry[2] = epoch, value
+
+    def invalidate(self):
+        with self._lock:
+            self.epoch += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def result_cache_from_env():
+    """
+    /generate result cache from GENERATE_CACHE_TTL (seconds; 0, the
+    default, disables it) and GENERATE_CACHE_ENTRIES.
+    """
+    ttl = float(os.getenv("GENERATE_CACHE_TTL", "0"))
+    if ttl <= 0:
+        return None
+    return ResultCache(ttl=ttl, max_entries=int(os.getenv("GENERATE_CACHE_ENTRIES", "1024")))
@@ -0,0 +1,328 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import db_utils
+import embeddings_utils
+import mongo_client
+from app_loader import load_backend_app
+
+backend_app = load_backend_app()
+
+
+@pytest.fixture
+def mongo():
+    db = mongomock.MongoClient()["creatorcore"]
+    embeddings_utils.context_index.clear()
+    with mongo_client.mongo.using(db):
+        yield db
+    embeddings_utils.context_index.clear()
+
+
+@pytest.fixture
+def client(mongo):
+    backend_app.app.config["TESTING"] = True
+    with backend_app.app.test_client() as client:
+        yield client
+
+
+def test_generate_sync_returns_related_context(client):
+    response = client.post("/generate", json={"topic": "AI", "goal": "inform", "type": "story"})
+    assert response.status_code == 200
+    assert response.get_json()["related_context"][0]["topic"] == "AI"
+
+
+def test_generate_async_then_poll_context(client, mongo):
+    response = client.post("/generate", json={"topic": "AI", "goal": "inform", "type": "ad", "async": True})
+    assert response.status_code == 202
+    data = response.get_json()
+    assert data["status"] == "pending"
+
+    context = client.get(f"{data['context_url']}?wait=5")
+    assert context.status_code == 200
+    body = context.get_json()
+    assert body["status"] == "done"
+    assert body["related_context"][0]["id"] == data["id"]
+    assert mongo["generations"].find_one({"embedding": {"$exists": True}}) is not None
+
+
+def test_context_falls_back_to_stored_embedding(client):
+    generation_id = client.post("/generate", json={"topic": "AI", "goal": "inform"}).get_json()["id"]
+    response = client.get(f"/generate/{generation_id}/context")
+    assert response.status_code == 200
+    assert response.get_json()["related_context"][0]["id"] == generation_id
+    assert client.get("/generate/000000000000000000000000/context").status_code == 404
+    assert client.get(f"/generate/{generation_id}/context?wait=abc").status_code == 400
+    assert client.get(f"/generate/{generation_id}/context?wait=-5").status_code == 200
+
+
+def test_history_range_and_projection(client, mongo):
+    for i in range(1, 13):
+        mongo["generations"].insert_one({"topic": "AI", "output_text": f"v{i}", "iteration": i,
+                                         "timestamp": f"2024-01-{i:02d}T00:00:00Z", "embedding": b"x"})
+    page = client.get("/history/AI?limit=3").get_json()
+    assert [item["output_text"] for item in page["items"]] == ["v12", "v11", "v10"]
+    assert all("embedding" not in item for item in page["items"])
+
+    ranged = client.get("/history/AI?since=2024-01-03&until=2024-01-10&min_iteration=5&max_iteration=9").get_json()
+    assert [item["iteration"] for item in ranged["items"]] == [9, 8, 7, 6, 5]
+
+    projected = client.get("/history/AI?limit=1&fields=output_text").get_json()["items"][0]
+    assert set(projected) == {"_id", "output_text"}
+
+    latest = client.get("/history/AI").get_json()
+    assert latest["output_text"] == "v12" and "embedding" not in latest
+
+
+def test_ensure_indexes_creates_topic_timestamp_index(mongo):
+    db_utils.ensure_indexes()
+    assert mongo["generations"].index_information()["topic_timestamp"]["key"] == [("topic", 1), ("timestamp", -1)]
+
+
+def test_iterations_are_atomic_and_numeric(client, mongo):
+    for _ in range(10):
+        client.post("/generate", json={"topic": "AI", "goal": "inform"})
+    iterations = [doc["iteration"] for doc in mongo["generations"].find({"topic": "AI"})]
+    assert iterations == list(range(1, 11))
+    assert db_utils.next_iteration("AI", count=5) == 15
+
+
+def test_seed_iteration_counters_from_string_iterations(mongo):
+    for i in ("1", "9", "10"):
+        mongo["generations"].insert_one({"topic": "AI", "iteration": i})
+    mongo["counters"].insert_one({"_id": "Other", "seq": 3})
+    mongo["generations"].insert_one({"topic": "Other", "iteration": "2"})
+
+    assert db_utils.seed_iteration_counters() == 2
+    assert sorted(doc["iteration"] for doc in mongo["generations"].find({"topic": "AI"})) == [1, 9, 10]
+    assert mongo["counters"].find_one({"_id": "AI"})["seq"] == 10
+    assert mongo["counters"].find_one({"_id": "Other"})["seq"] == 3
+    assert db_utils.insert_generation({"topic": "AI", "goal": "g", "output_text": "x"})
+    assert mongo["generations"].find_one({"iteration": 11}) is not None
+
+
+def test_generate_batch_matches_single_queries(client, mongo):
+    client.post("/generate", json={"topic": "AI", "goal": "seed", "type": "story"})
+    items = [
+        {"topic": "AI", "goal": "inform", "type": "story"},
+        {"topic": "AI"},
+        {"topic": "Space", "goal": "teach", "type": "podcast"},
+        {"topic": "AI", "goal": "sell", "type": "poem"},
+        {"topic": "AI", "goal": "sell", "type": "ad"},
+    ]
+    response = client.post("/generate/batch", json={"items": items})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4]
+    assert "error" in results[1] and "error" in results[3]
+    assert [doc["iteration"] for doc in mongo["generations"].find({"topic": "AI"})] == [1, 2, 3]
+
+    for result in (results[0], results[2], results[4]):
+        stored = embeddings_utils.get_embedding(result["id"])
+        assert stored is not None and stored[1] == result["topic"]
+        expected = embeddings_utils.find_similar_generations(stored[0], topic=result["topic"], top_k=3, score_weight=0.1)
+        assert [r["id"] for r in result["related_context"]] == [r["id"] for r in expected]
+        assert all(r["topic"] == result["topic"] for r in result["related_context"])
+
+    assert client.post("/generate/batch", json={"items": []}).status_code == 400
+
+
+def test_feedback_is_logged_and_incremented(client, mongo):
+    generation_id = client.post("/generate", json={"topic": "AI", "goal": "inform"}).get_json()["id"]
+    assert client.post("/feedback", json={"id": generation_id, "feedback": "great, I love it"}).status_code == 200
+    assert client.post("/feedback", json={"id": generation_id, "feedback": "great"}).status_code == 200
+    assert client.post("/feedback", json={"id": "nope", "feedback": "great"}).status_code == 500
+
+    doc = mongo["generations"].find_one()
+    assert doc["feedback_score"] == 1.5 and doc["feedback"] == "great"
+    assert mongo["feedback_loops"].count_documents({"generation_id": doc["_id"]}) == 2
+
+
+def test_feedback_batch_and_compaction(client, mongo):
+    first = client.post("/generate", json={"topic": "AI", "goal": "a"}).get_json()["id"]
+    second = client.post("/generate", json={"topic": "AI", "goal": "b"}).get_json()["id"]
+    response = client.post("/feedback/batch", json={"items": [
+        {"id": first, "feedback": "good"},
+        {"id": second, "feedback": "awful"},
+        {"id": first, "feedback": "excellent"},
+        {"id": "000000000000000000000000", "feedback": "good"},
+    ]})
+    results = response.get_json()["results"]
+    assert [r.get("score_change") for r in results[:3]] == [0.5, -0.5, 0.5]
+    assert results[3]["error"] == "Generation not found"
+    scores = {str(doc["_id"]): doc["feedback_score"] for doc in mongo["generations"].find()}
+    assert scores == {first: 1.0, second: -0.5}
+
+    assert db_utils.compact_feedback_log(older_than_seconds=-60, batch_size=2) == 3
+    assert mongo["feedback_loops"].count_documents({}) == 0
+    aggregate = mongo["feedback_aggregates"].find_one({"_id": mongo["generations"].find_one({"goal": "a"})["_id"]})
+    assert aggregate["count"] == 2 and aggregate["score_change"] == 1.0
+    assert aggregate["last_feedback"] == "excellent"
+
+
+
+def test_compaction_interrupted_before_delete_is_not_double_counted(client, mongo, monkeypatch):
+    generation_id = client.post("/generate", json={"topic": "AI", "goal": "a"}).get_json()["id"]
+    for feedback in ("good", "excellent", "awful"):
+        client.post("/feedback", json={"id": generation_id, "feedback": feedback})
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("killed before the delete")
+
+    monkeypatch.setattr(mongomock.collection.Collection, "delete_many", crash)
+    with pytest.raises(RuntimeError):
+        db_utils.compact_feedback_log(older_than_seconds=-60)
+    monkeypatch.undo()
+
+    assert db_utils.compact_feedback_log(older_than_seconds=-60) == 3
+    aggregate = mongo["feedback_aggregates"].find_one()
+    assert aggregate["count"] == 3 and aggregate["score_change"] == 0.5
+    assert aggregate["compactions"] == [] and mongo["feedback_loops"].count_documents({}) == 0
+
+def test_related_context_uses_partitioned_index(client, mongo):
+    client.post("/generate", json={"topic": "AI", "goal": "a", "type": "ad"})
+    assert mongo["generations"].find_one()["type"] == "ad"
+    assert embeddings_utils.context_index.partitions() == [("AI", "ad")]
+
+    response = client.post("/generate", json={"topic": "AI", "goal": "b", "type": "podcast"})
+    related = response.get_json()["related_context"]
+    assert len(related) == 2
+    assert sorted(embeddings_utils.context_index.partitions()) == [("AI", "ad"), ("AI", "podcast")]
+
+    client.post("/feedback", json={"id": related[1]["id"], "feedback": "excellent"})
+    rescored = embeddings_utils.find_similar_generations(embeddings_utils.generate_embedding("x"), topic="AI",
+                                                         top_k=3, score_weight=0.1)
+    assert {r["id"]: r["feedback_score"] for r in rescored}[related[1]["id"]] == 0.5
+
+
+def test_metrics_report_stage_latency_and_scans(client):
+    from metrics import REGISTRY, STAGE_SECONDS, ROWS_SCANNED
+
+    REGISTRY.clear()
+    for goal in ("a", "b", "c"):
+        client.post("/generate", json={"topic": "AI", "goal": goal})
+    assert STAGE_SECONDS.count(stage="find_similar_generations") == 3
+    assert ROWS_SCANNED.count(mode="exact") == 3
+    assert STAGE_SECONDS.quantile(0.99, stage="insert_generation") > 0
+
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.content_type.startswith("text/plain")
+    body = response.get_data(as_text=True)
+    assert 'context_stage_seconds_count{stage="mock_generate_with_gemini"} 3' in body
+    assert 'context_stage_seconds_quantile{stage="store_embedding",quantile="0.95"}' in body
+    assert 'context_requests_total{endpoint="/generate",status="200"} 3' in body
+    assert 'context_similarity_rows_scanned_bucket{mode="exact",le="10.0"} 3' in body
+    assert 'context_cache_hits_total{cache="embedding"}' in body
+
+
+
+def test_identical_concurrent_generates_share_one_generation(client, mongo, monkeypatch):
+    import threading
+    import time
+    from metrics import COALESCED_REQUESTS
+    from request_cache import SingleFlight
+
+    calls = []
+    generate = backend_app.mock_generate_with_gemini
+
+    def slow_generate(*args):
+        calls.append(args)
+        time.sleep(0.2)
+        return generate(*args)
+
+    monkeypatch.setattr(backend_app, "mock_generate_with_gemini", slow_generate)
+    # Off by default: every request stores its own generation
+    assert backend_app.generate_flights is None
+    monkeypatch.setattr(backend_app, "generate_flights", SingleFlight())
+    COALESCED_REQUESTS.clear()
+    ids = []
+
+    def post(goal):
+        with backend_app.app.test_client() as c:
+            ids.append(c.post("/generate", json={"topic": "AI", "goal": goal, "type": "story"}).get_json()["id"])
+
+    threads = [threading.Thread(target=post, args=(goal,)) for goal in ("inform", " inform", "inform ", "inform")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and len(set(ids)) == 1
+    assert mongo["generations"].count_documents({}) == 1
+    assert COALESCED_REQUESTS.value(endpoint="/generate") == 3
+
+
+def test_generate_cache_reranks_after_feedback(client, mongo, monkeypatch):
+    from request_cache import ResultCache
+
+    cache = ResultCache(ttl=60)
+    monkeypatch.setattr(backend_app, "generate_cache", cache)
+    other = client.post("/generate", json={"topic": "AI", "goal": "explain"}).get_json()["id"]
+    first = client.post("/generate", json={"topic": "AI", "goal": "inform"}).get_json()
+    assert client.post("/generate", json={"topic": "AI", "goal": "inform"}).get_json() == first
+    assert mongo["generations"].count_documents({}) == 2
+
+    client.post("/feedback", json={"id": other, "feedback": "excellent"})
+    again = client.post("/generate", json={"topic": "AI", "goal": "inform"}).get_json()
+    assert again["id"] == first["id"] and mongo["generations"].count_documents({}) == 2
+    assert {r["id"]: r["feedback_score"] for r in again["related_context"]}[other] == 0.5
+    assert cache.stats() == {"entries": 2, "hits": 2, "stale_hits": 1, "misses": 2, "evictions": 0,
+                             "hit_rate": 0.5}
+
+def test_shared_client_decides_mode_once_and_lazily(monkeypatch):
+    connection = mongo_client.MongoConnection(mode="mock")
+    assert connection.status()["decided"] is None  # nothing happens at construction
+    assert connection.database() is None and connection.mock
+    assert connection.status()["decided"] == "mock"
+
+    opened = []
+    connection = mongo_client.MongoConnection(mode="auto", health_interval=0, max_failures=2)
+    monkeypatch.setattr(connection, "_open", lambda: opened.append(1) or (mongomock.MongoClient(),
+                                                                          mongomock.MongoClient()["creatorcore"]))
+    hooks = []
+    connection.on_connect(lambda: hooks.append("indexes"))
+    assert not opened and not hooks
+    first = connection.database()
+    assert connection.database() is first and len(opened) == 1 and hooks == ["indexes"]
+    assert connection.status()["decided"] == "mongo"
+
+    class Down:
+        class admin:
+            @staticmethod
+            def command(name):
+                raise ConnectionError("down")
+
+        def close(self):
+            pass
+
+    connection._client = Down()
+    assert not connection.check_health() and connection.failures == 1
+    assert not connection.check_health()
+    # Second consecutive failure reconnects with a fresh client
+    assert len(opened) == 2 and connection.reconnects == 1 and connection.failures == 0
+    assert connection.database() is not first
+
+
+def test_auto_mode_leaves_mock_once_mongo_comes_up(monkeypatch):
+    connection = mongo_client.MongoConnection(mode="auto", health_interval=10, max_retry_interval=15)
+    attempts = []
+
+    def open_():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("down")
+        return mongomock.MongoClient(), mongomock.MongoClient()["creatorcore"]
+
+    monkeypatch.setattr(connection, "_open", open_)
+    hooks = []
+    connection.on_connect(lambda: hooks.append("indexes"))
+    try:
+        assert connection.database() is None and connection.status()["retrying"]
+        assert not connection.check_health() and len(attempts) == 2
+        # Backing off: the next health tick does not retry yet
+        assert connection._retry_delay == 15 and not connection.check_health() and len(attempts) == 2
+        connection._next_retry = 0.0
+        assert connection.check_health() and len(attempts) == 3
+        assert connection.database() is not None and hooks == ["indexes"]
+        assert connection.status()["decided"] == "mongo" and not connection.status()["retrying"]
+    finally:
+        connection.close()
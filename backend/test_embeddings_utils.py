@@ -0,0 +1,312 @@
+import numpy as np
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import embeddings_utils
+from mongo_client import mongo
+
+
+@pytest.fixture
+def collection():
+    db = mongomock.MongoClient()["creatorcore"]
+    embeddings_utils.context_index.clear()
+    with mongo.using(db):
+        yield db["generations"]
+    embeddings_utils.context_index.clear()
+
+
+def test_find_similar_matches_per_document_scoring(collection):
+    rng = np.random.default_rng(7)
+    for i in range(50):
+        collection.insert_one({
+            "topic": "t" if i % 2 else "other",
+            "output_text": f"text {i}",
+            "embedding": rng.normal(size=8).tolist(),
+            "feedback_score": float(i % 5) - 2,
+        })
+    query = rng.normal(size=8).tolist()
+
+    expected = []
+    for doc in collection.find({"topic": "t"}):
+        sim = embeddings_utils.cosine_similarity(query, doc["embedding"])
+        expected.append((sim + doc["feedback_score"] * 0.1, doc["output_text"]))
+    expected.sort(reverse=True)
+
+    result = embeddings_utils.find_similar_generations(query, topic="t", top_k=3, score_weight=0.1)
+    assert [r["output_text"] for r in result] == [text for _, text in expected[:3]]
+    assert result[0]["combined_score"] == pytest.approx(expected[0][0], rel=1e-5)
+    assert all(r["topic"] == "t" for r in result)
+
+
+def test_convert_legacy_embeddings_to_binary(collection):
+    collection.insert_one({"topic": "t", "output_text": "legacy", "embedding": [0.5, 0.25, 0.0, 1.0]})
+    assert embeddings_utils.convert_legacy_embeddings() == 1
+
+    stored = collection.find_one({"output_text": "legacy"})["embedding"]
+    assert isinstance(stored, bytes)
+    assert len(stored) == 8 + 4 * 4
+    decoded = embeddings_utils.decode_embedding(stored)
+    assert decoded.dtype == np.float32
+    assert decoded.tolist() == [0.5, 0.25, 0.0, 1.0]
+
+    result = embeddings_utils.find_similar_generations([0.5, 0.25, 0.0, 1.0], topic="t")
+    assert result[0]["similarity"] == pytest.approx(1.0)
+
+
+def test_backfill_resumes_from_checkpoint(collection, tmp_path):
+    ids = [collection.insert_one({"topic": "t", "output_text": f"text {i}"}).inserted_id for i in range(5)]
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text('{"last_id": "%s", "processed": 2}' % ids[1])
+
+    assert embeddings_utils.backfill_embeddings(batch_size=2, checkpoint_path=str(checkpoint)) == 3
+    assert collection.count_documents({"embedding": {"$exists": True}}) == 3
+    assert "embedding" not in collection.find_one({"_id": ids[0]})
+    assert not checkpoint.exists()
+
+
+
+
+def test_checkpoint_rejects_another_sources_backfill(tmp_path):
+    from backfill import Checkpoint
+
+    path = str(tmp_path / "checkpoint.json")
+    Checkpoint(path, source="sqlite").save(42, 42)
+    assert Checkpoint(path, source="sqlite").last_id == 42
+    with pytest.raises(ValueError):
+        Checkpoint(path, source="mongo")
+
+def test_backfill_workers_load_the_configured_backend(monkeypatch):
+    import backfill
+
+    loaded = []
+    monkeypatch.setattr(backfill, "load_backend", lambda model_name, backend: loaded.append((model_name, backend)))
+    backfill._init_worker("all-MiniLM-L6-v2", "onnx-int8")
+    assert loaded == [("all-MiniLM-L6-v2", "onnx-int8")]
+
+def test_embedding_cache_eviction_and_persistence(tmp_path):
+    from embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(max_entries=2, max_bytes=1024)
+    cache.put("a", "m", np.ones(4))
+    cache.put("b", "m", np.ones(4))
+    assert cache.get("  a ", "m") is not None  # normalized key, refreshes "a"
+    cache.put("c", "m", np.ones(4))
+    assert cache.get("b", "m") is None
+    assert cache.get("a", "other-model") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["evictions"] == 1
+
+    cache.put("big", "m", np.ones(300))  # 1200 bytes > max_bytes
+    assert len(cache) == 0
+
+    cache.put("a", "m", np.arange(4))
+    cache.save(str(tmp_path / "cache.npz"))
+    restored = EmbeddingCache(path=str(tmp_path / "cache.npz"))
+    assert restored.get("a", "m").tolist() == [0.0, 1.0, 2.0, 3.0]
+
+
+
+def test_embedding_cache_is_separated_by_backend():
+    from embedding_cache import EmbeddingCache
+    from embedding_provider import EmbeddingProvider
+
+    class Model:
+        def __init__(self, value):
+            self.value = value
+
+        def encode(self, text, **kwargs):
+            return np.full(4, self.value, dtype=np.float32)
+
+    cache = EmbeddingCache()
+    torch = EmbeddingProvider("m", cache=cache, loader=lambda name: Model(1.0), backend="torch")
+    onnx = EmbeddingProvider("m", cache=cache, loader=lambda name: Model(2.0), backend="onnx-int8")
+    assert torch.encode("same text")[0] == 1.0
+    assert onnx.encode("same text")[0] == 2.0
+
+def test_generate_embedding_uses_cache(monkeypatch):
+    from embedding_provider import provider
+
+    calls = []
+    encode = provider.model.encode
+    monkeypatch.setattr(provider.model, "encode", lambda text, **kw: calls.append(text) or encode(text, **kw))
+    provider.cache.clear()
+
+    first = embeddings_utils.generate_embedding("Generated story for topic 'x'.")
+    second = embeddings_utils.generate_embedding("Generated story for  topic 'x'. ")
+    assert first == second
+    assert len(calls) == 1
+
+
+def test_provider_loads_lazily_once():
+    from embedding_provider import EmbeddingProvider
+
+    loads = []
+
+    class FakeModel:
+        def encode(self, text, **kw):
+            return np.ones(4)
+
+    provider = EmbeddingProvider("fake", loader=lambda name: loads.append(name) or FakeModel())
+    assert not provider.is_ready() and loads == []
+    provider.warm_up(background=True).join()
+    assert provider.is_ready() and provider.status()["ready"]
+    provider.encode("x")
+    provider.encode_batch(["x", "y"])
+    assert loads == ["fake"]
+
+
+def test_onnx_int8_backend_parity(tmp_path):
+    pytest.importorskip("onnxruntime")
+    from embedding_backends import OnnxBackend, SentenceTransformerBackend
+    from embedding_provider import MODEL_NAME
+
+    try:
+        reference = SentenceTransformerBackend(MODEL_NAME)
+    except Exception as e:
+        pytest.skip(f"embedding model unavailable: {e}")
+    texts = [
+        "Generated story for topic 'AI' with goal 'inspire'.",
+        "Generated ad script for topic 'Eco-Friendly Cleaning Products' with goal 'Promote sustainable living'.",
+        "hi",
+    ]
+    quantized = OnnxBackend(MODEL_NAME, quantize=True, model_dir=str(tmp_path))
+    expected = np.asarray(reference.encode(texts))
+    actual = quantized.encode(texts, batch_size=2)
+    cosines = (expected * actual).sum(axis=1) / (np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1))
+    assert actual.shape == expected.shape
+    assert cosines.min() > 0.99
+    assert quantized.encode(texts[0]).shape == expected[0].shape
+
+
+def test_scheduler_batches_concurrent_requests():
+    import threading
+    from embedding_scheduler import EmbeddingScheduler
+
+    batch_sizes = []
+    release = threading.Event()
+
+    def encode_batch(texts):
+        batch_sizes.append(len(texts))
+        release.wait(1)
+        return np.array([[len(text), 1.0] for text in texts])
+
+    scheduler = EmbeddingScheduler(encode_batch, window_ms=20, max_batch=8)
+    futures = [scheduler.submit("x" * i) for i in range(1, 21)]
+    release.set()
+    assert [f.result(2)[0] for f in futures] == list(range(1, 21))
+    assert sum(batch_sizes) == 20
+    assert max(batch_sizes) == 8 and len(batch_sizes) < 20
+    scheduler.close()
+
+
+def test_scheduler_propagates_encoder_errors():
+    from embedding_scheduler import EmbeddingScheduler
+
+    def encode_batch(texts):
+        raise RuntimeError("model failed")
+
+    scheduler = EmbeddingScheduler(encode_batch)
+    with pytest.raises(RuntimeError, match="model failed"):
+        scheduler.encode("x", timeout=2)
+    scheduler.close()
+
+
+def test_partitioned_index_loads_lazily_evicts_and_merges():
+    from vector_index import PartitionedVectorIndex
+
+    rng = np.random.default_rng(3)
+    rows = [((f"topic{i % 4}", "story" if i % 3 else "ad"), f"id{i}", rng.normal(size=8), float(i % 5))
+            for i in range(120)]
+    requested = []
+
+    def load(topic):
+        requested.append(topic)
+        return [row for row in rows if topic is None or row[0][0] == topic]
+
+    index = PartitionedVectorIndex(load, max_bytes=10 ** 9)
+    query = rng.normal(size=8)
+
+    def expected(topic):
+        candidates = [(id, v, s) for key, id, v, s in rows if topic is None or key[0] == topic]
+        scored = [(float(np.dot(v, query) / np.linalg.norm(v) / np.linalg.norm(query)) + s * 0.1, id)
+                  for id, v, s in candidates]
+        return [id for _, id in sorted(scored, reverse=True)[:5]]
+
+    assert [r[0] for r in index.rank(query, topic="topic1", top_k=5, score_weight=0.1)] == expected("topic1")
+    assert sorted(index.partitions()) == [("topic1", "ad"), ("topic1", "story")]
+    index.rank(query, topic="topic1")
+    assert requested == ["topic1"]
+
+    assert [r[0] for r in index.rank(query, top_k=5, score_weight=0.1)] == expected(None)
+    assert requested == ["topic1", None] and len(index.partitions()) == 8
+
+    # A budget of about two partitions keeps only the most recently used topic resident
+    index.max_bytes = 2 * index._partitions[("topic1", "story")].nbytes
+    index.rank(query, topic="topic2")
+    assert sorted(index.partitions()) == [("topic2", "ad"), ("topic2", "story")]
+    assert index.evictions == 6
+    index.rank(query, topic="topic1")
+    assert requested[-1] == "topic1"
+
+    assert index.increment_score("id1", 2.0)
+    assert dict((id, score) for id, _, _, score in index.rank(query, topic="topic1", top_k=100))["id1"] == 3.0
+    assert not index.increment_score("id2", 1.0)
+
+
+def test_partitions_load_from_snapshot_plus_newer_rows(collection, tmp_path, monkeypatch):
+    from embedding_codec import to_bson
+
+    rng = np.random.default_rng(5)
+    for i in range(12):
+        collection.insert_one({"topic": f"t{i % 2}", "type": "story", "output_text": f"text {i}",
+                               "embedding": to_bson(rng.normal(size=8)), "feedback_score": 0.0,
+                               "embedding_updated": "2026-01-01T00:00:00Z"})
+    embeddings_utils.write_embedding_snapshot(str(tmp_path))
+
+    collection.insert_one({"topic": "t0", "type": "ad", "output_text": "newer", "embedding": to_bson(rng.normal(size=8)),
+                           "feedback_score": 0.0, "embedding_updated": "2999-01-01T00:00:00Z"})
+    rescored = collection.find_one({"topic": "t0", "type": "story"})
+    collection.update_one({"_id": rescored["_id"]}, {"$set": {"feedback_score": 5.0}})
+
+    monkeypatch.setenv("EMBEDDING_SNAPSHOT_DIR", str(tmp_path))
+    index = embeddings_utils.build_context_index()
+    monkeypatch.setattr(embeddings_utils, "context_index", index)
+    query = rng.normal(size=8)
+    results = embeddings_utils.find_similar_generations(query, topic="t0", top_k=10, score_weight=1.0)
+
+    assert len(results) == 7 and results[0]["id"] == str(rescored["_id"])
+    assert "newer" in {r["output_text"] for r in results}
+    story = index._partitions[("t0", "story")]
+    assert isinstance(story.base.matrix, np.memmap) and len(story.delta) == 0
+    assert len(index._partitions[("t0", "ad")]) == 1
+
+
+def test_partitions_refresh_other_processes_writes(collection, monkeypatch):
+    from datetime import datetime
+    from embedding_codec import to_bson
+
+    rng = np.random.default_rng(9)
+    for i in range(6):
+        collection.insert_one({"topic": "t", "type": "story", "output_text": f"text {i}",
+                               "embedding": to_bson(rng.normal(size=8)), "feedback_score": 0.0,
+                               "embedding_updated": "2026-01-01T00:00:00Z"})
+    index = embeddings_utils.build_context_index()
+    assert index.refresh == 30.0
+    index.refresh = 60.0
+    monkeypatch.setattr(embeddings_utils, "context_index", index)
+    query = rng.normal(size=8)
+    assert len(embeddings_utils.find_similar_generations(query, topic="t", top_k=10)) == 6
+
+    # Another worker embeds a row and records feedback
+    collection.insert_one({"topic": "t", "type": "story", "output_text": "elsewhere",
+                           "embedding": to_bson(query), "feedback_score": 0.0,
+                           "embedding_updated": datetime.utcnow().isoformat() + "Z"})
+    rescored = collection.find_one({"output_text": "text 0"})
+    collection.update_one({"_id": rescored["_id"]}, {"$set": {"feedback_score": 4.0}})
+    assert len(embeddings_utils.find_similar_generations(query, topic="t", top_k=10)) == 6
+
+    index.refresh = 1e-9
+    results = embeddings_utils.find_similar_generations(query, topic="t", top_k=10, score_weight=1.0)
+    assert len(results) == 7 and index.refreshes == 1 and index.loads == 1
+    assert {r["output_text"]: r["feedback_score"] for r in results}["text 0"] == 4.0
+    assert results[1]["output_text"] == "elsewhere" and results[1]["similarity"] == pytest.approx(1.0)
@@ -0,0 +1,37 @@
+import pytest
+
+from feedback_scoring import FeedbackScorer
+
+
+@pytest.fixture
+def scorer():
+    return FeedbackScorer()
+
+
+def test_matches_whole_words_only(scorer):
+    assert scorer.score("great, I love it") == 1.0
+    assert scorer.score("unlikely to be goodish") == 0.0
+    assert scorer.score("I dislike it") == -0.5
+    assert scorer.score("GREAT great Great") == 0.5
+
+
+def test_negation_is_scoped_to_the_clause(scorer):
+    assert scorer.score("not good") == -0.5
+    assert scorer.score("this isn't bad at all") == 0.5
+    assert scorer.score("I didn’t like it") == -0.5
+    assert scorer.score("not long, but great") == 0.5
+
+
+def test_custom_lexicon_and_score_many():
+    scorer = FeedbackScorer({"on point": 1.0, "meh": -0.25})
+    assert scorer.score_many(["totally on   point", "meh", "not on point", "good"]) == [1.0, -0.25, -1.0, 0.0]
+
+
+def test_substring_scan_matches_the_regex_pass():
+    fast, regex = FeedbackScorer(), FeedbackScorer(substring_scan_max_terms=0)
+    texts = [
+        "not good", "good, not bad", "I didn't hate it but not great", "n't good", "wasn’t awful; love it",
+        "never, ever good", "no story is perfect but this is not poor", "hardly the worst, hardly great",
+        "good good not good", "like unlike dislike not_like", "it cannot be terrible! amazing",
+    ]
+    assert [fast.score(text) for text in texts] == [regex.score(text) for text in texts]
@@ -0,0 +1,694 @@
+import heapq
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from metrics import ROWS_SCANNED
+
+# Incremental refreshes re-read rows embedded this long before the previous
+# load started, so a write stamped just before it but landing after it is kept
+REFRESH_OVERLAP = 5.0
+
+
+def top_k_indices(values, k: int):
+    """
+    Return the indices of the k largest values, best first.
+    Uses argpartition so only the k winners are sorted.
+    """
+    n = len(values)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(-values, kind="stable")
+    candidates = np.argpartition(-values, k - 1)[:k]
+    return candidates[np.argsort(-values[candidates], kind="stable")]
+
+
+def normalize_rows(matrix):
+    """
+    L2-normalize each row in place; zero rows are left as zeros.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+class ScoreStats:
+    """
+    Running min / max / mean / variance of a multiset of scores, updated in
+    O(1) per insert or change. Min and max stay exact when the row holding
+    them changes: only then are they recomputed, over the distinct values.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self.count = 0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, score: float):
+        score = float(score)
+        self._counts[score] += 1
+        self.count += 1
+        self._sum += score
+        self._sum_sq += score * score
+        self.min = score if self.min is None else min(self.min, score)
+        self.max = score if self.max is None else max(self.max, score)
+
+    def add_many(self, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        if not len(scores):
+            return
+        values, counts = np.unique(scores, return_counts=True)
+        self._counts.update(dict(zip(values.tolist(), counts.tolist())))
+        self.count += len(scores)
+        self._sum += float(scores.sum())
+        self._sum_sq += float(np.square(scores).sum())
+        self.min = float(values[0]) if self.min is None else min(self.min, float(values[0]))
+        self.max = float(values[-1]) if self.max is None else max(self.max, float(values[-1]))
+
+    @classmethod
+    def combine(cls, *parts):
+        """
+        Statistics of the union of several multisets.
+        """
+        combined = cls()
+        for part in parts:
+            if not part.count:
+                continue
+            combined._counts.update(part._counts)
+            combined.count += part.count
+            combined._sum += part._sum
+            combined._sum_sq += part._sum_sq
+            combined.min = part.min if combined.min is None else min(combined.min, part.min)
+            combined.max = part.max if combined.max is None else max(combined.max, part.max)
+        return combined
+
+    def remove(self, score: float):
+        score = float(score)
+        self._counts[score] -= 1
+        if not self._counts[score]:
+            del self._counts[score]
+        self.count -= 1
+        self._sum -= score
+        self._sum_sq -= score * score
+        if not self.count:
+            self.clear()
+        elif score not in self._counts and score in (self.min, self.max):
+            self.min, self.max = min(self._counts), max(self._counts)
+
+    def update(self, old: float, new: float):
+        if float(old) != float(new):
+            self.remove(old)
+            self.add(new)
+
+    def clear(self):
+        self.__init__()
+
+    @property
+    def mean(self) -> float:
+        return self._sum / self.count if self.count else 0.0
+
+    @property
+    def variance(self) -> float:
+        if not self.count:
+            return 0.0
+        return max(self._sum_sq / self.count - self.mean ** 2, 0.0)
+
+    def normalize(self, scores, method: str = "minmax"):
+        """
+        Scale scores with the tracked statistics: "minmax" maps to [0, 1]
+        (0.5 everywhere when all scores are equal), "zscore" standardizes
+        (0 everywhere when there is no spread).
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        if method == "minmax":
+            if not self.count or self.max == self.min:
+                return np.full(len(scores), 0.5, dtype=np.float32)
+            return (scores - self.min) / (self.max - self.min)
+        if method == "zscore":
+            std = self.variance ** 0.5
+            if not self.count or std == 0:
+                return np.zeros(len(scores), dtype=np.float32)
+            return (scores - self.mean) / std
+        raise ValueError(f"Unknown score normalization: {method}")
+
+
+class VectorIndex:
+    """
+    Process-resident cosine index: a contiguous, pre-normalized float32
+    matrix of embeddings with a parallel id list and per-row score.
+    With an ann index (see ivf_index.IVFIndex) large indexes only score
+    the ANN candidates instead of every row. With a quantizer (see
+    quantization) the full scan runs over compact codes and only the best
+    top_k * quantizer.rerank rows are re-scored with the float32 vectors.
+    """
+
+    def __init__(self, dim: int = None, capacity: int = 1024, ann=None, quantizer=None):
+        self.dim = dim
+        self.ann = ann
+        self.quantizer = quantizer
+        self._rebuilding = None
+        self._capacity = capacity
+        self._matrix = None
+        self._scores = np.zeros(capacity, dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+        self.score_stats = ScoreStats()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_matrix(cls, ids, matrix, scores, ann=None, quantizer=None):
+        """
+        Wrap an existing pre-normalized matrix (e.g. a read-only np.memmap)
+        without copying it. Rows can be rescored but not added or replaced.
+        """
+        index = cls(dim=matrix.shape[1], capacity=len(ids), ann=ann, quantizer=quantizer)
+        index._matrix = matrix
+        if quantizer is not None:
+            quantizer.reserve(len(ids), matrix.shape[1])
+            for start in range(0, len(ids), 65536):
+                quantizer.encode(slice(start, start + 65536), matrix[start:start + 65536])
+        index._scores = np.array(scores, dtype=np.float32)
+        index._ids = list(ids)
+        index._rows = {id: row for row, id in enumerate(index._ids)}
+        index.score_stats.add_many(index._scores)
+        if ann is not None and ann.needs_rebuild(len(index)):
+            index.rebuild_ann()
+        return index
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, id):
+        return id in self._rows
+
+    @property
+    def ids(self):
+        return self._ids
+
+    @property
+    def matrix(self):
+        return self._matrix[:len(self._ids)] if self._matrix is not None else np.empty((0, self.dim or 0), dtype=np.float32)
+
+    @property
+    def scores(self):
+        return self._scores[:len(self._ids)]
+
+    @property
+    def nbytes(self) -> int:
+        matrix_bytes = self._matrix.nbytes if self._matrix is not None else 0
+        code_bytes = self.quantizer.nbytes if self.quantizer is not None else 0
+        return matrix_bytes + self._scores.nbytes + code_bytes
+
+    def _ensure_capacity(self, needed: int, dim: int):
+        if self._matrix is None:
+            self.dim = dim
+            self._capacity = max(self._capacity, needed)
+            self._matrix = np.zeros((self._capacity, dim), dtype=np.float32)
+            self._scores = np.zeros(self._capacity, dtype=np.float32)
+            if self.quantizer is not None:
+                self.quantizer.reserve(self._capacity, dim)
+            return
+        if dim != self.dim:
+            raise ValueError(f"Embedding dimension {dim} does not match index dimension {self.dim}")
+        if needed <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:len(self._ids)] = self._matrix[:len(self._ids)]
+        scores = np.zeros(capacity, dtype=np.float32)
+        scores[:len(self._ids)] = self._scores[:len(self._ids)]
+        self._matrix, self._scores, self._capacity = matrix, scores, capacity
+        if self.quantizer is not None:
+            self.quantizer.reserve(capacity, self.dim)
+
+    def add(self, id, vector, score: float = 0.0):
+        """
+        Add or replace a single embedding.
+        """
+        self.add_many([id], [vector], [score])
+
+    def add_many(self, ids, vectors, scores=None):
+        """
+        Add or replace a batch of embeddings in one copy.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) == 0:
+            return
+        vectors = normalize_rows(vectors.copy())
+        scores = np.zeros(len(ids), dtype=np.float32) if scores is None else np.asarray(scores, dtype=np.float32)
+        with self._lock:
+            self._ensure_capacity(len(self._ids) + len(ids), vectors.shape[1])
+            rows = []
+            for id, vector, score in zip(ids, vectors, scores):
+                row = self._rows.get(id)
+                if row is None:
+                    row = len(self._ids)
+                    self._ids.append(id)
+                    self._rows[id] = row
+                    self.score_stats.add(score)
+                else:
+                    self.score_stats.update(self._scores[row], score)
+                self._matrix[row] = vector
+                self._scores[row] = score
+                rows.append(row)
+            if self.quantizer is not None:
+                self.quantizer.encode(rows, vectors)
+            if self.ann is not None:
+                self.ann.add(rows, vectors)
+        if self.ann is not None and self.ann.needs_rebuild(len(self)):
+            self.rebuild_ann()
+
+    def rebuild_ann(self, background: bool = True):
+        """
+        Retrain the ANN index on the current rows, by default in a daemon
+        thread; queries keep using the previous build (or exact search)
+        until the new one is installed.
+        """
+        if self.ann is None:
+            return None
+        with self._lock:
+            running = self._rebuilding if self._rebuilding is not None and self._rebuilding.is_alive() else None
+            if running is None and background:
+                self._rebuilding = threading.Thread(target=self._rebuild_ann, name="ann-rebuild", daemon=True)
+                self._rebuilding.start()
+                return self._rebuilding
+        if running is not None:
+            if not background:
+                running.join()
+            return running
+        self._rebuild_ann()
+        return None
+
+    def _rebuild_ann(self):
+        # Rows are only appended (or rewritten in place), so this view stays valid
+        with self._lock:
+            matrix = self.matrix
+        if not len(matrix):
+            return
+        built = self.ann.build(matrix)
+        with self._lock:
+            self.ann.install(built, self.matrix)
+
+    def set_score(self, id, score: float):
+        """
+        Update the score stored for an indexed id. Returns False if unknown.
+        """
+        with self._lock:
+            row = self._rows.get(id)
+            if row is None:
+                return False
+            score = np.float32(score)
+            self.score_stats.update(self._scores[row], score)
+            self._scores[row] = score
+            return True
+
+    def increment_score(self, id, delta: float):
+        """
+        Add delta to the score stored for an indexed id. Returns False if unknown.
+        """
+        with self._lock:
+            row = self._rows.get(id)
+            if row is None:
+                return False
+            return self.set_score(id, self._scores[row] + delta)
+
+    def refresh_scores(self, rows):
+        """
+        Bring scores up to date from (id, score) pairs, touching only the
+        indexed rows whose score changed.
+        """
+        with self._lock:
+            for id, score in rows:
+                row = self._rows.get(id)
+                if row is not None and self._scores[row] != np.float32(score or 0.0):
+                    self.set_score(id, score or 0.0)
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+            self._scores = np.zeros(self._capacity, dtype=np.float32)
+            self._ids = []
+            self._rows = {}
+            self.score_stats.clear()
+            if self.ann is not None:
+                self.ann.reset()
+            if self.quantizer is not None:
+                self.quantizer.reset()
+
+    def similarities(self, query):
+        """
+        Cosine similarity of the query against every indexed row,
+        computed as one matrix-vector product.
+        """
+        with self._lock:
+            matrix = self.matrix
+        return self._similarities(matrix, query)
+
+    @staticmethod
+    def _similarities(matrix, query):
+        if not len(matrix):
+            return np.empty(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return np.zeros(len(matrix), dtype=np.float32)
+        return matrix @ (query / norm)
+
+    def search(self, query, top_k: int = 3):
+        """
+        Return [(id, similarity)] for the top-k most similar rows.
+        """
+        return [(id, sim) for id, _, sim, _ in self.rank(query, top_k)]
+
+    def rank(self, query, top_k: int = 3, sim_weight: float = 1.0, score_weight: float = 0.0,
+             normalization: str = None, exclude=()):
+        """
+        Rank rows by sim_weight * similarity + score_weight * score and
+        return [(id, combined, similarity, score)] for the top-k.
+        normalization ("minmax" or "zscore") rescales scores with the
+        incrementally maintained score_stats before blending.
+        """
+        return self.rank_many([query], top_k, sim_weight, score_weight, normalization, exclude)[0]
+
+    def rank_many(self, queries, top_k: int = 3, sim_weight: float = 1.0, score_weight: float = 0.0,
+                  normalization: str = None, exclude=(), score_stats: ScoreStats = None):
+        """
+        rank() for a stack of queries, scored with one matrix-matrix product.
+        Returns one result list per query. score_stats overrides the
+        statistics used for normalization (e.g. shared by several indexes).
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        with self._lock:
+            n = len(self._ids)
+            ids = self._ids
+            matrix = self.matrix
+            scores = self.scores.copy()
+            if normalization:
+                scores = (score_stats or self.score_stats).normalize(scores, normalization)
+            excluded = [self._rows[id] for id in exclude if self._rows.get(id, n) < n]
+            ann = self.ann if self.ann is not None and self.ann.trained else None
+            candidates = [ann.candidates(query) for query in queries] if ann is not None else None
+            quantizer = self.quantizer
+        if not n:
+            return [[] for _ in queries]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        if candidates is None and quantizer is not None:
+            # First pass over the compact codes, then exact re-ranking of the best rows
+            approximate = sim_weight * quantizer.similarities(queries / norms, n) + score_weight * scores
+            approximate[:, excluded] = -np.inf
+            candidates = [top_k_indices(row, top_k * quantizer.rerank) for row in approximate]
+            for _ in queries:
+                ROWS_SCANNED.observe(n, mode="quantized")
+        elif candidates is not None:
+            for rows in candidates:
+                ROWS_SCANNED.observe(len(rows), mode="ann")
+        if candidates is not None:
+            return [self._rank_rows(ids, matrix, scores, query, rows[rows < n], top_k, sim_weight, score_weight,
+                                    excluded)
+                    for query, rows in zip(queries / norms, candidates)]
+        for _ in queries:
+            ROWS_SCANNED.observe(n, mode="exact")
+        sims = (queries / norms) @ matrix.T
+        combined = sim_weight * sims + score_weight * scores
+        combined[:, excluded] = -np.inf
+        results = []
+        for row in range(len(queries)):
+            winners = [i for i in top_k_indices(combined[row], top_k) if combined[row, i] != -np.inf]
+            results.append([(ids[i], float(combined[row, i]), float(sims[row, i]), float(scores[i])) for i in winners])
+        return results
+
+    @staticmethod
+    def _rank_rows(ids, matrix, scores, query, rows, top_k, sim_weight, score_weight, excluded):
+        # Exact scoring restricted to the ANN candidate rows
+        sims = matrix[rows] @ query
+        combined = sim_weight * sims + score_weight * scores[rows]
+        combined[np.isin(rows, excluded)] = -np.inf
+        winners = [i for i in top_k_indices(combined, top_k) if combined[i] != -np.inf]
+        return [(ids[rows[i]], float(combined[i]), float(sims[i]), float(scores[rows[i]])) for i in winners]
+
+
+def _refresh_since() -> str:
+    """
+    The since bound for the next incremental refresh, in the format
+    embedding_updated is stamped with.
+    """
+    return (datetime.utcnow() - timedelta(seconds=REFRESH_OVERLAP)).isoformat() + "Z"
+
+
+class PartitionedVectorIndex:
+    """
+    One VectorIndex per partition key (topic, content type), so a
+    topic-filtered query only touches that topic's matrices and a global
+    query merges per-partition top-k results.
+
+    Partitions are loaded lazily a topic at a time through
+    load(topic) -> iterable of (key, id, vector, score) (topic None loads
+    everything). Least recently used partitions are evicted once the total
+    size passes max_bytes and reloaded on next use; with ttl > 0 a loaded
+    topic is reloaded in full after ttl seconds. With refresh > 0 a loaded
+    topic is instead brought up to date every refresh seconds: rows
+    embedded since its last load (load(topic, since=ISO-8601 time)) are
+    added or replaced, and load_scores(topic) -> (id, score) updates the
+    scores other processes changed. make_index(capacity=...) builds each
+    partition's VectorIndex (e.g. with an ANN index attached).
+
+    With snapshot_dir, partitions start from the memory-mapped snapshot
+    (see embedding_snapshot) and load(topic, since=...) only supplies rows
+    embedded after it was taken, and load_scores brings the snapshot's
+    scores up to date. A newly published snapshot is
+    picked up within snapshot_check seconds.
+    """
+
+    def __init__(self, load, max_bytes: int = 256 * 1024 * 1024, ttl: float = 0.0, make_index=VectorIndex,
+                 snapshot_dir: str = None, load_scores=None, snapshot_check: float = 30.0, refresh: float = 0.0):
+        self.load = load
+        self.make_index = make_index
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.refresh = refresh
+        self.snapshot_dir = snapshot_dir
+        self.load_scores = load_scores
+        self.snapshot_check = snapshot_check
+        self.loads = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self._partitions = OrderedDict()
+        self._keys = {}
+        self._loaded = {}
+        self._refreshed = {}
+        self._snapshot = None
+        self._snapshot_checked = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(partition.nbytes for partition in self._partitions.values())
+
+    def partitions(self):
+        with self._lock:
+            return list(self._partitions)
+
+    def _fresh(self, scope) -> bool:
+        loaded_at = self._loaded.get(scope)
+        return loaded_at is not None and (not self.ttl or time.monotonic() - loaded_at < self.ttl)
+
+    def _check_snapshot(self):
+        if not self.snapshot_dir:
+            return
+        now = time.monotonic()
+        if self._snapshot_checked is not None and now - self._snapshot_checked < self.snapshot_check:
+            return
+        from embedding_snapshot import current_version, open_snapshot
+        self._snapshot_checked = now
+        if current_version(self.snapshot_dir) != (self._snapshot.version if self._snapshot else None):
+            self._snapshot = open_snapshot(self.snapshot_dir)
+            # Every topic reloads lazily on top of the new snapshot
+            self._loaded.clear()
+
+    def _snapshot_partitions(self, topic):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {}, None
+        from embedding_snapshot import SnapshotVectorIndex
+        partitions = {}
+        for key in snapshot.keys(topic):
+            base = snapshot.partition(key)
+            if base is not None:
+                partitions[key] = SnapshotVectorIndex(self.make_index)
+                partitions[key].load_base(*base, version=snapshot.version)
+        return partitions, snapshot.manifest.get("since")
+
+    def _ensure_loaded(self, topic):
+        self._check_snapshot()
+        fresh = [scope for scope in dict.fromkeys((None, topic)) if self._fresh(scope)]
+        if fresh:
+            self._refresh_if_due(fresh[0])
+            return
+        since_load = _refresh_since()
+        partitions, since = self._snapshot_partitions(topic)
+        rows = self._group_rows(self.load(topic, since=since) if since else self.load(topic))
+        for key in [key for key in self._partitions if topic is None or key[0] == topic]:
+            self._drop(key)
+        for key, partition in partitions.items():
+            self._partitions[key] = partition
+            self._keys.update((id, key) for id in partition.ids)
+        self._add_rows(rows)
+        if partitions:
+            self._refresh_scores(topic, partitions)
+        self._loaded[topic] = time.monotonic()
+        self._refreshed[topic] = (self._loaded[topic], since_load)
+        self.loads += 1
+
+    def _refresh_if_due(self, scope):
+        refreshed_at, since = self._refreshed[scope]
+        if not self.refresh or time.monotonic() - refreshed_at < self.refresh:
+            return
+        since_refresh = _refresh_since()
+        self._add_rows(self._group_rows(self.load(scope, since=since)))
+        self._refresh_scores(scope, {key: partition for key, partition in self._partitions.items()
+                                     if scope is None or key[0] == scope})
+        self._refreshed[scope] = (time.monotonic(), since_refresh)
+        self.refreshes += 1
+
+    @staticmethod
+    def _group_rows(loaded):
+        rows = {}
+        for key, id, vector, score in loaded:
+            rows.setdefault(key, ([], [], []))
+            ids, vectors, scores = rows[key]
+            if vectors and len(vector) != len(vectors[0]):
+                continue
+            ids.append(id)
+            vectors.append(vector)
+            scores.append(score)
+        return rows
+
+    def _add_rows(self, rows):
+        for key, (ids, vectors, scores) in rows.items():
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = self.make_index(capacity=max(len(ids), 16))
+            partition.add_many(ids, vectors, scores)
+            self._keys.update((id, key) for id in ids)
+
+    def _refresh_scores(self, topic, partitions):
+        if self.load_scores is None:
+            return
+        scores = {}
+        for id, score in self.load_scores(topic):
+            scores.setdefault(self._keys.get(id), []).append((id, score))
+        for key, partition in partitions.items():
+            partition.refresh_scores(scores.get(key, ()))
+
+    def _drop(self, key):
+        partition = self._partitions.pop(key)
+        for id in partition.ids:
+            self._keys.pop(id, None)
+        # The topic (and everything) must be reloaded before it is complete again
+        self._loaded.pop(key[0], None)
+        self._loaded.pop(None, None)
+
+    def _evict(self, keep):
+        total = self.nbytes
+        for key in list(self._partitions):
+            if total <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            total -= self._partitions[key].nbytes
+            self._drop(key)
+            self.evictions += 1
+
+    def _scope(self, topic):
+        """
+        Load (if needed) and return the partitions a query over topic touches.
+        """
+        with self._lock:
+            self._ensure_loaded(topic)
+            keys = [key for key in self._partitions if topic is None or key[0] == topic]
+            for key in keys:
+                self._partitions.move_to_end(key)
+            partitions = [self._partitions[key] for key in keys]
+            self._evict(keep=set(keys))
+        return partitions
+
+    def add(self, key, id, vector, score: float = 0.0):
+        """
+        Add or replace one embedding. Ignored while its topic is not loaded:
+        the next query loads it from the store anyway.
+        """
+        self.add_many(key, [id], [vector], [score])
+
+    def add_many(self, key, ids, vectors, scores=None):
+        with self._lock:
+            if not (self._fresh(None) or self._fresh(key[0])):
+                return
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = self.make_index(capacity=16)
+            partition.add_many(ids, vectors, scores)
+            self._keys.update((id, key) for id in ids)
+            self._partitions.move_to_end(key)
+            self._evict(keep={key})
+
+    def increment_score(self, id, delta: float):
+        """
+        Apply a feedback score change to a loaded row. Returns False if the
+        row is not resident.
+        """
+        with self._lock:
+            key = self._keys.get(id)
+            partition = self._partitions.get(key) if key is not None else None
+        return partition is not None and partition.increment_score(id, delta)
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+            self._keys.clear()
+            self._loaded.clear()
+            self._refreshed.clear()
+
+    def rank(self, query, topic=None, top_k: int = 3, sim_weight: float = 1.0, score_weight: float = 0.0):
+        """
+        [(id, combined, similarity, score)] for the top-k rows in topic (or
+        in every partition when topic is None).
+        """
+        return self.rank_many([query], [topic], top_k, sim_weight, score_weight)[0]
+
+    def rank_many(self, queries, topics=None, top_k: int = 3, sim_weight: float = 1.0, score_weight: float = 0.0):
+        """
+        rank() for many queries. Queries sharing a topic are scored together
+        with one matrix product per partition; per-partition top-k lists are
+        merged with a heap.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        topics = list(topics) if topics is not None else [None] * len(queries)
+        groups = {}
+        for row, topic in enumerate(topics):
+            groups.setdefault(topic or None, []).append(row)
+
+        results = [[] for _ in queries]
+        for topic, rows in groups.items():
+            candidates = [[] for _ in rows]
+            for partition in self._scope(topic):
+                if partition.dim != queries.shape[1]:
+                    continue
+                for ranked, found in zip(candidates, partition.rank_many(queries[rows], top_k, sim_weight, score_weight)):
+                    ranked.extend(found)
+            for row, ranked in zip(rows, candidates):
+                results[row] = heapq.nlargest(top_k, ranked, key=lambda result: result[1])
+        return results
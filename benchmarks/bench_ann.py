@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: exact VectorIndex ranking vs the IVF approximate mode.
+Reports recall@k of the blended (similarity + feedback score) top-k and
+per-query latency for several nprobe settings, on clustered synthetic
+384-dim embeddings; no database needed.
+
+    python benchmarks/bench_ann.py --size 1000000 --nprobe 4 8 16 32
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from ivf_index import IVFIndex
+from vector_index import VectorIndex
+
+DIM = 384
+
+
+def clustered_corpus(rng, size, clusters):
+    centers = rng.normal(size=(clusters, DIM)).astype(np.float32)
+    vectors = np.empty((size, DIM), dtype=np.float32)
+    for start in range(0, size, 100_000):
+        end = min(size, start + 100_000)
+        vectors[start:end] = centers[rng.integers(0, clusters, end - start)]
+        vectors[start:end] += rng.normal(scale=2.0, size=(end - start, DIM)).astype(np.float32)
+    return vectors
+
+
+def timed_ranks(index, queries, args):
+    started = time.perf_counter()
+    ranks = [index.rank(query, args.top_k, args.sim_weight, args.score_weight, normalization="minmax")
+             for query in queries]
+    return ranks, (time.perf_counter() - started) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--clusters", type=int, default=500, help="topic clusters in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--lists", type=int, default=0, help="IVF lists (0 = sqrt(size))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--sim-weight", type=float, default=0.7)
+    parser.add_argument("--score-weight", type=float, default=0.3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = clustered_corpus(rng, args.size, args.clusters)
+    scores = rng.integers(-4, 9, size=args.size).astype(np.float32)
+    queries = vectors[rng.choice(args.size, args.queries, replace=False)] + \
+        rng.normal(scale=1.0, size=(args.queries, DIM)).astype(np.float32)
+    ids = list(range(args.size))
+
+    exact = VectorIndex(capacity=args.size)
+    exact.add_many(ids, vectors, scores)
+    expected, exact_ms = timed_ranks(exact, queries, args)
+
+    ann = VectorIndex(capacity=args.size, ann=IVFIndex(n_lists=args.lists, min_rows=args.size + 1))
+    ann.add_many(ids, vectors, scores)
+    started = time.perf_counter()
+    ann.ann.min_rows = 0
+    ann.rebuild_ann(background=False)
+    build_s = time.perf_counter() - started
+    print(f"{args.size} rows, {len(ann.ann.centroids)} lists, IVF build {build_s:.1f}s")
+    print(f"{'mode':>10} {'ms/query':>9} {'recall@k':>9} {'speedup':>8}")
+    print(f"{'exact':>10} {exact_ms:>9.2f} {1.0:>9.3f} {'1.0x':>8}")
+    for nprobe in args.nprobe:
+        ann.ann.nprobe = nprobe
+        found, ms = timed_ranks(ann, queries, args)
+        recall = np.mean([len({r[0] for r in e} & {r[0] for r in f}) / max(len(e), 1)
+                          for e, f in zip(expected, found)])
+        print(f"{'nprobe=' + str(nprobe):>10} {ms:>9.2f} {recall:>9.3f} {exact_ms / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Throughput of the embedding backends (PyTorch vs ONNX fp32 vs ONNX int8)
+at batch sizes 1, 8 and 64, plus cosine agreement with the PyTorch output.
+
+    python benchmarks/bench_backends.py --backends torch onnx-int8 --texts 256
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from embedding_backends import load_backend
+from embedding_provider import MODEL_NAME
+
+
+def sample_texts(n):
+    kinds = ["story", "ad script", "podcast script"]
+    return [f"Generated {kinds[i % 3]} for topic 'topic {i % 17}' with goal 'goal number {i}'." for i in range(n)]
+
+
+def throughput(backend, texts, batch_size):
+    backend.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        backend.encode(texts[start:start + batch_size], batch_size=batch_size)
+    return len(texts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--model", default=MODEL_NAME)
+    args = parser.parse_args()
+
+    texts = sample_texts(args.texts)
+    reference = None
+    print(f"{'backend':>10} " + " ".join(f"{'bs=' + str(b) + ' txt/s':>14}" for b in args.batch_sizes) + f" {'min cos':>9}")
+    for name in args.backends:
+        backend = load_backend(args.model, name)
+        embeddings = np.asarray(backend.encode(texts, batch_size=64))
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        if reference is None:
+            reference = embeddings
+        agreement = (embeddings * reference).sum(axis=1).min()
+        rates = [throughput(backend, texts, batch_size) for batch_size in args.batch_sizes]
+        print(f"{name:>10} " + " ".join(f"{rate:>14.1f}" for rate in rates) + f" {agreement:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-keyword substring loop vs the compiled FeedbackScorer
+on short and long synthetic feedback texts and growing lexicons. The loop
+makes one pass per keyword, the scorer one pass per text.
+
+    python benchmarks/bench_feedback_scoring.py --lengths 10 1000 100000 --lexicon-sizes 16 200 2000
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from feedback_scoring import DEFAULT_LEXICON, FeedbackScorer
+
+FILLER = ["the", "story", "was", "quite", "long", "and", "the", "pacing", "felt", "uneven", "overall", "script"]
+KEYWORDS = ["good", "great", "awful", "like", "not", "poor", "love", "worst"]
+
+
+def legacy_score(feedback, positive_keywords, negative_keywords):
+    # Previous update_feedback implementation, kept here as the baseline
+    feedback_lower = feedback.lower()
+    score_change = 0
+    for word in positive_keywords:
+        if word in feedback_lower:
+            score_change += 0.5
+    for word in negative_keywords:
+        if word in feedback_lower:
+            score_change -= 0.5
+    return score_change
+
+
+def make_feedback(rng, words):
+    return " ".join(rng.choice(KEYWORDS) if rng.random() < 0.05 else rng.choice(FILLER) for _ in range(words))
+
+
+def make_lexicon(rng, size):
+    lexicon = dict(DEFAULT_LEXICON)
+    while len(lexicon) < size:
+        term = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+        lexicon[term] = rng.choice([0.5, -0.5])
+    return lexicon
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 1000, 100_000],
+                        help="words per feedback text")
+    parser.add_argument("--lexicon-sizes", type=int, nargs="+", default=[16, 200, 2000])
+    parser.add_argument("--total-words", type=int, default=1_000_000,
+                        help="words scored per run (count = total / length)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'lexicon':>8} {'words':>8} {'texts':>7} {'legacy (s)':>11} {'scorer (s)':>11} {'speedup':>8}")
+    for size in args.lexicon_sizes:
+        lexicon = make_lexicon(rng, size)
+        positive = [term for term, weight in lexicon.items() if weight > 0]
+        negative = [term for term, weight in lexicon.items() if weight < 0]
+        scorer = FeedbackScorer(lexicon)
+        for length in args.lengths:
+            texts = [make_feedback(rng, length) for _ in range(max(1, args.total_words // length))]
+            legacy = timed(lambda: [legacy_score(text, positive, negative) for text in texts])
+            fast = timed(scorer.score_many, texts)
+            print(f"{size:>8} {length:>8} {len(texts):>7} {legacy:>11.4f} {fast:>11.4f} {legacy / fast:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
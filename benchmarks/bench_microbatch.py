@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Load test for the micro-batching embedding scheduler: requests/sec and
+latency percentiles for concurrent single-text encodes at several batch
+window sizes, against direct per-request encoding.
+
+    python benchmarks/bench_microbatch.py --threads 1 16 --windows 0 1 2 5 10
+    python benchmarks/bench_microbatch.py --synthetic   # no model needed
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from embedding_scheduler import EmbeddingScheduler
+
+
+class SyntheticEncoder:
+    """
+    Stand-in with a fixed per-call overhead plus a small per-text cost,
+    holding a lock like a single inference engine would.
+    """
+
+    def __init__(self, call_ms=8.0, text_ms=0.5, dim=384):
+        self.call = call_ms / 1000.0
+        self.per_text = text_ms / 1000.0
+        self.dim = dim
+        self._lock = threading.Lock()
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        with self._lock:
+            time.sleep(self.call + self.per_text * len(texts))
+        out = np.ones((len(texts), self.dim), dtype=np.float32)
+        return out[0] if single else out
+
+
+def run_load(encode_one, threads, duration):
+    latencies = []
+    stop = time.perf_counter() + duration
+    lock = threading.Lock()
+
+    def client(worker):
+        i = 0
+        local = []
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            encode_one(f"Generated story for topic 'load {worker}' with goal 'request {i}'.")
+            local.append(time.perf_counter() - started)
+            i += 1
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=client, args=(w,)) for w in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 1, 2, 5, 10])
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--synthetic", action="store_true", help="use a simulated encoder instead of the model")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        model = SyntheticEncoder()
+    else:
+        from embedding_backends import load_backend
+        from embedding_provider import MODEL_NAME
+        model = load_backend(MODEL_NAME)
+
+    def encode_batch(texts):
+        return model.encode(texts, batch_size=len(texts))
+
+    print(f"{'threads':>7} {'window':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>11}")
+    for threads in args.threads:
+        rate, p50, p99 = run_load(model.encode, threads, args.duration)
+        print(f"{threads:>7} {'direct':>8} {rate:>9.1f} {p50:>8.2f} {p99:>8.2f} {1.0:>11.1f}")
+        for window in args.windows:
+            scheduler = EmbeddingScheduler(encode_batch, window_ms=window, max_batch=args.max_batch)
+            rate, p50, p99 = run_load(scheduler.encode, threads, args.duration)
+            scheduler.close()
+            print(f"{threads:>7} {window:>6.1f}ms {rate:>9.1f} {p50:>8.2f} {p99:>8.2f} {scheduler.mean_batch_size:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
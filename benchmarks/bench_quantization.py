@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full-precision scan vs the int8 and binary quantized scans
+(VECTOR_QUANTIZATION), each re-ranked at full precision. Reports query
+latency, code size and recall@k against the exact float32 ranking on
+random 384-dim embeddings; no MongoDB needed.
+
+    python benchmarks/bench_quantization.py --sizes 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from quantization import BinaryQuantizer, Int8Quantizer
+from vector_index import VectorIndex
+
+DIM = 384
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def recall(expected, found):
+    hits = sum(len({id for id, *_ in a} & {id for id, *_ in b}) for a, b in zip(expected, found))
+    return hits / sum(len(a) for a in expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--score-weight", type=float, default=0.1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'docs':>10} {'mode':>8} {'ms/query':>10} {'code MB':>9} {'recall':>8}")
+    for size in args.sizes:
+        # Clustered rows so neighbours are meaningfully closer than the rest
+        centers = rng.normal(size=(max(1, size // 100), DIM)).astype(np.float32)
+        matrix = centers[rng.integers(0, len(centers), size)] + rng.normal(scale=0.6, size=(size, DIM)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        scores = rng.integers(-4, 5, size=size).astype(np.float32) * 0.5
+        queries = matrix[rng.choice(size, args.queries, replace=False)] + rng.normal(scale=0.3, size=(args.queries, DIM)).astype(np.float32)
+
+        expected = None
+        for quantizer in (None, Int8Quantizer(), BinaryQuantizer()):
+            index = VectorIndex.from_matrix(list(range(size)), matrix, scores, quantizer=quantizer)
+            elapsed, found = timed(index.rank_many, queries, args.top_k, 1.0, args.score_weight)
+            if expected is None:
+                expected = found
+            name = quantizer.name if quantizer is not None else "float32"
+            code_mb = (quantizer.nbytes if quantizer is not None else index._matrix.nbytes) / 1e6
+            print(f"{size:>10} {name:>8} {elapsed * 1000 / args.queries:>10.2f} {code_mb:>9.1f} {recall(expected, found):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
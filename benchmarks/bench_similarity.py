@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-document cosine loop vs VectorIndex.rank, the
+batched top-k scoring the app serves from. Runs entirely in memory on
+random 384-dim embeddings; no MongoDB needed.
+
+    python benchmarks/bench_similarity.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from vector_index import VectorIndex
+
+DIM = 384
+
+
+def cosine_similarity(vec1, vec2):
+    # Previous per-document implementation, kept here as the baseline
+    vec1 = np.array(vec1)
+    vec2 = np.array(vec2)
+    norm1 = np.linalg.norm(vec1)
+    norm2 = np.linalg.norm(vec2)
+    if norm1 == 0 or norm2 == 0:
+        return 0.0
+    return np.dot(vec1, vec2) / (norm1 * norm2)
+
+
+def legacy_top_k(query, embeddings, feedback_scores, score_weight, top_k):
+    similarities = []
+    for i, embedding in enumerate(embeddings):
+        sim = cosine_similarity(query, embedding)
+        score = feedback_scores[i]
+        similarities.append({"id": i, "similarity": sim, "feedback_score": score,
+                             "combined_score": sim + score * score_weight})
+    similarities.sort(key=lambda x: x["combined_score"], reverse=True)
+    return similarities[:top_k]
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--score-weight", type=float, default=0.1)
+    parser.add_argument("--skip-legacy-above", type=int, default=1_000_000,
+                        help="skip the slow baseline for corpora larger than this")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    query = rng.normal(size=DIM).astype(np.float32)
+    print(f"{'docs':>10} {'legacy (s)':>12} {'batched (s)':>12} {'speedup':>9}")
+    for size in args.sizes:
+        matrix = rng.normal(size=(size, DIM)).astype(np.float32)
+        feedback_scores = rng.integers(-4, 5, size=size).astype(np.float32) * 0.5
+        index = VectorIndex(dim=DIM, capacity=size)
+        index.add_many(range(size), matrix, feedback_scores)
+        batched, fast = timed(index.rank, query, args.top_k, 1.0, args.score_weight)
+        if size <= args.skip_legacy_above:
+            legacy, slow = timed(legacy_top_k, query, matrix, feedback_scores, args.score_weight, args.top_k, repeat=1)
+            assert [d["id"] for d in slow] == [id for id, _, _, _ in fast]
+            print(f"{size:>10} {legacy:>12.4f} {batched:>12.4f} {legacy / batched:>8.1f}x")
+        else:
+            print(f"{size:>10} {'-':>12} {batched:>12.4f} {'-':>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Write throughput of the root app's SQLite store under concurrent
+requests: /generate-style inserts mixed with /feedback-style score
+updates, each committed per request (default rollback journal, then WAL
+with the tuned pragmas) or through the group-commit writer at several
+window sizes.
+
+    python benchmarks/bench_sqlite_writes.py --threads 1 8 32 --windows 1 2 5
+    python benchmarks/bench_sqlite_writes.py --update-ratio 0.5 --duration 5
+    python benchmarks/bench_sqlite_writes.py --synchronous FULL   # fsync per commit
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'backend'))
+# Importing the app must not touch a real database or load the model
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+os.environ.setdefault('EMBEDDING_WARMUP', 'off')
+
+from sqlalchemy import create_engine
+from app import add_to_score, insert_generation_row
+from models import Generation
+from storage import SQLITE_PRAGMAS, GroupCommitWriter, apply_sqlite_pragmas, engine_options
+
+DIM = 384
+
+
+def make_engine(path, profile, synchronous):
+    uri = f"sqlite:///{path}"
+    # The default profile still needs a pool and lock timeout that survive N threads
+    options = engine_options(uri, "concurrent", pool_size=64, max_overflow=64)
+    engine = create_engine(uri, **options)
+    if profile == "concurrent":
+        apply_sqlite_pragmas(engine, {**SQLITE_PRAGMAS, "synchronous": synchronous})
+    Generation.__table__.create(engine)
+    return engine
+
+
+def seed(engine, rows):
+    vector = np.ones(DIM, dtype=np.float32)
+    with engine.begin() as connection:
+        return [insert_generation_row(connection, f"seed {i}", vector) for i in range(rows)]
+
+
+def run_load(write, ids, threads, duration, update_ratio):
+    latencies = []
+    stop = time.perf_counter() + duration
+    lock = threading.Lock()
+
+    def client(worker):
+        rng = random.Random(worker)
+        vector = np.ones(DIM, dtype=np.float32)
+        local = []
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            if rng.random() < update_ratio:
+                write(add_to_score, rng.choice(ids), 1.0)
+            else:
+                write(insert_generation_row, f"Generated story {worker}-{len(local)}", vector)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=client, args=(w,)) for w in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def per_request(engine):
+    def write(fn, *args):
+        with engine.begin() as connection:
+            return fn(connection, *args)
+    return write
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--windows", type=float, nargs="+", default=[1, 2, 5])
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--update-ratio", type=float, default=0.3, help="share of writes that are score updates")
+    parser.add_argument("--seed-rows", type=int, default=1000)
+    parser.add_argument("--synchronous", default=SQLITE_PRAGMAS["synchronous"], choices=["NORMAL", "FULL"],
+                        help="WAL sync mode; FULL fsyncs every commit, which group commit amortizes")
+    args = parser.parse_args()
+
+    print(f"{'threads':>7} {'mode':>22} {'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>11}")
+    for threads in args.threads:
+        runs = [("journal, per-request", "default", None), ("wal, per-request", "concurrent", None)]
+        runs += [(f"wal, group {window:g}ms", "concurrent", window) for window in args.windows]
+        for label, profile, window in runs:
+            with tempfile.TemporaryDirectory() as directory:
+                engine = make_engine(os.path.join(directory, "bench.db"), profile, args.synchronous)
+                ids = seed(engine, args.seed_rows)
+                writer = None
+                if window is not None:
+                    writer = GroupCommitWriter(engine, window_ms=window, max_batch=args.max_batch)
+                write = writer.execute if writer is not None else per_request(engine)
+                rate, p50, p99 = run_load(write, ids, threads, args.duration, args.update_ratio)
+                batch = 1.0
+                if writer is not None:
+                    writer.close()
+                    batch = writer.mean_batch_size
+                engine.dispose()
+            print(f"{threads:>7} {label:>22} {rate:>9.1f} {p50:>8.2f} {p99:>8.2f} {batch:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Measures import-to-first-response time for the root app in a fresh
+interpreter: lazy model loading (default) vs eager loading at import.
+
+    python benchmarks/bench_startup.py --route /history --runs 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get({route!r})
+finished = time.perf_counter()
+print(json.dumps({{"status": response.status_code, "import": imported - started, "first_response": finished - started}}))
+"""
+
+
+def measure(route, warmup_mode):
+    env = dict(os.environ, EMBEDDING_WARMUP=warmup_mode, DATABASE_URL="sqlite:///:memory:")
+    output = subprocess.run([sys.executable, "-c", PROBE.format(route=route)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--route", default="/history")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} {'import (s)':>11} {'first response (s)':>19}")
+    for mode in ("off", "eager"):
+        runs = [measure(args.route, mode) for _ in range(args.runs)]
+        best = min(runs, key=lambda r: r["first_response"])
+        print(f"{mode:>8} {best['import']:>11.3f} {best['first_response']:>19.3f}")
+
+
+if __name__ == "__main__":
+    main()
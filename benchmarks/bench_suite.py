@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark suite for the MongoDB backend, fully offline.
+db_utils / embeddings_utils run against an in-process mongomock database
+seeded with a synthetic corpus (random unit embeddings, Zipf-skewed
+topics). A deterministic random encoder stands in for the model, so only
+service, database and index code is timed.
+
+For each corpus size it times /generate, /feedback, /history, the
+embedding backfill and similarity search (cold index load, topic-filtered,
+global and batched). The results are written as JSON. --compare prints the
+change in p50 against an earlier run, e.g. one from the previous commit.
+
+    pip install mongomock
+    python benchmarks/bench_suite.py --sizes 1000 100000 1000000 --output before.json
+    python benchmarks/bench_suite.py --sizes 1000 100000 --compare before.json
+
+mongomock has no indexes and scans the collection for every filter,
+_id lookups included, so /feedback and /history grow with the corpus
+where MongoDB would not. Compare them across commits, not against
+production. The 1M-row corpus needs several GB of RAM, because mongomock
+keeps every document as a Python dict.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND_DIR = os.path.join(ROOT, 'backend')
+sys.path.append(BACKEND_DIR)
+
+# No background compaction or model warm-up while timing
+os.environ.setdefault("FEEDBACK_COMPACT_INTERVAL", "0")
+os.environ.setdefault("EMBEDDING_WARMUP", "off")
+
+DIM = 384
+TYPES = ("story", "ad", "podcast")
+FEEDBACK = ("great, I love it", "not good", "boring", "excellent and perfect", "didn't like the ending")
+
+
+class SyntheticEncoder:
+    """
+    Random unit vector per text, seeded by a hash of the text, so repeated
+    texts embed identically (and hit the embedding cache) like a real model.
+    """
+
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+
+    def _one(self, text):
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        if isinstance(texts, str):
+            return self._one(texts)
+        texts = list(texts)
+        return np.stack([self._one(text) for text in texts]) if texts else np.empty((0, self.dim), np.float32)
+
+
+def use_database(db):
+    """
+    Serve db to every db helper through the shared client.
+    """
+    import db_utils
+    import embeddings_utils
+    from mongo_client import mongo
+
+    mongo.use(db)
+    db_utils.ensure_indexes()
+    embeddings_utils.context_index.clear()
+
+
+def build_corpus(db, size, topics, rng, chunk=10000):
+    """
+    Insert `size` synthetic generations with embeddings and feedback
+    scores. Topics follow a Zipf-like skew, like real traffic. Returns a
+    sample of the inserted ids and the topic names.
+    """
+    from embedding_codec import to_bson
+
+    names = [f"topic-{i}" for i in range(topics)]
+    weights = 1.0 / np.arange(1, topics + 1)
+    weights /= weights.sum()
+    iterations = np.zeros(topics, dtype=np.int64)
+    started = datetime(2024, 1, 1)
+    sample = []
+    for begin in range(0, size, chunk):
+        count = min(chunk, size - begin)
+        vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        topic_ids = rng.choice(topics, count, p=weights)
+        scores = rng.integers(-2, 5, count) * 0.5
+        docs = []
+        for i in range(count):
+            topic = topic_ids[i]
+            iterations[topic] += 1
+            timestamp = (started + timedelta(seconds=begin + i)).isoformat() + "Z"
+            docs.append({
+                "topic": names[topic],
+                "goal": "inform",
+                "type": TYPES[(begin + i) % len(TYPES)],
+                "output_text": f"Synthetic generation {begin + i} about {names[topic]}.",
+                "tokens_used": 12,
+                "iteration": int(iterations[topic]),
+                "timestamp": timestamp,
+                "feedback_score": float(scores[i]),
+                "embedding": to_bson(vectors[i]),
+                "embedding_updated": timestamp,
+            })
+        inserted = db["generations"].insert_many(docs).inserted_ids
+        sample.extend(str(inserted_id) for inserted_id in inserted[:max(1, 1000 * count // size)])
+    db["counters"].insert_many([{"_id": name, "seq": int(seq)} for name, seq in zip(names, iterations) if seq])
+    return sample, names
+
+
+def summarize(seconds):
+    seconds = np.asarray(seconds, dtype=np.float64) * 1000
+    return {
+        "count": int(len(seconds)),
+        "mean_ms": round(float(seconds.mean()), 4),
+        "p50_ms": round(float(np.percentile(seconds, 50)), 4),
+        "p95_ms": round(float(np.percentile(seconds, 95)), 4),
+        "p99_ms": round(float(np.percentile(seconds, 99)), 4),
+        "total_s": round(float(seconds.sum() / 1000), 4),
+    }
+
+
+def timed(fn, calls):
+    """
+    Run fn(i) for i in range(calls), returning per-call seconds.
+    """
+    durations = []
+    for i in range(calls):
+        started = time.perf_counter()
+        fn(i)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def bench_size(backend_app, size, args):
+    import mongomock
+    import embeddings_utils
+    from metrics import REGISTRY, STAGE_SECONDS, QUANTILES
+
+    rng = np.random.default_rng(args.seed)
+    db = mongomock.MongoClient()["creatorcore"]
+    use_database(db)
+    if embeddings_utils.provider.cache is not None:
+        embeddings_utils.provider.cache.clear()
+
+    results = {}
+    started = time.perf_counter()
+    ids, topics = build_corpus(db, size, args.topics, rng)
+    results["load_corpus"] = {"rows": size, "total_s": round(time.perf_counter() - started, 4)}
+
+    client = backend_app.app.test_client()
+    queries = rng.standard_normal((args.requests, DIM)).astype(np.float32)
+    hot_topic = topics[0]
+
+    # Similarity search: the first query loads the partitions, later ones hit the index
+    results["similarity_cold_topic"] = summarize(timed(
+        lambda i: embeddings_utils.find_similar_generations(queries[0], topic=hot_topic, top_k=3, score_weight=0.1), 1))
+    results["similarity_cold_global"] = summarize(timed(
+        lambda i: embeddings_utils.find_similar_generations(queries[0], top_k=3, score_weight=0.1), 1))
+    results["similarity_topic"] = summarize(timed(
+        lambda i: embeddings_utils.find_similar_generations(queries[i], topic=hot_topic, top_k=3, score_weight=0.1),
+        args.requests))
+    results["similarity_global"] = summarize(timed(
+        lambda i: embeddings_utils.find_similar_generations(queries[i], top_k=3, score_weight=0.1), args.requests))
+    batch = min(32, args.requests)
+    durations = timed(lambda i: embeddings_utils.find_similar_generations_batch(
+        queries[i * batch:(i + 1) * batch], topics=[hot_topic] * batch, top_k=3, score_weight=0.1),
+        max(1, args.requests // batch))
+    results["similarity_batch_per_query"] = summarize([d / batch for d in durations])
+
+    REGISTRY.clear()
+    request_topics = rng.choice(topics[:10], args.requests)
+    results["generate"] = summarize(timed(lambda i: client.post("/generate", json={
+        "topic": str(request_topics[i]), "goal": f"goal {i}", "type": TYPES[i % len(TYPES)]}), args.requests))
+    results["generate_stages"] = {
+        stage: {f"p{int(q * 100)}_ms": round(STAGE_SECONDS.quantile(q, stage=stage) * 1000, 4) for q in QUANTILES}
+        for stage in ("mock_generate_with_gemini", "insert_generation", "generate_embedding", "store_embedding",
+                      "find_similar_generations")
+        if STAGE_SECONDS.count(stage=stage)
+    }
+
+    feedback_ids = rng.choice(ids, args.requests)
+    results["feedback"] = summarize(timed(lambda i: client.post("/feedback", json={
+        "id": str(feedback_ids[i]), "feedback": FEEDBACK[i % len(FEEDBACK)]}), args.requests))
+    results["history_latest"] = summarize(timed(lambda i: client.get(f"/history/{request_topics[i]}"),
+                                                args.requests))
+    results["history_page"] = summarize(timed(lambda i: client.get(f"/history/{request_topics[i]}?limit=20"),
+                                              args.requests))
+
+    # Backfill: generations stored without embeddings, then embedded in bulk
+    rows = min(args.backfill_rows, size)
+    db["generations"].insert_many([{"topic": topics[i % len(topics)], "goal": "backfill", "type": "story",
+                                    "output_text": f"Backfill candidate {i}", "iteration": 0,
+                                    "timestamp": "2023-01-01T00:00:00Z"} for i in range(rows)])
+    started = time.perf_counter()
+    embeddings_utils.backfill_embeddings(batch_size=256)
+    elapsed = time.perf_counter() - started
+    results["backfill"] = {"rows": rows, "total_s": round(elapsed, 4), "rows_per_s": round(rows / elapsed, 1)}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    for size, benches in results.items():
+        print(f"\n{size} rows")
+        print(f"{'benchmark':>28} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'vs prev':>9}")
+        for name, stats in benches.items():
+            if "p50_ms" not in stats:
+                continue
+            change = ""
+            old = (previous or {}).get(size, {}).get(name, {}).get("p50_ms")
+            if old:
+                change = f"{stats['p50_ms'] / old:>8.2f}x"
+            print(f"{name:>28} {stats['p50_ms']:>10.3f} {stats['p95_ms']:>10.3f} {stats['p99_ms']:>10.3f} {change:>9}")
+        if "backfill" in benches:
+            print(f"{'backfill':>28} {benches['backfill']['rows_per_s']:>10.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100_000, 1_000_000])
+    parser.add_argument("--requests", type=int, default=100, help="timed calls per endpoint / query type")
+    parser.add_argument("--topics", type=int, default=100)
+    parser.add_argument("--backfill-rows", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="JSON results path (default bench-<commit>.json)")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results to compare p50 latencies against")
+    args = parser.parse_args()
+
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("bench_suite needs mongomock as the in-process MongoDB stand-in: pip install mongomock")
+
+    # Model-free embeddings: the provider loads the synthetic encoder instead of a model
+    from app_loader import load_backend_app
+    from embedding_provider import provider
+    provider._loader = lambda model_name: SyntheticEncoder(DIM)
+    backend_app = load_backend_app()
+
+    results = {}
+    for size in args.sizes:
+        print(f"Benchmarking {size} rows...", flush=True)
+        results[str(size)] = bench_size(backend_app, size, args)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    output = args.output or f"bench-{commit or 'local'}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)["results"]
+    print_results(results, previous)
+    print(f"\nWrote {output}")
+
+
+if __name__ == "__main__":
+    main()
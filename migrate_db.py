@@ -1,32 +1,56 @@
 #!/usr/bin/env python3
 """
 Migration script for CreatorCore database.
-Backfills embeddings for existing generations that don't have them.
+Seeds per-topic iteration counters, converts stored embeddings to binary
+float32 and backfills embeddings for existing generations that don't have them.
+With --snapshot, also writes a memory-mapped embedding snapshot for the
+server processes (EMBEDDING_SNAPSHOT_DIR).
 Run this script after deploying the new embeddings functionality.
 """
 
+import argparse
 import os
-from pymongo import MongoClient
-from embeddings_utils import generate_embedding, backfill_embeddings
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from embeddings_utils import backfill_embeddings, convert_legacy_embeddings, write_embedding_snapshot
+from db_utils import seed_iteration_counters
+from mongo_client import mongo
 
 def main():
+    parser = argparse.ArgumentParser(description="Migrate and backfill CreatorCore embeddings")
+    parser.add_argument("--batch-size", type=int, default=256, help="documents per bulk write")
+    parser.add_argument("--encode-batch-size", type=int, default=64, help="texts per model.encode call")
+    parser.add_argument("--workers", type=int, default=0, help="encoder processes (0 = in-process)")
+    parser.add_argument("--checkpoint", default="mongo_backfill_checkpoint.json", help="resume file for the backfill")
+    parser.add_argument("--snapshot", metavar="DIR", help="write an embedding snapshot to DIR afterwards")
+    args = parser.parse_args()
+
     print("Starting CreatorCore database migration...")
 
-    # Check MongoDB connection
-    MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-    try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        db = client["creatorcore"]
-        client.admin.command('ping')
-        print("✓ Connected to MongoDB")
-    except Exception as e:
-        print(f"✗ Failed to connect to MongoDB: {e}")
+    # Check MongoDB connection (the same shared client the helpers use)
+    if mongo.database() is None:
+        print("✗ Failed to connect to MongoDB")
         print("Running in mock mode - no actual migration performed")
         return
+    print("✓ Connected to MongoDB")
+
+    # Numeric iterations + atomic per-topic counters
+    print("Seeding per-topic iteration counters...")
+    seed_iteration_counters()
+
+    # Convert list embeddings to the compact binary format
+    print("Converting stored embeddings to binary float32...")
+    convert_legacy_embeddings()
 
     # Run backfill
     print("Backfilling embeddings for existing generations...")
-    backfill_embeddings()
+    backfill_embeddings(batch_size=args.batch_size, encode_batch_size=args.encode_batch_size,
+                        workers=args.workers, checkpoint_path=args.checkpoint)
+
+    if args.snapshot:
+        print(f"Writing embedding snapshot to {args.snapshot}...")
+        write_embedding_snapshot(args.snapshot)
 
     print("Migration completed successfully!")
 
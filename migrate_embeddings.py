@@ -1,15 +1,107 @@
-from app import app, db, model, Generation
+import argparse
+import os
+from sqlalchemy import text, update
+from app import app, db, Generation
+from embedding_provider import provider
+from embedding_codec import encode_embedding, decode_embedding
+from backfill import Checkpoint, run_backfill
+from embedding_snapshot import SnapshotWriter
+
+def _rows_without_embedding(batch_size, after_id=None):
+    """
+    Stream (id, text) for rows missing an embedding, one keyset page at a time.
+    """
+    last_id = after_id or 0
+    while True:
+        rows = db.session.query(Generation.id, Generation.text) \
+            .filter(Generation.embedding.is_(None), Generation.id > last_id) \
+            .order_by(Generation.id).limit(batch_size).all()
+        if not rows:
+            return
+        for row in rows:
+            yield row.id, row.text
+        last_id = rows[-1].id
+
+def backfill_missing_embeddings(batch_size=256, encode_batch_size=64, workers=0, checkpoint_path=None):
+    """
+    Generate embeddings for generations that don't have one yet.
+    Each batch is written with one executemany UPDATE and committed, so an
+    interrupted run resumes from the last committed batch.
+    """
+    checkpoint = Checkpoint(checkpoint_path, source="sqlite")
+
+    def write(ids, embeddings):
+        db.session.execute(update(Generation), [{"id": gen_id, "embedding": embedding}
+                                                for gen_id, embedding in zip(ids, embeddings)])
+        db.session.commit()
+
+    count = run_backfill(_rows_without_embedding(batch_size, checkpoint.last_id), provider.encode_batch, write,
+                         batch_size=batch_size, encode_batch_size=encode_batch_size, workers=workers,
+                         checkpoint=checkpoint, label="sqlite backfill",
+                         model_name=provider.model_name)
+    checkpoint.clear()
+    return count
+
+def convert_legacy_embeddings(batch_size=500):
+    """
+    Rewrite embeddings still stored as JSON text into the float32 binary
+    format, in place and in id order, committing one batch at a time.
+    """
+    converted = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            text("SELECT id, embedding FROM generation "
+                 "WHERE typeof(embedding) = 'text' AND id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": batch_size}
+        ).all()
+        if not rows:
+            break
+        db.session.execute(
+            text("UPDATE generation SET embedding = :embedding WHERE id = :id"),
+            [{"id": row.id, "embedding": encode_embedding(decode_embedding(row.embedding))}
+             for row in rows]
+        )
+        db.session.commit()
+        converted += len(rows)
+        last_id = rows[-1].id
+    return converted
+
+def write_embedding_snapshot(directory, batch_size=1000):
+    """
+    Snapshot every stored embedding (with its score) into directory as one
+    memory-mappable matrix; embedded rows it does not hold (newer, or
+    backfilled since) are loaded by each process on top of it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    writer = SnapshotWriter(directory)
+    last_id = 0
+    while True:
+        rows = db.session.query(Generation.id, Generation.embedding, Generation.score) \
+            .filter(Generation.embedding.isnot(None), Generation.id > last_id) \
+            .order_by(Generation.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        rows = [row for row in rows if writer.dim is None or len(row.embedding) == writer.dim]
+        writer.add_many(None, [row.id for row in rows], [row.embedding for row in rows],
+                        [row.score or 0.0 for row in rows])
+    return writer.commit(max_id=last_id)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert and backfill generation embeddings")
+    parser.add_argument("--batch-size", type=int, default=256, help="rows per transaction")
+    parser.add_argument("--encode-batch-size", type=int, default=64, help="texts per model.encode call")
+    parser.add_argument("--workers", type=int, default=0, help="encoder processes (0 = in-process)")
+    parser.add_argument("--checkpoint", default="sqlite_backfill_checkpoint.json", help="resume file for the backfill")
+    parser.add_argument("--snapshot", metavar="DIR", help="write an embedding snapshot to DIR afterwards")
+    args = parser.parse_args()
+
     with app.app_context():
-        # Find generations without embeddings
-        gens_without_emb = Generation.query.filter(Generation.embedding.is_(None)).all()
-        
-        for gen in gens_without_emb:
-            # Generate embedding
-            emb = model.encode(gen.text).tolist()
-            gen.embedding = emb
-            # Score is already default 0.0
-        
-        db.session.commit()
-        print(f"Migrated embeddings for {len(gens_without_emb)} records")
\ No newline at end of file
+        converted = convert_legacy_embeddings()
+        print(f"Converted {converted} JSON embeddings to float32 binary")
+        migrated = backfill_missing_embeddings(args.batch_size, args.encode_batch_size, args.workers, args.checkpoint)
+        print(f"Migrated embeddings for {migrated} records")
+        if args.snapshot:
+            version = write_embedding_snapshot(args.snapshot)
+            print(f"Wrote embedding snapshot {version} to {args.snapshot}")
@@ -1,10 +1,39 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.types import TypeDecorator, LargeBinary
+from embedding_codec import encode_embedding, decode_embedding
 
 db = SQLAlchemy()
 
+class Embedding(TypeDecorator):
+    """
+    Stores vectors as a float32 BLOB with dtype/dimension header.
+    Rows still holding legacy JSON lists are decoded transparently.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        return encode_embedding(value)
+
+    def process_result_value(self, value, dialect):
+        return decode_embedding(value)
+
+# SQLite keeps DATETIME as text: store bound values in the same
+# "YYYY-MM-DD HH:MM:SS" form CURRENT_TIMESTAMP (the column default) writes,
+# so comparisons against datetime parameters match the stored rows
+Timestamp = db.DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite")
+
 class Generation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.Text, nullable=False)
-    embedding = db.Column(db.JSON)  # List of floats
+    embedding = db.Column(Embedding)  # float32 vector (binary)
     score = db.Column(db.Float, default=0.0)
-    created_at = db.Column(db.DateTime, default=db.func.now())
\ No newline at end of file
+    created_at = db.Column(Timestamp, default=db.func.now())
+
+    # Keyset pagination for /history walks (created_at, id)
+    __table_args__ = (db.Index('ix_generation_created_at_id', 'created_at', 'id'),)
@@ -0,0 +1,120 @@
+import os
+import sys
+from concurrent.futures import Future
+
+from sqlalchemy import event
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from micro_batch import MicroBatcher
+
+# Set on every new connection in the "concurrent" profile. WAL lets readers
+# run alongside the single writer; with synchronous=NORMAL a commit no
+# longer waits for an fsync (the WAL is synced at checkpoints): committed
+# data survives an application crash, only the last commits can be lost on
+# power failure.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,     # ms to wait for the write lock instead of failing
+    "cache_size": -65536,     # KiB, i.e. a 64 MiB page cache per connection
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,
+}
+PROFILES = ("default", "concurrent")
+
+
+def is_sqlite_file(uri: str) -> bool:
+    return uri.startswith("sqlite") and ":memory:" not in uri and uri.rstrip("/") not in ("sqlite:", "sqlite:/")
+
+
+def engine_options(uri: str, profile: str = "default", pool_size: int = 8, max_overflow: int = 8,
+                   pool_timeout: float = 30.0) -> dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for a storage profile. "concurrent" sizes the
+    connection pool for a file database; "default" (and in-memory
+    databases) keep SQLAlchemy's defaults.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown SQLite profile '{profile}'. Use one of: {', '.join(PROFILES)}")
+    if profile == "default" or not is_sqlite_file(uri):
+        return {}
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "connect_args": {"timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000.0, "check_same_thread": False},
+    }
+
+
+def apply_sqlite_pragmas(engine, pragmas: dict = SQLITE_PRAGMAS):
+    """
+    Run the pragmas on every connection the engine opens from now on.
+    """
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+class GroupCommitWriter(MicroBatcher):
+    """
+    Group commit for many concurrent writers. Callers submit
+    fn(connection, *args) and block on its result. A writer thread
+    gathers operations for up to window_ms (or max_batch operations), runs
+    them in one transaction and commits once. N concurrent requests then
+    share one lock acquisition and one journal sync, and each still gets
+    its own return value (e.g. the id it inserted).
+
+    The writer checks out one connection when it is created and keeps it:
+    request threads may hold every other pooled connection while they
+    block on their writes, so a writer borrowing from the pool per batch
+    could wait on them until pool_timeout.
+
+    If the shared transaction fails, it is rolled back and every operation
+    is replayed in its own transaction, so an error reaches only the
+    caller whose operation raised. Batching is the embedding scheduler's
+    (see micro_batch): the window is only held open while writes are
+    arriving concurrently.
+    """
+    name = "group-commit"
+
+    def __init__(self, engine, window_ms: float = 2.0, max_batch: int = 256):
+        super().__init__(window_ms, max_batch)
+        self.engine = engine
+        self._connection = engine.connect()
+
+    def submit(self, fn, *args) -> Future:
+        return self._submit((fn, args))
+
+    def execute(self, fn, *args, timeout: float = None):
+        return self.submit(fn, *args).result(timeout)
+
+    def close(self):
+        super().close()
+        if self._worker is not None:
+            self._worker.join()
+        self._connection.close()
+
+    def _process_batch(self, batch):
+        try:
+            with self._connection.begin():
+                results = [fn(self._connection, *args) for (fn, args), _ in batch]
+        except Exception:
+            for (fn, args), future in batch:
+                self._commit_one(fn, args, future)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _commit_one(self, fn, args, future):
+        try:
+            with self._connection.begin():
+                result = fn(self._connection, *args)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
@@ -1,14 +1,24 @@
+import os
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+import numpy as np
 import pytest
-from app import app, db, get_related_context
+import app as app_module
+from app import app, db, build_context_index
 from models import Generation
+from sqlalchemy import func
+from vector_index import VectorIndex, top_k_indices
+from ivf_index import IVFIndex
+from quantization import BinaryQuantizer, Int8Quantizer
 
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        build_context_index()
     with app.test_client() as client:
-        with app.app_context():
-            db.create_all()
         yield client
 
 def test_generate_endpoint(client):
@@ -59,4 +69,324 @@ def test_scoring_logic(client):
     data = response.get_json()
     # The first should have higher ranking due to score
     # But since all similar, check that related_context has scores
-    assert all(isinstance(item["score"], float) for item in data["related_context"])
\ No newline at end of file
+    assert all(isinstance(item["score"], float) for item in data["related_context"])
+
+def test_index_tracks_inserts_and_feedback(client):
+    client.post('/generate', json={"prompt": "index one"})
+    client.post('/generate', json={"prompt": "index two"})
+    index = app_module.context_index
+    assert len(index) == 2
+    client.post('/feedback', json={"generation_id": 2, "command": "+3"})
+    assert index.scores[index.ids.index(2)] == 3.0
+
+def test_vector_index_matches_brute_force():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    index = VectorIndex()
+    index.add_many(list(range(200)), vectors)
+    query = rng.normal(size=16)
+    expected = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    assert [i for i, _ in index.search(query, 5)] == list(np.argsort(-expected)[:5])
+    assert list(top_k_indices(expected, 5)) == list(np.argsort(-expected)[:5])
+
+def test_ivf_index_recall_and_incremental_inserts():
+    rng = np.random.default_rng(11)
+    centers = rng.normal(size=(20, 16))
+    vectors = (centers[rng.integers(0, 20, 2000)] + rng.normal(scale=0.3, size=(2000, 16))).astype(np.float32)
+    scores = rng.integers(-2, 5, 2000).astype(np.float32)
+    exact = VectorIndex()
+    exact.add_many(list(range(2000)), vectors, scores)
+    ann = VectorIndex(ann=IVFIndex(n_lists=20, nprobe=3, min_rows=1000))
+    ann.add_many(list(range(1500)), vectors[:1500], scores[:1500])
+    ann.rebuild_ann(background=False)
+    assert ann.ann.trained and ann.ann.trained_rows == 1500
+    ann.add_many(list(range(1500, 2000)), vectors[1500:], scores[1500:])
+    assert sum(len(rows) for rows in ann.ann._lists) == 2000
+
+    queries = vectors[rng.choice(2000, 50, replace=False)] + rng.normal(scale=0.1, size=(50, 16)).astype(np.float32)
+    hits = 0
+    for query in queries:
+        expected = {id for id, *_ in exact.rank(query, 10, 0.7, 0.3, normalization="minmax")}
+        hits += len(expected & {id for id, *_ in ann.rank(query, 10, 0.7, 0.3, normalization="minmax")})
+    assert hits / 500 >= 0.9
+
+    ann.ann.nprobe = 20
+    for query in queries[:5]:
+        assert ann.rank(query, 10, 0.7, 0.3) == exact.rank(query, 10, 0.7, 0.3)
+
+def test_quantized_scan_reranks_to_exact_results():
+    rng = np.random.default_rng(5)
+    vectors = rng.normal(size=(3000, 64)).astype(np.float32)
+    scores = rng.integers(-2, 5, 3000).astype(np.float32)
+    exact = VectorIndex()
+    exact.add_many(list(range(3000)), vectors, scores)
+    queries = vectors[rng.choice(3000, 30, replace=False)] + rng.normal(scale=0.5, size=(30, 64)).astype(np.float32)
+    expected = exact.rank_many(queries, 10, 0.7, 0.3, normalization="minmax", exclude={0, 1})
+
+    for quantizer, min_recall in ((Int8Quantizer(), 0.95), (BinaryQuantizer(), 0.8)):
+        index = VectorIndex(quantizer=quantizer)
+        index.add_many(list(range(2000)), vectors[:2000], scores[:2000])
+        index.add_many(list(range(2000, 3000)), vectors[2000:], scores[2000:])
+        assert quantizer.nbytes * 3 < index._matrix.nbytes
+        found = index.rank_many(queries, 10, 0.7, 0.3, normalization="minmax", exclude={0, 1})
+        hits = sum(len({id for id, *_ in a} & {id for id, *_ in b}) for a, b in zip(expected, found))
+        assert hits / 300 >= min_recall
+        # Candidates are re-scored at full precision, so reported scores are exact
+        for query, ranked in zip(queries, found):
+            for id, _, sim, _ in ranked:
+                assert id not in (0, 1)
+                cosine = vectors[id] @ query / (np.linalg.norm(vectors[id]) * np.linalg.norm(query))
+                assert sim == pytest.approx(cosine, abs=1e-5)
+
+def test_embeddings_stored_as_float32_blob(client):
+    client.post('/generate', json={"prompt": "binary"})
+    with app.app_context():
+        raw = db.session.execute(db.text("SELECT embedding FROM generation")).scalar()
+        assert isinstance(raw, bytes)
+        gen = db.session.get(Generation, 1)
+        assert gen.embedding.dtype == np.float32
+        assert len(raw) == 8 + 4 * len(gen.embedding)
+
+def test_convert_legacy_embeddings(client):
+    from migrate_embeddings import convert_legacy_embeddings
+    with app.app_context():
+        db.session.execute(db.text("INSERT INTO generation (text, embedding, score) VALUES ('old', '[1.0, 0.0, 2.0]', 0.0)"))
+        db.session.commit()
+        assert convert_legacy_embeddings() == 1
+        assert convert_legacy_embeddings() == 0
+        assert db.session.get(Generation, 1).embedding.tolist() == [1.0, 0.0, 2.0]
+
+def test_backfill_missing_embeddings_in_batches(client, tmp_path):
+    from migrate_embeddings import backfill_missing_embeddings
+    with app.app_context():
+        db.session.add_all([Generation(text=f"row {i}") for i in range(5)])
+        db.session.commit()
+        assert backfill_missing_embeddings(batch_size=2, checkpoint_path=str(tmp_path / "ckpt.json")) == 5
+        assert Generation.query.filter(Generation.embedding.is_(None)).count() == 0
+        assert not (tmp_path / "ckpt.json").exists()
+
+def test_snapshot_backed_index_matches_in_memory_index(client, tmp_path, monkeypatch):
+    from embedding_snapshot import SnapshotVectorIndex
+    from migrate_embeddings import write_embedding_snapshot
+    for i in range(6):
+        client.post('/generate', json={"prompt": f"snapshot prompt {i}"})
+    client.post('/feedback', json={"generation_id": 2, "command": "+3"})
+    with app.app_context():
+        write_embedding_snapshot(str(tmp_path), batch_size=4)
+    # After the snapshot: one more row and one score change
+    client.post('/generate', json={"prompt": "after snapshot"})
+    client.post('/feedback', json={"generation_id": 2, "command": "-1"})
+
+    with app.app_context():
+        in_memory = app_module.context_index
+        monkeypatch.setattr(app_module, "context_index", in_memory)  # restored after the test
+        monkeypatch.setitem(app.config, 'EMBEDDING_SNAPSHOT_DIR', str(tmp_path))
+        build_context_index()
+        snapshot_index = app_module.context_index
+        assert isinstance(snapshot_index, SnapshotVectorIndex)
+        assert isinstance(snapshot_index.base.matrix, np.memmap)
+        assert len(snapshot_index.base) == 6 and len(snapshot_index.delta) == 1
+        query = snapshot_index.delta.matrix[0]
+        # Rank every row and compare per id, so ties cannot reorder the result
+        expected = in_memory.rank(query, 7, 0.7, 0.3, normalization="minmax")
+        ranked = snapshot_index.rank(query, 7, 0.7, 0.3, normalization="minmax")
+        assert {r[0]: r[1] for r in ranked} == pytest.approx({r[0]: r[1] for r in expected}, abs=1e-6)
+
+        # Re-adding a snapshotted row shadows its base copy
+        snapshot_index.add(1, query, 0.0)
+        assert len(snapshot_index) == 7 and snapshot_index.rank(query, 1)[0][0] in (1, 7)
+
+        # Combined score statistics track shadowing and score changes
+        snapshot_index.increment_score(2, 1.5)
+        snapshot_index.set_score(7, -4.0)
+        visible = [score for id, score in zip(snapshot_index.base.ids, snapshot_index.base.scores)
+                   if id not in snapshot_index._shadowed] + snapshot_index.delta.scores.tolist()
+        stats = snapshot_index.score_stats
+        assert stats.count == len(visible) == 7
+        assert (stats.min, stats.max) == (min(visible), max(visible))
+        assert stats.mean == pytest.approx(np.mean(visible))
+
+def test_snapshot_rebuild_loads_backfilled_rows_and_replays_writes(client, tmp_path, monkeypatch):
+    from migrate_embeddings import write_embedding_snapshot
+    for i in range(3):
+        client.post('/generate', json={"prompt": f"rebuild prompt {i}"})
+    with app.app_context():
+        db.session.add(Generation(text="not embedded yet"))
+        db.session.commit()
+        write_embedding_snapshot(str(tmp_path))
+        # A backfill embeds the old row after the snapshot was taken
+        gen = db.session.get(Generation, 4)
+        gen.embedding = np.ones(len(app_module.context_index.matrix[0]), dtype=np.float32)
+        db.session.commit()
+
+        load = app_module.load_context_index
+        old = app_module.context_index
+
+        def load_during_traffic(index):
+            load(index)
+            # A request writing while the new index is filled still sees the full old one
+            app_module.write_index("increment_score", 1, 9.0)
+            assert app_module.context_index is old and len(old) == 3
+
+        monkeypatch.setattr(app_module, "context_index", old)  # restored after the test
+        monkeypatch.setattr(app_module, "load_context_index", load_during_traffic)
+        monkeypatch.setitem(app.config, 'EMBEDDING_SNAPSHOT_DIR', str(tmp_path))
+        build_context_index()
+        index = app_module.context_index
+        assert index is not old and len(index) == 4 and 4 in index
+        assert index.delta.scores[index.delta.ids.index(4)] == 0.0
+        assert index.base.scores[index.base.ids.index(1)] == 9.0
+
+def test_snapshot_reload_builds_in_background(client, tmp_path, monkeypatch):
+    import threading
+    from migrate_embeddings import write_embedding_snapshot
+    for i in range(3):
+        client.post('/generate', json={"prompt": f"reload prompt {i}"})
+    monkeypatch.setattr(app_module, "context_index", app_module.context_index)  # restored after the test
+    monkeypatch.setitem(app.config, 'EMBEDDING_SNAPSHOT_DIR', str(tmp_path))
+    with app.app_context():
+        write_embedding_snapshot(str(tmp_path))
+        build_context_index()
+    old = app_module.context_index
+    client.post('/generate', json={"prompt": "after first snapshot"})
+    with app.app_context():
+        write_embedding_snapshot(str(tmp_path))
+    load = app_module.load_context_index
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_load(index):
+        loading.set()
+        release.wait(5)
+        load(index)
+
+    monkeypatch.setattr(app_module, "load_context_index", slow_load)
+    monkeypatch.setitem(app.config, 'EMBEDDING_SNAPSHOT_CHECK', 0.0)
+    monkeypatch.setitem(app_module.snapshot_checked, "at", 0.0)
+    # The request that notices the new snapshot is not held up by the rebuild
+    response = client.post('/generate', json={"prompt": "during reload"})
+    assert response.status_code == 200
+    assert loading.wait(5) and app_module.context_index is old
+    release.set()
+    app_module.snapshot_reload["thread"].join(5)
+    index = app_module.context_index
+    assert index is not old and index.version != old.version
+    assert len(index.base) == 4 and 5 in index
+
+def test_ready_after_model_loaded(client):
+    client.post('/generate', json={"prompt": "warm"})
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.get_json()["ready"] is True
+
+def test_score_stats_follow_changes_to_extremes():
+    index = VectorIndex()
+    index.add_many([1, 2, 3], np.eye(3), [-2.0, 0.5, 4.0])
+    stats = index.score_stats
+    assert (stats.min, stats.max) == (-2.0, 4.0)
+
+    index.set_score(3, 1.0)   # the max row drops
+    index.set_score(1, 0.5)   # the min row rises
+    assert (stats.min, stats.max) == (0.5, 1.0)
+    assert stats.mean == pytest.approx(np.mean(index.scores))
+    assert stats.variance == pytest.approx(np.var(index.scores))
+    assert stats.normalize(index.scores).tolist() == [0.0, 0.0, 1.0]
+
+    index.add(2, np.ones(3), 0.5)  # re-adding an id replaces its score
+    assert stats.count == 3
+
+def test_history_keyset_pagination(client):
+    from datetime import datetime
+    with app.app_context():
+        same = datetime(2024, 1, 1, 12, 0, 0)
+        db.session.add_all([Generation(text=f"row {i}", created_at=same if i < 3 else datetime(2024, 1, 2, i))
+                            for i in range(5)])
+        db.session.commit()
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/history', query_string={"limit": 2, **({"after": cursor} if cursor else {})})
+        page = response.get_json()
+        seen += [item["id"] for item in page["items"]]
+        assert all("embedding" not in item for item in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [5, 4, 3, 2, 1]
+    assert client.get('/history', query_string={"after": "bogus"}).status_code == 400
+
+def test_history_ndjson_stream(client):
+    import json
+    client.post('/generate', json={"prompt": "stream1"})
+    client.post('/generate', json={"prompt": "stream2"})
+    response = client.get('/history?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["id"] for row in lines] == [2, 1]
+
+def test_metrics_endpoint_reports_stages(client):
+    from metrics import REGISTRY, STAGE_SECONDS
+
+    REGISTRY.clear()
+    client.post('/generate', json={'prompt': 'Metrics'})
+    client.post('/generate', json={'prompt': 'Metrics again'})
+    assert STAGE_SECONDS.count(stage='encode') == 2 and STAGE_SECONDS.count(stage='rank') == 2
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'context_stage_seconds_count{stage="insert"} 2' in body
+    assert 'context_request_seconds_count{endpoint="/generate"} 2' in body
+
+def test_group_commit_requests_do_not_starve_the_pool(tmp_path, monkeypatch):
+    import importlib.util
+    from concurrent.futures import ThreadPoolExecutor
+    settings = {"DATABASE_URL": f"sqlite:///{tmp_path / 'app.db'}", "SQLITE_PROFILE": "concurrent",
+                "GROUP_COMMIT_WINDOW_MS": "5", "DB_POOL_SIZE": "2", "DB_MAX_OVERFLOW": "0", "DB_POOL_TIMEOUT": "2"}
+    for name, value in settings.items():
+        monkeypatch.setenv(name, value)
+    # A second copy of the app on a file database whose pool is smaller than the request concurrency
+    spec = importlib.util.spec_from_file_location("app_group_commit", os.path.join(os.path.dirname(__file__), "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert module.group_writer is not None
+
+    def call(i):
+        with module.app.test_client() as c:
+            if i % 4 == 0:
+                return c.post('/generate', json={"prompt": f"pooled {i}"}).status_code
+            return c.post('/feedback', json={"generation_id": i % 3 + 1, "command": "+1"}).status_code
+
+    for i in range(3):
+        assert call(4 * i) == 200
+    with ThreadPoolExecutor(16) as pool:
+        statuses = list(pool.map(call, range(1, 65)))
+    assert statuses == [200] * 64
+    with module.app.app_context():
+        assert db.session.query(func.sum(Generation.score)).scalar() == 48
+        assert Generation.query.count() == 3 + 16
+    # The index applies the same increments, whatever order the batches committed in
+    assert float(module.context_index.scores.sum()) == 48
+    module.group_writer.close()
+
+def test_group_commit_returns_ids_and_batches_concurrent_writes(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import create_engine, text
+    from app import add_to_score, insert_generation_row
+    from storage import GroupCommitWriter, apply_sqlite_pragmas, engine_options
+
+    uri = f"sqlite:///{tmp_path / 'writes.db'}"
+    engine = apply_sqlite_pragmas(create_engine(uri, **engine_options(uri, 'concurrent')))
+    Generation.__table__.create(engine)
+    writer = GroupCommitWriter(engine, window_ms=5)
+    with ThreadPoolExecutor(16) as pool:
+        ids = list(pool.map(lambda i: writer.execute(insert_generation_row, f"row {i}", [float(i), 1.0]), range(64)))
+        list(pool.map(lambda _: writer.execute(add_to_score, ids[0], 0.5), range(20)))
+    assert writer.batches < writer.items
+    with pytest.raises(Exception):
+        writer.execute(insert_generation_row, None, None)  # NOT NULL text fails only its caller
+    assert writer.execute(add_to_score, ids[1], 1.0) == 1.0
+    writer.close()
+
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        rows = dict(connection.execute(text("SELECT id, text FROM generation")).all())
+        assert connection.execute(text("SELECT score FROM generation WHERE id = :id"), {"id": ids[0]}).scalar() == 10.0
+    assert sorted(ids) == sorted(rows) and all(rows[gen_id] == f"row {i}" for i, gen_id in enumerate(ids))
+    engine.dispose()